@@ -0,0 +1,580 @@
+# Headless, vectorized Python engine for the playground network format of main/node_network.js.
+# Loads the same JSON files (nodes/edges as objects or as old-style [key, value] arrays) into
+# per-node parameter arrays and CSR edge arrays, and executes the same discrete step rule as
+# NodeNetwork.next(), so networks can be run for millions of steps without the browser.
+#
+# usage:
+#     network = NodeNetwork.from_file("examples/basic_ring.json")
+#     network.spike("ring_1_1")
+#     raster = network.run(1_000_000, record=True)
+#
+#     # many trials at once, e.g. does a repeatedly firing node recenter the bump?
+#     results = run_trials("examples/basic_ring.json", [
+#         [("ring_1_1", 0)] + repeated_spikes("ring_1_7", 100, 1000, every=every) for every in (1, 2, 5, 10)
+#     ], n_steps=1000, random_firing=0.001, seed=0, out_path="recenter.npz")
+#
+# run `python misc/node_network.py` to check the engine against hand-computed steps of
+# examples/basic_ring.json and against a line-by-line transcription of NodeNetwork.next()
+import json
+import numpy as np
+
+DEFAULT_NODE_DATA = {
+    "pulse": False,
+    "spikeThreshold": 1,
+    "energy": 0.1,
+    "energyDecayRate": 0.1,
+    "isFiringNext": False,
+    "stableEnergyLevel": 0.1,
+    "energyAfterFiring": 0,
+    "radius": 25,
+}
+
+
+def load_network_data(path):
+    """Reads a playground network JSON file (as saved by the "Save" button / the generators)."""
+    with open(path) as f:
+        return json.load(f)
+
+
+def normalize_network_data(data):
+    """Validates network data as NodeNetwork.load() does and converts the old format, where
+    nodes and edges are [key, value] arrays, to lists of plain objects.
+    Returns
+    -------
+    nodes : list of dict
+    edges : list of dict
+    warnings : list of str
+        Duplicate node and edge ids, same messages as NodeNetwork.load()
+    """
+    nodes, edges = data.get("nodes"), data.get("edges")
+    if not isinstance(nodes, list) or not isinstance(edges, list):
+        raise ValueError("Invalid data format. Expected an object with 'nodes' and 'edges' properties that are both arrays.")
+    if len(nodes) == 0:
+        raise ValueError("Invalid data format. Expected at least one node.")
+
+    # old format (only converted if it is used consistently, like in the js)
+    if any(isinstance(each, list) for each in nodes) or any(isinstance(each, list) for each in edges):
+        if all(isinstance(each, list) for each in nodes) and all(isinstance(each, list) for each in edges):
+            nodes = [each[1] for each in nodes]
+            edges = [each[1] for each in edges]
+
+    warnings = []
+    node_ids = set()
+    for index, node in enumerate(nodes):
+        if node.get("id") in node_ids:
+            warnings.append(f"Duplicate node ID '{node.get('id')}' found at index {index}")
+        else:
+            node_ids.add(node.get("id"))
+    edge_ids = set()
+    for index, edge in enumerate(edges):
+        edge_id = f"{_js_str(edge.get('from'))}-{_js_str(edge.get('to'))}"
+        if edge_id in edge_ids:
+            warnings.append(f"Duplicate edge ID '{edge_id}' found at index {index}")
+        else:
+            edge_ids.add(edge_id)
+
+    return nodes, edges, warnings
+
+
+def _js_str(value):
+    # template-literal formatting of the ids used in the duplicate edge warnings
+    return "undefined" if value is None else str(value)
+
+
+class NodeNetwork:
+    """Array version of the NodeNetwork of main/node_network.js.
+
+    Per-node parameters (spikeThreshold, energyDecayRate, stableEnergyLevel, energyAfterFiring)
+    and state (energy, isFiringNext) are float/bool arrays indexed like the `nodes` list of the
+    file. Edges are stored in CSR form grouped by source node: the outgoing edges of node i are
+    edge_target[edge_ptr[i]:edge_ptr[i+1]] with strengths edge_strength[...], in file order.
+
+    The step rule reproduces next() exactly, including its corner cases:
+        - nodes with a duplicate id all fire along the edges of that id, but only the first node
+          with an id receives energy (the js looks targets up with nodes.find())
+        - edges to unknown nodes are ignored
+        - the energy arriving at a node is summed in the order the js visits the edges, so runs
+          without noise are bit-identical to the js
+        - edges with `strengthNoiseParameters` get normal noise on every transmission (numpy's
+          generator instead of good-js' randomNormal, so noisy runs only match in distribution)
+
+    Parameters
+    ----------
+    data : dict, default=None
+        Network to load (see load()).
+    default_node_data : dict, default=DEFAULT_NODE_DATA
+        Defaults for keys missing from the nodes of loaded files.
+    seed : int or np.random.Generator, default=None
+        Seed of the edge noise.
+    """
+
+    def __init__(self, data=None, default_node_data=None, seed=None):
+        self.default_node_data = dict(DEFAULT_NODE_DATA if default_node_data is None else default_node_data)
+        self.rng = np.random.default_rng(seed)
+        self.warnings = []
+        if data is None:
+            self._build([], [])
+        else:
+            self.warnings = self.load(data)
+
+    @classmethod
+    def from_file(cls, path, **kwargs):
+        return cls(load_network_data(path), **kwargs)
+
+    def load(self, data):
+        """Loads a network (dict with "nodes" and "edges", see NodeNetwork.load()) and returns the
+        list of warnings about duplicate ids."""
+        nodes, edges, warnings = normalize_network_data(data)
+        self._build([{**self.default_node_data, **node_data} for node_data in nodes], list(edges))
+        return warnings
+
+    def _build(self, nodes, edges):
+        self.nodes = nodes
+        self.edges = edges
+        n_nodes = len(self.nodes)
+
+        # per node parameters and state
+        def column(key, dtype=np.float64):
+            return np.array([node[key] for node in self.nodes], dtype=dtype)
+        self.spike_threshold = column("spikeThreshold")
+        self.energy_decay_rate = column("energyDecayRate")
+        self.stable_energy_level = column("stableEnergyLevel")
+        self.energy_after_firing = column("energyAfterFiring")
+        self.energy = column("energy")
+        self.is_firing_next = column("isFiringNext", dtype=bool)
+
+        # ids -> first node with that id (nodes.find())
+        self.node_ids = [node.get("id") for node in self.nodes]
+        self.node_index = {}
+        for index, node_id in enumerate(self.node_ids):
+            self.node_index.setdefault(node_id, index)
+
+        # edges of each source id that lead to an existing node, in file order
+        edges_from = {}
+        for edge_index, edge in enumerate(self.edges):
+            if edge.get("to") in self.node_index:
+                edges_from.setdefault(edge.get("from"), []).append(edge_index)
+
+        # CSR rows per node (duplicate ids share the edges of their id)
+        rows = [edges_from.get(node_id, []) for node_id in self.node_ids]
+        self.edge_ptr = np.zeros(n_nodes + 1, dtype=np.int64)
+        np.cumsum([len(row) for row in rows], out=self.edge_ptr[1:])
+        edge_order = np.fromiter((edge_index for row in rows for edge_index in row), dtype=np.int64, count=self.edge_ptr[-1])
+        self.edge_source = np.repeat(np.arange(n_nodes), np.diff(self.edge_ptr))
+        self.edge_target = np.array([self.node_index[self.edges[i]["to"]] for i in edge_order], dtype=np.int64)
+        self.edge_strength = np.array([self.edges[i]["strength"] for i in edge_order], dtype=np.float64)
+        noise_parameters = [self.edges[i].get("strengthNoiseParameters") for i in edge_order]
+        self.edge_noisy = np.array([bool(p) for p in noise_parameters], dtype=bool)
+        self.edge_noise_mean = np.array([p.get("mean", 0) if p else 0 for p in noise_parameters], dtype=np.float64)
+        self.edge_noise_std = np.array([p.get("std", 1) if p else 0 for p in noise_parameters], dtype=np.float64)
+        self.has_noise = bool(self.edge_noisy.any())
+
+        # buffers of step()
+        self._not_firing = np.zeros(n_nodes, dtype=bool)
+        self._clamp = np.zeros(n_nodes, dtype=bool)
+
+    @property
+    def n_nodes(self):
+        return len(self.energy)
+
+    @property
+    def n_edges(self):
+        return len(self.edge_target)
+
+    def index_of(self, node_id):
+        """Index of the (first) node with node_id."""
+        return self.node_index[node_id]
+
+    def spike(self, node_id):
+        """Same as manuallySpike(): the node fires on the next step."""
+        index = self.node_index.get(node_id)
+        if index is not None:
+            self.energy[index] = self.spike_threshold[index]
+            self.is_firing_next[index] = True
+
+    def get_state(self):
+        return self.energy.copy(), self.is_firing_next.copy()
+
+    def set_state(self, energy, is_firing_next):
+        self.energy[:] = energy
+        self.is_firing_next[:] = is_firing_next
+
+    def _outgoing_edges(self, firing):
+        """Indices of the outgoing edges of the firing nodes, in the order next() visits them."""
+        start, stop = self.edge_ptr[firing], self.edge_ptr[firing + 1]
+        counts = stop - start
+        total = counts.sum()
+        if total == 0:
+            return np.zeros(0, dtype=np.int64)
+        # concatenated ranges start[i]:stop[i]
+        offsets = np.repeat(start - np.cumsum(counts) + counts, counts)
+        return np.arange(total) + offsets
+
+    def step(self):
+        """One step of NodeNetwork.next(). Returns the indices of the nodes that fired."""
+        firing = np.flatnonzero(self.is_firing_next)
+
+        # collect energy from fired nodes
+        edges = self._outgoing_edges(firing)
+        strength = self.edge_strength[edges]
+        if self.has_noise and len(edges):
+            noisy = self.edge_noisy[edges]
+            noisy_edges = edges[noisy]
+            strength[noisy] += self.rng.normal(self.edge_noise_mean[noisy_edges], self.edge_noise_std[noisy_edges])
+        # bincount sums the weights of each target in order, starting at 0, like amountToAddForEach
+        amount = np.bincount(self.edge_target[edges], weights=strength, minlength=self.n_nodes)
+
+        # reset nodes that just fired
+        self.energy[firing] = self.energy_after_firing[firing]
+        self.is_firing_next[firing] = False
+
+        # add the collected energy, discover new firing nodes
+        self.energy += amount
+        np.greater_equal(self.energy, self.spike_threshold, out=self.is_firing_next)
+
+        # decay
+        not_firing, clamp = self._not_firing, self._clamp
+        np.logical_not(self.is_firing_next, out=not_firing)
+        np.subtract(self.energy, self.energy_decay_rate, out=self.energy, where=not_firing)
+        np.less(self.energy, self.stable_energy_level, out=clamp)
+        clamp &= not_firing
+        np.copyto(self.energy, self.stable_energy_level, where=clamp)
+        return firing
+
+    def run(self, n_steps, record=False, spikes=None):
+        """Runs n_steps steps.
+        Parameters
+        ----------
+        n_steps : int
+        record : bool, default=False
+            Whether to return the spike raster.
+        spikes : dict {step: node id or list of node ids}, default=None
+            Nodes to spike manually (as with a click) before the given steps.
+        Returns
+        -------
+        raster : None, or np.array of shape (n_steps, n_nodes) bit-packed along the nodes
+            raster[t] are the nodes firing in step t (np.unpackbits(raster, axis=1, count=n_nodes)).
+        """
+        raster = np.zeros((n_steps, (self.n_nodes + 7) // 8), dtype=np.uint8) if record else None
+        spikes = spikes or {}
+        for t in range(n_steps):
+            if t in spikes:
+                node_ids = spikes[t]
+                for node_id in ([node_ids] if isinstance(node_ids, str) else node_ids):
+                    self.spike(node_id)
+            if record:
+                raster[t] = np.packbits(self.is_firing_next)
+            self.step()
+        return raster
+
+
+def repeated_spikes(node_id, start, stop, every=1):
+    """Schedule that spikes node_id every `every` steps in [start, stop), e.g. for a node that is
+    clicked over and over to (try to) recenter the bump."""
+    return [(node_id, step) for step in range(start, stop, every)]
+
+
+def node_angles_of(network):
+    """Angle (rad) of every node's (x, y) position around the center of all nodes, i.e. the
+    position of the node on the ring for networks laid out as a circle."""
+    x = np.array([node.get("x", 0) for node in network.nodes], dtype=np.float64)
+    y = np.array([node.get("y", 0) for node in network.nodes], dtype=np.float64)
+    return np.arctan2(y - y.mean(), x - x.mean())
+
+
+def summarize_bump(bump_position):
+    """Per-trial summaries of decoded bump positions of shape (trials, T) (nan = no activity).
+    Returns
+    -------
+    summaries : dict of np.array of shape (trials,)
+        alive_fraction : fraction of steps with any firing node
+        final_bump_position : last decoded position (nan if the trial never fired)
+        bump_drift : net movement of the bump (rad), summing the wrapped differences between
+            consecutive decoded positions (steps without activity are skipped)
+        bump_variance : circular variance of the decoded positions
+    """
+    bump_position = np.asarray(bump_position, dtype=np.float64)
+    n_trials = bump_position.shape[0]
+    active = ~np.isnan(bump_position)
+    summaries = dict(
+        alive_fraction=active.mean(axis=1),
+        final_bump_position=np.full(n_trials, np.nan),
+        bump_drift=np.zeros(n_trials),
+        bump_variance=np.full(n_trials, np.nan),
+    )
+    for trial in range(n_trials):
+        phi = bump_position[trial, active[trial]]
+        if len(phi) == 0:
+            continue
+        summaries["final_bump_position"][trial] = phi[-1]
+        summaries["bump_drift"][trial] = np.sum(((np.diff(phi) + np.pi) % (2*np.pi)) - np.pi)
+        summaries["bump_variance"][trial] = 1 - np.hypot(np.cos(phi).mean(), np.sin(phi).mean())
+    return summaries
+
+
+class NodeNetworkBatch:
+    """Many independent trials of one NodeNetwork, stepped together as (trials, nodes) arrays.
+
+    Every trial follows the step rule of NodeNetwork.step() (and is bit-identical to it when
+    there is no noise and no random firing). On top of that trials can have
+        - a stimulation schedule: a list of (node id, step) pairs, the node is spiked manually
+          (as with a click) right before that step
+        - a random firing probability: the chance per step that a node spikes for no reason
+          (scalar, one per trial, or of shape (trials, nodes))
+
+    Parameters
+    ----------
+    network : NodeNetwork
+        Network whose parameters, edges and initial state (energy, isFiringNext) are used.
+    n_trials : int
+    schedules : list of n_trials lists of (node id, step), default=None
+    random_firing : float or array-like, default=0
+    seed : int or np.random.Generator, default=None
+        Seed of the edge noise and the random firing.
+    """
+
+    def __init__(self, network, n_trials, schedules=None, random_firing=0, seed=None):
+        self.network = network
+        self.n_trials = n_trials
+        self.n_nodes = network.n_nodes
+        self.rng = np.random.default_rng(seed)
+        self.energy = np.repeat(network.energy[None], n_trials, axis=0)
+        self.is_firing_next = np.repeat(network.is_firing_next[None], n_trials, axis=0)
+        self.t = 0
+
+        random_firing = np.asarray(random_firing, dtype=np.float64)
+        if random_firing.ndim == 1:
+            random_firing = random_firing[:, None]  # one probability per trial
+        self.random_firing = np.broadcast_to(random_firing, (n_trials, self.n_nodes))
+        self.has_random_firing = bool(np.any(self.random_firing > 0))
+
+        # schedules as (step, trial, node) arrays sorted by step
+        self.schedules = [[] for _ in range(n_trials)] if schedules is None else [list(each) for each in schedules]
+        if len(self.schedules) != n_trials:
+            raise ValueError(f"Expected one schedule per trial ({n_trials}), got {len(self.schedules)}")
+        stimuli = sorted(
+            (step, trial, network.index_of(node_id))
+            for trial, schedule in enumerate(self.schedules)
+            for node_id, step in schedule
+            if node_id in network.node_index
+        )
+        self._stimulus_step, self._stimulus_trial, self._stimulus_node = np.array(stimuli, dtype=np.int64).reshape(-1, 3).T
+
+        self._not_firing = np.zeros((n_trials, self.n_nodes), dtype=bool)
+        self._clamp = np.zeros((n_trials, self.n_nodes), dtype=bool)
+
+    def spike(self, trial, node):
+        """manuallySpike() of the node indices `node` in the trials `trial`."""
+        self.energy[trial, node] = self.network.spike_threshold[node]
+        self.is_firing_next[trial, node] = True
+
+    def _stimulate(self):
+        start, stop = np.searchsorted(self._stimulus_step, [self.t, self.t + 1])
+        if stop > start:
+            self.spike(self._stimulus_trial[start:stop], self._stimulus_node[start:stop])
+        if self.has_random_firing:
+            trial, node = np.nonzero(self.rng.random((self.n_trials, self.n_nodes)) < self.random_firing)
+            self.spike(trial, node)
+
+    def _advance(self):
+        network = self.network
+        # firing (trial, node) pairs, row-major so each trial visits its nodes in the js order
+        trial, node = np.nonzero(self.is_firing_next)
+
+        # collect energy from fired nodes, targets offset into the flattened (trials, nodes) array
+        edges = network._outgoing_edges(node)
+        counts = network.edge_ptr[node + 1] - network.edge_ptr[node]
+        strength = network.edge_strength[edges]
+        if network.has_noise and len(edges):
+            noisy = network.edge_noisy[edges]
+            noisy_edges = edges[noisy]
+            strength[noisy] += self.rng.normal(network.edge_noise_mean[noisy_edges], network.edge_noise_std[noisy_edges])
+        target = network.edge_target[edges] + np.repeat(trial * self.n_nodes, counts)
+        amount = np.bincount(target, weights=strength, minlength=self.n_trials * self.n_nodes)
+
+        # reset nodes that just fired
+        self.energy[trial, node] = network.energy_after_firing[node]
+        self.is_firing_next[trial, node] = False
+
+        # add the collected energy, discover new firing nodes
+        self.energy += amount.reshape(self.n_trials, self.n_nodes)
+        np.greater_equal(self.energy, network.spike_threshold, out=self.is_firing_next)
+
+        # decay
+        not_firing, clamp = self._not_firing, self._clamp
+        np.logical_not(self.is_firing_next, out=not_firing)
+        np.subtract(self.energy, network.energy_decay_rate, out=self.energy, where=not_firing)
+        np.less(self.energy, network.stable_energy_level, out=clamp)
+        clamp &= not_firing
+        np.copyto(self.energy, np.broadcast_to(network.stable_energy_level, clamp.shape), where=clamp)
+        self.t += 1
+
+    def step(self):
+        """Stimulates the trials for the current step and runs one step of all of them."""
+        self._stimulate()
+        self._advance()
+
+    def run(self, n_steps, node_angles=None, record_raster=True):
+        """Runs n_steps steps of all trials, decoding the bump position in every step.
+        Parameters
+        ----------
+        n_steps : int
+        node_angles : np.array of shape (n_nodes,), default=None
+            Position of each node on the ring (rad), defaults to node_angles_of(network).
+        record_raster : bool, default=True
+        Returns
+        -------
+        results : dict
+            raster : np.array of shape (trials, n_steps, ceil(n_nodes/8)) of uint8
+                Nodes firing in each step (after its stimulation), bit-packed along the nodes:
+                np.unpackbits(raster, axis=-1, count=n_nodes)
+            n_active : np.array of shape (trials, n_steps)
+                Number of firing nodes.
+            bump_position : np.array of shape (trials, n_steps)
+                Angle of the population vector of the firing nodes, nan without activity.
+            and the per-trial summaries of summarize_bump()
+        """
+        node_angles = node_angles_of(self.network) if node_angles is None else np.asarray(node_angles, dtype=np.float64)
+        unit_vectors = np.stack([np.cos(node_angles), np.sin(node_angles)], axis=1)
+        raster = np.zeros((self.n_trials, n_steps, (self.n_nodes + 7) // 8), dtype=np.uint8) if record_raster else None
+        n_active = np.zeros((self.n_trials, n_steps), dtype=np.int32)
+        bump_position = np.full((self.n_trials, n_steps), np.nan)
+        for t in range(n_steps):
+            self._stimulate()
+            firing = self.is_firing_next
+            if record_raster:
+                raster[:, t] = np.packbits(firing, axis=1)
+            n_active[:, t] = np.count_nonzero(firing, axis=1)
+            X, Y = (firing @ unit_vectors).T
+            np.arctan2(Y, X, out=bump_position[:, t], where=n_active[:, t] > 0)
+            self._advance()
+        results = dict(n_active=n_active, bump_position=bump_position, **summarize_bump(bump_position))
+        if record_raster:
+            results["raster"] = raster
+        return results
+
+
+def run_trials(network, schedules, n_steps, out_path=None, random_firing=0, seed=None, node_angles=None, record_raster=True):
+    """Runs one trial per stimulation schedule on a network (NodeNetwork or path of a network
+    JSON file) in a NodeNetworkBatch, and saves the results with np.savez_compressed to out_path.
+    Parameters
+    ----------
+    network : NodeNetwork or str
+    schedules : list of lists of (node id, step)
+        e.g. [repeated_spikes("ring_1_1", 0, 1000, every=5), [("ring_1_1", 0), ("ring_1_7", 500)]]
+    n_steps : int
+    out_path : str, default=None
+        .npz file with the arrays of NodeNetworkBatch.run() and the node ids, schedules (as
+        JSON), random firing probabilities and seed of the run.
+    random_firing, seed, node_angles, record_raster :
+        See NodeNetworkBatch and NodeNetworkBatch.run().
+    Returns
+    -------
+    results : dict
+    """
+    if not isinstance(network, NodeNetwork):
+        network = NodeNetwork.from_file(network)
+    batch = NodeNetworkBatch(network, len(schedules), schedules=schedules, random_firing=random_firing, seed=seed)
+    results = batch.run(n_steps, node_angles=node_angles, record_raster=record_raster)
+    if out_path is not None:
+        np.savez_compressed(
+            out_path,
+            node_ids=np.array([str(node_id) for node_id in network.node_ids]),
+            schedules=json.dumps(batch.schedules),
+            random_firing=np.asarray(random_firing, dtype=np.float64),
+            seed=seed if isinstance(seed, (int, np.integer)) else -1,
+            **results,
+        )
+    return results
+
+
+def reference_next(nodes, edges, random_normal=None):
+    """Line-by-line transcription of NodeNetwork.next() on lists of node/edge dicts (in place),
+    used to check the engine."""
+    amount_to_add_for_each = {}
+    for each_node in nodes:
+        if each_node["isFiringNext"]:
+            for edge in edges:
+                if edge.get("from") == each_node["id"]:
+                    target_node = next((node for node in nodes if node["id"] == edge.get("to")), None)
+                    if target_node is not None:
+                        amount_to_add_for_each[target_node["id"]] = amount_to_add_for_each.get(target_node["id"]) or 0
+                        strength = edge["strength"]
+                        if edge.get("strengthNoiseParameters"):
+                            strength += random_normal(edge["strengthNoiseParameters"])
+                        amount_to_add_for_each[target_node["id"]] += strength
+    for each_node in nodes:
+        if each_node["isFiringNext"]:
+            each_node["energy"] = each_node["energyAfterFiring"]
+            each_node["isFiringNext"] = False
+    for key, value in amount_to_add_for_each.items():
+        node = next((node for node in nodes if node["id"] == key), None)
+        if node is not None:
+            node["energy"] += value
+    for each_node in nodes:
+        if each_node["energy"] >= each_node["spikeThreshold"]:
+            each_node["isFiringNext"] = True
+    for each_node in nodes:
+        if not each_node["isFiringNext"]:
+            each_node["energy"] -= each_node["energyDecayRate"]
+            if each_node["energy"] < each_node["stableEnergyLevel"]:
+                each_node["energy"] = each_node["stableEnergyLevel"]
+
+
+def check_conformance(path, n_steps=200, spike_id=None):
+    """Runs the engine and reference_next() side by side on a noise-free network file and raises
+    an AssertionError on the first step where energies or firing flags differ (bit-exact)."""
+    network = NodeNetwork.from_file(path)
+    if network.has_noise:
+        raise ValueError(f"{path} has noisy edges, only noise-free networks can be compared step by step")
+    nodes = [dict(node) for node in network.nodes]
+    spike_id = network.node_ids[0] if spike_id is None else spike_id
+    network.spike(spike_id)
+    for node in nodes:
+        if node["id"] == spike_id:
+            node["energy"], node["isFiringNext"] = node["spikeThreshold"], True
+            break
+    for t in range(n_steps):
+        network.step()
+        reference_next(nodes, network.edges)
+        energy = np.array([node["energy"] for node in nodes], dtype=np.float64)
+        is_firing_next = np.array([node["isFiringNext"] for node in nodes], dtype=bool)
+        assert np.array_equal(network.energy, energy), f"{path}: energies differ after step {t+1}"
+        assert np.array_equal(network.is_firing_next, is_firing_next), f"{path}: firing differs after step {t+1}"
+    return network
+
+
+if __name__ == "__main__":
+    import os
+    examples = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "examples")
+
+    # hand-computed steps of basic_ring.json after clicking ring_1_1 (all nodes at energy 0.1,
+    # threshold 1, decay 0.1, floor 0.1, reset to 0; ring_1_1 has a self edge of strength 1,
+    # and edges of 4/9 and -0.0381 to its direct and second neighbors)
+    network = NodeNetwork.from_file(os.path.join(examples, "basic_ring.json"))
+    assert network.n_nodes == 12 and network.n_edges == 144 and network.warnings == []
+    index = {node_id: network.index_of(f"ring_1_{node_id}") for node_id in range(1, 13)}
+    w1, w2 = 0.4444444444444444, -0.038095238095238085
+    network.spike("ring_1_1")
+    assert network.step().tolist() == [index[1]]
+    # ring_1_1: 0 (reset) + 1 (self edge) >= 1 -> fires again, no decay
+    assert network.energy[index[1]] == 1.0 and network.is_firing_next[index[1]]
+    # direct neighbors: 0.1 + 4/9 - 0.1 (decay)
+    for i in (2, 12):
+        assert np.isclose(network.energy[index[i]], 0.1 + w1 - 0.1) and not network.is_firing_next[index[i]]
+    # second neighbors: 0.1 - 0.038 - 0.1 < floor -> 0.1
+    for i in (3, 11):
+        assert network.energy[index[i]] == 0.1
+    network.step()
+    # direct neighbors: 4/9 + 4/9 - 0.1
+    for i in (2, 12):
+        assert np.isclose(network.energy[index[i]], 2*w1 - 0.1)
+    network.step()
+    # direct neighbors: 0.789 + 4/9 = 1.233 >= 1 -> fire
+    for i in (2, 12):
+        assert np.isclose(network.energy[index[i]], 3*w1 - 0.1) and network.is_firing_next[index[i]]
+
+    # step by step against the transcription of next()
+    for name in ("basic_ring.json", "big_8.json", "bigger_six_milky_way.json", os.path.join("old", "basic_ring.json")):
+        check_conformance(os.path.join(examples, name), n_steps=500)
+    print("node_network.py: all conformance checks passed")
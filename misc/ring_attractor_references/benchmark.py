@@ -0,0 +1,534 @@
+# Benchmark suite for the reference models in this folder: every model is wrapped behind the same
+# "step N neurons for T steps" harness and measured over scaling ladders of N and T (wall time,
+# steps/sec, peak RSS, allocations). Results are written to JSON and can be compared against a
+# baseline JSON from an earlier run to detect regressions.
+#
+# usage:
+#     python benchmark.py                                   # all models, default ladders
+#     python benchmark.py --models drugowitsch waves --n 64 256 --T 1000
+#     python benchmark.py --out results.json --baseline baseline.json        # exit code 1 on regressions
+#     python benchmark.py --out results.json --baseline baseline.json --update-baseline
+#
+# Each (model, N, T) case runs in a fresh (spawned) interpreter, so peak RSS is per case and a crash
+# or timeout of one model does not affect the others. Models whose dependencies (torch, ratinabox,
+# ...) are missing, or whose source does not compile, are reported as skipped.
+#
+# Several reference models are notebooks/scripts that plot and simulate at import time. They are
+# loaded with load_reference(), which executes only the top-level statements of the file that
+# define the model (plotting statements and everything from the simulation on are left out) and
+# can override top-level parameters such as the number of neurons.
+import argparse
+import ast
+import gc
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import sys
+import time
+import tracemalloc
+import types
+import numpy as np
+from simulator_models import classical_population_size, hippocampi_length, seismic_layout, sheet_length
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def load_reference(filename, overrides=None, stop_before=None, drop_names=("plt",)):
+    """Executes the model-defining part of a reference file and returns it as a module.
+    Parameters
+    ----------
+    filename : str
+        File in this folder.
+    overrides : dict, default=None
+        Values for top-level parameters, replacing the right-hand side of their assignment, e.g.
+        {"n_cells": 200}. Statements after the assignment see the overridden value.
+    stop_before : str, default=None
+        Name of the first top-level assignment that is not executed anymore (the start of the
+        simulation in script-like files).
+    drop_names : tuple of str, default=("plt",)
+        Top-level statements (other than function and class definitions) using these names are
+        left out, as are statements using names bound by left out statements (e.g. fig, ax of
+        plt.subplots()) and `if __name__ == "__main__":` blocks.
+    """
+    path = os.path.join(HERE, filename)
+    with open(path) as f:
+        # notebook exports contain shell and magic commands (!pip install ..., %autoreload 2)
+        source = "".join("\n" if line.lstrip().startswith(("!", "%")) else line for line in f)
+    tree = ast.parse(source, filename=path)
+
+    overrides = dict(overrides or {})
+    dropped = set(drop_names)
+    body = []
+    for node in tree.body:
+        bound = _bound_names(node)
+        if stop_before is not None and stop_before in bound:
+            break
+        if _is_main_block(node):
+            continue
+        if not isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            if bound & dropped or _used_names(node) & dropped:
+                dropped |= bound
+                continue
+        if isinstance(node, ast.Assign) and len(node.targets) == 1 and isinstance(node.targets[0], ast.Name):
+            name = node.targets[0].id
+            if name in overrides:
+                node.value = ast.copy_location(ast.Name(id=f"__override_{name}", ctx=ast.Load()), node.value)
+        body.append(node)
+
+    module_name = "reference_" + os.path.splitext(filename)[0]
+    module = types.ModuleType(module_name)
+    module.__file__ = path
+    for name, value in overrides.items():
+        setattr(module, f"__override_{name}", value)
+    sys.modules[module_name] = module
+    exec(compile(ast.Module(body=body, type_ignores=[]), path, "exec"), module.__dict__)
+    return module
+
+
+def _bound_names(node):
+    if isinstance(node, (ast.Import, ast.ImportFrom)):
+        return {(alias.asname or alias.name).split(".")[0] for alias in node.names}
+    if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+        return {node.name}
+    targets = []
+    if isinstance(node, ast.Assign):
+        targets = node.targets
+    elif isinstance(node, (ast.AugAssign, ast.AnnAssign)):
+        targets = [node.target]
+    return {n.id for target in targets for n in ast.walk(target) if isinstance(n, ast.Name)}
+
+
+def _used_names(node):
+    return {n.id for n in ast.walk(node) if isinstance(n, ast.Name)}
+
+
+def _is_main_block(node):
+    return (
+        isinstance(node, ast.If)
+        and isinstance(node.test, ast.Compare)
+        and isinstance(node.test.left, ast.Name)
+        and node.test.left.id == "__name__"
+    )
+
+
+#
+# models: setup(n, rng) -> (run(T), number of neurons actually simulated)
+#
+def setup_sebastian(n, rng):
+    ref = load_reference("ring_attractor_0050_sebastian.py", overrides={"n_cells": n}, stop_before="display_duration")
+    activations = rng.uniform(-1, 1, n)
+
+    def run(T):
+        nonlocal activations
+        for _ in range(T):
+            activations = ref.update_activations(activations)
+    return run, n
+
+
+def setup_neurorishika_2_4(n, rng):
+    ref = load_reference("ring_attractor_0100_neurorishika_2_4.py", overrides={"N": n}, stop_before="phase")
+    x = np.full(n, float(ref.leak_voltage))
+    inh_gate, exc_gate = np.zeros(n), np.zeros(n)
+    t = 0
+
+    def run(T):
+        nonlocal t
+        for _ in range(T):
+            t += 1
+            ref.lif_update(x, inh_gate, exc_gate, 2*np.pi * 0.001*t, 20)
+    return run, n
+
+
+def setup_neurorishika_classical(n, rng):
+    k = classical_population_size(n)
+    ref = load_reference(
+        "ring_attractor_0150_neurorishika_classical.py",
+        overrides={"N_bump": k, "N_L": k, "N_R": k},
+        stop_before="phase",
+    )
+    x = np.full(ref.N, float(ref.leak_voltage))
+    inh_gate, exc_gate = np.zeros(ref.N), np.zeros(ref.N)
+
+    def run(T):
+        for _ in range(T):
+            ref.lif_update(x, inh_gate, exc_gate, 10, 0)
+    return run, ref.N
+
+
+def setup_waves(n, rng):
+    ref = load_reference("continous_attractor_0100_waves.py")
+    length = sheet_length(n)
+    layer = ref.ContinuousAttractorLayer(shape=(length, length), J=12.0, T=0.05, σ=0.0305, τ=0.8)
+    layer.set_activation((length // 2, length // 2))
+    delta = np.zeros(2)
+
+    def run(T):
+        for _ in range(T):
+            layer.update(delta)
+    return run, length**2
+
+
+def setup_neuro_gpr(n, rng):
+    import torch
+    ref = load_reference("continuous_attractor_0250_neuro_gpr.py")
+    cann = ref.CANN(np.linspace(0, 1, 16)[:, np.newaxis], num=n)
+    # update() takes a torch sequence (seq_len, 1), the stimulus is built from the sample centers
+    cann.centers = torch.from_numpy(cann.centers)
+    cann.z_range = torch.from_numpy(cann.z_range)
+
+    def run(T):
+        cann.update(torch.from_numpy(rng.uniform(0, 1, (T, 1))))
+    return run, n
+
+
+def setup_hippocampi(n, rng):
+    import torch
+    torch.manual_seed(int(rng.integers(2**31)))
+    ref = load_reference("continuous_attractor_0300_hippocampi.py")
+    length = hippocampi_length(n)
+    can = ref.CAN(length, warmup_steps=0, tau=0.01, periodic=False)
+    velocity = torch.zeros(2)
+
+    def run(T):
+        with torch.no_grad():
+            for _ in range(T):
+                can(velocity, step_size=0.002)
+    return run, length**2
+
+
+def _seismic_setup(filename, n, rng, **kwargs):
+    import torch
+    ref = load_reference(filename)
+    population_slices, weights = seismic_layout(n, rng)
+    n, n_epg = len(weights), population_slices["epg"].stop
+    network = ref.RingAttractorNetwork(
+        initial_weights=torch.from_numpy(weights), population_slices=population_slices, **kwargs
+    )
+    input_values = torch.cat([torch.tensor([0.001, 0.5], dtype=torch.double), torch.from_numpy(rng.uniform(0, 1, n_epg))])
+    state = torch.zeros(n, dtype=torch.double)
+
+    def run(T):
+        nonlocal state
+        with torch.no_grad():
+            for _ in range(T):
+                _, state = network(input_values, state)
+    return run, n
+
+
+def setup_seismic(n, rng):
+    return _seismic_setup("ring_attractor_0300_seismic.py", n, rng)
+
+
+def setup_seismic_no_split(n, rng):
+    return _seismic_setup("ring_attractor_0300_seismic_no_split_only_landmarks.py", n, rng)
+
+
+def setup_xuelong(n, rng):
+    # the ring has 16 neurons (8 per hemisphere), N scales the number of agents stepped together;
+    # one step is one cue integration (iteration of the ring to its stable state)
+    ref = load_reference("ring_attractor_0450_xuelong.py")
+    n_agents = max(n // 16, 1)
+    population = ref.InsectBrainPopulation(n_agents)
+
+    def run(T):
+        for _ in range(T):
+            population.cue_integration_output(rng.uniform(0, 1, (n_agents, 16)), rng.uniform(0, 1, (n_agents, 16)))
+    return run, 16 * n_agents
+
+
+def setup_drugowitsch(n, rng):
+    ref = load_reference("ring_attractor_0800_drugowitsch_lab.py")
+    network_params = {
+        "N": n, "tau": 0.1, "alpha": 3.0, "D": 0.5, "beta": 20 / n,
+        "f_act": lambda x: np.maximum(x, 0), "v_rel": 1.0, "dt": 0.001,
+    }
+    ra = ref.RingAttractorNetwork(network_params, init="bumpatzero")
+
+    def run(T):
+        for _ in range(T):
+            ra.propagate_onestep(v=0.5)
+    return run, n
+
+
+def setup_rat_in_a_box(n, rng):
+    ref = load_reference("ring_attractor_rat_in_a_box.py", overrides={"n_cells": n}, stop_before="scheduler")
+    scheduler = ref.NetworkScheduler(
+        ref.Ag,
+        [ref.PlaceCells_, ref.VelocityCells_, ref.ConjunctiveCells_left, ref.ConjunctiveCells_right, ref.RingAttractor],
+    )
+
+    def run(T):
+        scheduler.run(T)
+    return run, n
+
+
+# name: (setup, default N ladder, default T ladder)
+MODELS = {
+    "sebastian": (setup_sebastian, (25, 50, 100), (10, 50)),
+    "neurorishika_2_4": (setup_neurorishika_2_4, (8, 64, 512), (1000, 10000)),
+    "neurorishika_classical": (setup_neurorishika_classical, (25, 97, 385), (1000, 10000)),
+    "waves": (setup_waves, (64, 256, 1024), (10, 100)),
+    "neuro_gpr": (setup_neuro_gpr, (32, 128, 512), (10, 100)),
+    "hippocampi": (setup_hippocampi, (256, 1024, 4096), (100, 1000)),
+    "seismic": (setup_seismic, (64, 256, 1024), (100, 1000)),
+    "seismic_no_split": (setup_seismic_no_split, (64, 256, 1024), (100, 1000)),
+    "xuelong": (setup_xuelong, (16, 256, 4096), (10, 100)),
+    "drugowitsch": (setup_drugowitsch, (64, 512, 4096), (1000, 10000)),
+    "rat_in_a_box": (setup_rat_in_a_box, (25, 50, 100), (100, 1000)),
+}
+
+
+#
+# measurement
+#
+def case_key(model, n, T):
+    return f"{model}/N={n}/T={T}"
+
+
+def _peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on linux, bytes on macos
+    return peak / 2**20 if sys.platform == "darwin" else peak / 2**10
+
+
+def measure(model, n, T, repeat=3, alloc_steps=100, seed=0):
+    """Measures one case in the current process.
+    Returns
+    -------
+    result : dict
+        n_neurons : number of neurons actually simulated (models round N to their structure)
+        setup_time : s to build the model (weights etc.)
+        wall_time : best of `repeat` runs of T steps (s)
+        steps_per_second : T / wall_time
+        peak_rss_mb : peak resident memory of the process (MB)
+        alloc_bytes_per_step : mean memory allocated on top of the live memory within one step,
+            i.e. the temporaries of a step (tracemalloc, over alloc_steps steps)
+        alloc_peak_bytes : largest of these
+        alloc_blocks : memory blocks still allocated after the alloc_steps steps (growing state)
+    """
+    setup = MODELS[model][0]
+    rng = np.random.default_rng(seed)
+    np.random.seed(seed)
+
+    start = time.perf_counter()
+    run, n_neurons = setup(n, rng)
+    setup_time = time.perf_counter() - start
+    run(1)  # warm up
+
+    wall_times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run(T)
+        wall_times.append(time.perf_counter() - start)
+    wall_time = min(wall_times)
+
+    gc.collect()
+    tracemalloc.start()
+    exclude = [tracemalloc.Filter(False, tracemalloc.__file__)]
+    before = tracemalloc.take_snapshot().filter_traces(exclude)
+    step_bytes = []
+    for _ in range(min(alloc_steps, T)):
+        current = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        run(1)
+        step_bytes.append(tracemalloc.get_traced_memory()[1] - current)
+    gc.collect()
+    after = tracemalloc.take_snapshot().filter_traces(exclude)
+    tracemalloc.stop()
+    alloc_blocks = sum(stat.count_diff for stat in after.compare_to(before, "filename"))
+
+    return {
+        "status": "ok",
+        "model": model,
+        "n": n,
+        "T": T,
+        "n_neurons": int(n_neurons),
+        "setup_time": setup_time,
+        "wall_time": wall_time,
+        "steps_per_second": T / wall_time if wall_time > 0 else float("inf"),
+        "peak_rss_mb": _peak_rss_mb(),
+        "alloc_bytes_per_step": float(np.mean(step_bytes)) if step_bytes else 0.0,
+        "alloc_peak_bytes": int(max(step_bytes, default=0)),
+        "alloc_blocks": int(alloc_blocks),
+    }
+
+
+def _measure_worker(connection, model, n, T, repeat, alloc_steps, seed):
+    try:
+        result = measure(model, n, T, repeat=repeat, alloc_steps=alloc_steps, seed=seed)
+    except (ImportError, SyntaxError) as error:
+        result = {"status": f"skipped: {type(error).__name__}: {error}"}
+    except Exception as error:
+        result = {"status": f"error: {type(error).__name__}: {error}"}
+    connection.send(result)
+    connection.close()
+
+
+def run_case(model, n, T, repeat=3, alloc_steps=100, seed=0, timeout=600):
+    """Measures one case in a fresh spawned interpreter (see measure())."""
+    context = multiprocessing.get_context("spawn")
+    receiver, sender = context.Pipe(duplex=False)
+    process = context.Process(target=_measure_worker, args=(sender, model, n, T, repeat, alloc_steps, seed))
+    process.start()
+    sender.close()
+    try:
+        if receiver.poll(timeout):
+            result = receiver.recv()
+        else:
+            result = {"status": f"timeout: no result after {timeout} s"}
+    except EOFError:
+        result = {"status": f"error: worker died (exit code {process.exitcode})"}
+    process.join(5)
+    if process.is_alive():
+        process.terminate()
+        process.join()
+    result.setdefault("model", model)
+    result.setdefault("n", n)
+    result.setdefault("T", T)
+    return result
+
+
+def run_suite(models=None, n_ladder=None, T_ladder=None, repeat=3, alloc_steps=100, seed=0, timeout=600, log=print):
+    """Runs the (model, N, T) cases of the ladders (default: per model ladders of MODELS).
+    Once a model is skipped (missing dependency) its remaining cases are skipped as well.
+    Returns
+    -------
+    report : dict {"meta": ..., "results": {case_key: result}}
+    """
+    results = {}
+    for model in (models or MODELS):
+        if model not in MODELS:
+            raise ValueError(f"Unknown model {model!r}, choose from {list(MODELS)}")
+        _, default_n, default_T = MODELS[model]
+        skipped = None
+        for n in (n_ladder or default_n):
+            for T in (T_ladder or default_T):
+                key = case_key(model, n, T)
+                if skipped is not None:
+                    results[key] = dict(skipped, n=n, T=T)
+                    continue
+                result = run_case(model, n, T, repeat=repeat, alloc_steps=alloc_steps, seed=seed, timeout=timeout)
+                if result["status"].startswith("skipped"):
+                    skipped = result
+                results[key] = result
+                if log is not None:
+                    log(format_result(key, result))
+    return {"meta": environment_info(), "results": results}
+
+
+def environment_info():
+    return {
+        "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def format_result(key, result):
+    if result["status"] != "ok":
+        return f"{key:<40} {result['status']}"
+    return (
+        f"{key:<40} {result['steps_per_second']:>12.1f} steps/s  {result['wall_time']:>9.4f} s"
+        f"  setup {result['setup_time']:>8.4f} s  rss {result['peak_rss_mb']:>8.1f} MB"
+        f"  {result['alloc_bytes_per_step']:>12.0f} B/step"
+    )
+
+
+#
+# baselines and regressions
+#
+def compare(report, baseline, tolerance=0.25, rss_tolerance=0.25):
+    """Compares a report against a baseline report, case by case.
+    A case regresses if it ran in the baseline but fails now, if its steps/sec dropped by more
+    than `tolerance` (relative), or if its peak RSS grew by more than `rss_tolerance`.
+    Returns
+    -------
+    regressions : list of dict {"case", "metric", "baseline", "current", "change"}
+    improvements : list of dict, same for cases that got faster by more than `tolerance`
+    """
+    regressions, improvements = [], []
+    for key, current in report["results"].items():
+        previous = baseline.get("results", {}).get(key)
+        if previous is None or previous.get("status") != "ok":
+            continue
+        if current["status"] != "ok":
+            if not current["status"].startswith("skipped"):
+                regressions.append({"case": key, "metric": "status", "baseline": "ok", "current": current["status"], "change": None})
+            continue
+        change = current["steps_per_second"] / previous["steps_per_second"] - 1
+        entry = {"case": key, "metric": "steps_per_second", "baseline": previous["steps_per_second"],
+                 "current": current["steps_per_second"], "change": change}
+        if change < -tolerance:
+            regressions.append(entry)
+        elif change > tolerance:
+            improvements.append(entry)
+        change = current["peak_rss_mb"] / previous["peak_rss_mb"] - 1
+        if change > rss_tolerance:
+            regressions.append({"case": key, "metric": "peak_rss_mb", "baseline": previous["peak_rss_mb"],
+                                "current": current["peak_rss_mb"], "change": change})
+    return regressions, improvements
+
+
+def load_report(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_report(report, path):
+    with open(path, "w") as f:
+        json.dump(report, f, indent=2)
+
+
+def update_baseline(report, path):
+    """Merges the cases of a report into the baseline at path (cases not run keep their baseline)."""
+    baseline = load_report(path) if os.path.exists(path) else {"meta": {}, "results": {}}
+    baseline["meta"] = report["meta"]
+    baseline["results"].update({key: result for key, result in report["results"].items() if result["status"] == "ok"})
+    save_report(baseline, path)
+    return baseline
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the ring attractor reference models.")
+    parser.add_argument("--models", nargs="+", choices=list(MODELS), help="models to run (default: all)")
+    parser.add_argument("--n", nargs="+", type=int, help="N ladder (default: per model)")
+    parser.add_argument("--T", nargs="+", type=int, help="T ladder (default: per model)")
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs per case, the best one counts")
+    parser.add_argument("--alloc-steps", type=int, default=100, help="steps traced for the allocation metrics")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--timeout", type=float, default=600, help="seconds per case")
+    parser.add_argument("--out", default="benchmark_results.json", help="JSON file for the results")
+    parser.add_argument("--baseline", help="JSON baseline to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed relative drop in steps/sec")
+    parser.add_argument("--rss-tolerance", type=float, default=0.25, help="allowed relative growth of peak RSS")
+    parser.add_argument("--update-baseline", action="store_true", help="merge the results into the baseline")
+    args = parser.parse_args(argv)
+
+    report = run_suite(args.models, args.n, args.T, repeat=args.repeat, alloc_steps=args.alloc_steps,
+                       seed=args.seed, timeout=args.timeout)
+    save_report(report, args.out)
+
+    regressions = []
+    if args.baseline and os.path.exists(args.baseline):
+        regressions, improvements = compare(report, load_report(args.baseline), args.tolerance, args.rss_tolerance)
+        for entry in improvements:
+            print(f"improved   {entry['case']:<40} {entry['metric']}: {entry['baseline']:.1f} -> {entry['current']:.1f} ({entry['change']:+.0%})")
+        for entry in regressions:
+            if entry["metric"] == "status":
+                print(f"REGRESSION {entry['case']:<40} {entry['current']}")
+            else:
+                print(f"REGRESSION {entry['case']:<40} {entry['metric']}: {entry['baseline']:.1f} -> {entry['current']:.1f} ({entry['change']:+.0%})")
+        if not regressions:
+            print(f"no regressions against {args.baseline}")
+    if args.baseline and args.update_baseline:
+        update_baseline(report, args.baseline)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,328 @@
+# Online bump decoding and path-integration error tracking: BumpDecoder reads the bump position
+# off the activity of a 1-D ring or a 2-D sheet (population vector, argmax or sub-bin centroid),
+# PathIntegrationTracker compares it step by step with the ground-truth heading/position and keeps
+# running error and drift statistics, so no activity or position traces have to be stored. Both
+# work on batches of networks, (batch, N) activities, in O(N) per step.
+#
+# usage with the simulator (see simulator.py):
+#     decoder = BumpDecoder(256, mode="centroid")
+#     tracker = PathIntegrationTracker(decoder, batch=64, dt=model.dt, offset="first")
+#     sim.run(T, observers=[tracker.observer(heading)])    # heading(step) -> (batch,) angles
+#     tracker.summary()["drift"]
+#
+# or in the step loop of any reference model:
+#     detach = attach(ra, "propagate_onestep", tracker, activity=lambda ra: ra.r, truth=lambda ra: heading)
+import numpy as np
+
+
+def wrap(x, period):
+    """Wraps x to [-period/2, period/2), x is returned unchanged where the period is infinite
+    (non-periodic axes)."""
+    period = np.asarray(period, dtype=np.float64)
+    periodic = np.isfinite(period)
+    finite = np.where(periodic, period, 1.0)
+    return np.where(periodic, (x + finite / 2) % finite - finite / 2, x)
+
+
+class BumpDecoder:
+    """Decodes the bump position of ring (1-D) or sheet (2-D) activities.
+
+    Positions are computed in cell coordinates along each axis (fractional cell indices, in
+    [0, n) on periodic axes). Rings report them as angles, origin + index 2 pi / N wrapped to
+    [-pi, pi) (origin=-pi gives the phi_0 of determine_bumpPosition()); sheets report (row, column)
+    cell coordinates, like ContinuousAttractorLayer.peak.
+
+    Parameters
+    ----------
+    shape : int or tuple of int
+        N for a ring, (n0, n1) for a sheet (activities are flattened in C order).
+    mode : str, default="population_vector"
+        "population_vector": circular mean of the cell angles weighted with the activity along each
+            (periodic) axis, center of mass on non-periodic axes (of the marginal activity on sheets).
+        "argmax": most active cell.
+        "centroid": most active cell, refined by the center of mass of the activity above the minimum
+            of the window of cells around it.
+    periodic : bool, default=True
+        Whether the axes wrap around (rings always do).
+    origin : float, default=-pi
+        Angle of cell 0 of a ring.
+    window : int, default=2
+        Cells on each side of the peak used by "centroid".
+    """
+    modes = ("population_vector", "argmax", "centroid")
+
+    def __init__(self, shape, mode="population_vector", periodic=True, origin=-np.pi, window=2):
+        self.shape = (shape,) if np.isscalar(shape) else tuple(shape)
+        if len(self.shape) not in (1, 2):
+            raise ValueError(f"Only rings (N,) and sheets (n0, n1) can be decoded, got shape {self.shape}")
+        if mode not in self.modes:
+            raise ValueError(f"Unknown mode {mode!r}, choose from {self.modes}")
+        self.mode = mode
+        self.is_ring = len(self.shape) == 1
+        self.periodic = True if self.is_ring else periodic
+        self.origin = origin
+        self.window = window
+        self.size = int(np.prod(self.shape))
+        # cos/sin of the cell angles along each axis, for the population vector
+        self._cos = [np.cos(2 * np.pi * np.arange(n) / n) for n in self.shape]
+        self._sin = [np.sin(2 * np.pi * np.arange(n) / n) for n in self.shape]
+        self._offsets = np.arange(-window, window + 1)
+
+    @property
+    def period(self):
+        """Period of the decoded positions along each axis (np.inf on non-periodic axes)."""
+        if self.is_ring:
+            return np.array([2 * np.pi])
+        return np.array([float(n) if self.periodic else np.inf for n in self.shape])
+
+    def __call__(self, activity):
+        """Bump positions of activities of shape (..., N): shape (...) for rings (in rad), (..., 2) for
+        sheets (in cells)."""
+        activity = np.asarray(activity, dtype=np.float64)
+        if activity.shape[-1] != self.size:
+            raise ValueError(f"Expected activities with {self.size} cells, got shape {activity.shape}")
+        batch_shape = activity.shape[:-1]
+        activity = activity.reshape((-1,) + self.shape)
+        if self.mode == "population_vector":
+            position = self._population_vector(activity)
+        else:
+            position = self._peak(activity)
+            if self.mode == "centroid":
+                position = position + self._centroid_offset(activity, position.astype(np.int64))
+                if self.periodic:
+                    position %= self.shape
+        if self.is_ring:
+            return wrap(self.origin + position[:, 0] * (2 * np.pi / self.shape[0]), 2 * np.pi).reshape(batch_shape)
+        return position.reshape(batch_shape + (2,))
+
+    def _marginals(self, activity):
+        if self.is_ring:
+            return [activity]
+        return [activity.sum(axis=2), activity.sum(axis=1)]
+
+    def _population_vector(self, activity):
+        position = np.empty((len(activity), len(self.shape)))
+        for axis, marginal in enumerate(self._marginals(activity)):
+            n = self.shape[axis]
+            if self.periodic:
+                angle = np.arctan2(marginal @ self._sin[axis], marginal @ self._cos[axis])
+                position[:, axis] = (angle * n / (2 * np.pi)) % n
+            else:
+                total = marginal.sum(axis=1)
+                position[:, axis] = marginal @ np.arange(n) / np.where(total != 0, total, 1)
+        return position
+
+    def _peak(self, activity):
+        peak = np.argmax(activity.reshape(len(activity), -1), axis=1)
+        return np.stack(np.unravel_index(peak, self.shape), axis=-1).astype(np.float64)
+
+    def _centroid_offset(self, activity, peak):
+        # activity in the window around the peak, as (batch, window) profiles along each axis
+        rows = np.arange(len(activity))[:, np.newaxis]
+        offset = np.zeros(peak.shape)
+        for axis, n in enumerate(self.shape):
+            index = peak[:, axis:axis + 1] + self._offsets
+            inside = np.ones(index.shape, dtype=bool)
+            if self.periodic:
+                index = index % n
+            else:
+                inside = (index >= 0) & (index < n)
+                index = np.clip(index, 0, n - 1)
+            if self.is_ring:
+                profile = activity[rows, index]
+            elif axis == 0:
+                profile = activity[rows, index, peak[:, 1:2]]
+            else:
+                profile = activity[rows, peak[:, 0:1], index]
+            weights = (profile - np.min(np.where(inside, profile, np.inf), axis=1, keepdims=True)) * inside
+            total = weights.sum(axis=1)
+            offset[:, axis] = weights @ self._offsets / np.where(total > 0, total, 1)
+        return offset
+
+
+class PathIntegrationTracker:
+    """Running path-integration error statistics of a batch of networks: every update() decodes the
+    bump positions and compares them with the ground truth, in O(N) per step without storing traces.
+    Errors are decoded - truth - offset, wrapped on periodic axes; sheets report errors per axis and
+    distances as their euclidean norm.
+
+    Parameters
+    ----------
+    decoder : BumpDecoder
+    batch : int, default=1
+    dt : float, default=1.0
+        Time between steps, the drift is given per unit of time.
+    offset : float, array-like or "first", default=0.0
+        Constant offset between bump and truth, "first" takes the error of the first update.
+    """
+
+    def __init__(self, decoder, batch=1, dt=1.0, offset=0.0):
+        self.decoder = decoder
+        self.batch = batch
+        self.dt = dt
+        self.calibrate = isinstance(offset, str) and offset == "first"
+        if isinstance(offset, str) and not self.calibrate:
+            raise ValueError(f"offset must be a number, an array or 'first', got {offset!r}")
+        self.initial_offset = 0.0 if self.calibrate else offset
+        self.reset()
+
+    def reset(self):
+        """Clears the statistics."""
+        d = len(self.decoder.shape)
+        self.offset = self._per_axis(self.initial_offset)
+        self.n = 0
+        self.error = np.zeros((self.batch, d))
+        self._unwrapped = np.zeros((self.batch, d))
+        self._sum_error = np.zeros((self.batch, d))
+        self._sum_cos = np.zeros((self.batch, d))
+        self._sum_sin = np.zeros((self.batch, d))
+        self._sum_distance = np.zeros(self.batch)
+        self._sum_distance_sq = np.zeros(self.batch)
+        self._max_distance = np.zeros(self.batch)
+        # Welford sums for the least-squares slope of the unwrapped error over time
+        self._mean_t = 0.0
+        self._m2_t = 0.0
+        self._mean_unwrapped = np.zeros((self.batch, d))
+        self._c_t_unwrapped = np.zeros((self.batch, d))
+        return self
+
+    def _per_axis(self, value):
+        # (batch, axes) array from a scalar or per-network values (rings) or positions (sheets)
+        value = np.asarray(value, dtype=np.float64)
+        if self.decoder.is_ring:
+            value = value[..., np.newaxis]
+        return np.broadcast_to(value, (self.batch, len(self.decoder.shape))).copy()
+
+    def update(self, activity, truth, t=None):
+        """Adds one step: activity of shape (batch, N), truth of shape (batch,) (or scalar) for rings,
+        (batch, 2) for sheets, at time t (default: number of updates times dt). Returns the errors."""
+        period = self.decoder.period
+        position = self.decoder(activity).reshape(self.batch, -1)
+        raw = wrap(position - self._per_axis(truth), period)
+        if self.calibrate and self.n == 0:
+            self.offset = raw.copy()
+        error = wrap(raw - self.offset, period)
+
+        # the unwrapped error follows the error across the wrap-around
+        if self.n == 0:
+            self._unwrapped = error.copy()
+        else:
+            self._unwrapped += wrap(error - self.error, period)
+        self.error = error
+        self.n += 1
+        t = (self.n - 1) * self.dt if t is None else t
+
+        self._sum_error += error
+        angle = 2 * np.pi * error / np.where(np.isfinite(period), period, 1)
+        self._sum_cos += np.cos(angle)
+        self._sum_sin += np.sin(angle)
+        distance = np.sqrt(np.sum(np.square(error), axis=1))
+        self._sum_distance += distance
+        self._sum_distance_sq += np.square(distance)
+        np.maximum(self._max_distance, distance, out=self._max_distance)
+
+        delta_t = t - self._mean_t
+        self._mean_t += delta_t / self.n
+        self._m2_t += delta_t * (t - self._mean_t)
+        delta_u = self._unwrapped - self._mean_unwrapped
+        self._mean_unwrapped += delta_u / self.n
+        self._c_t_unwrapped += delta_t * (self._unwrapped - self._mean_unwrapped)
+        return error[:, 0] if self.decoder.is_ring else error
+
+    def summary(self):
+        """Statistics over all updates so far, arrays of shape (batch,) (rings) or (batch, 2)
+        (per-axis values of sheets):
+        n_steps, final_error, mean_error (circular mean on periodic axes), offset_variation (circular
+        variance of the errors, see circular_statistics.offset_variation(); nan on non-periodic axes),
+        drift (least-squares slope of the unwrapped error per unit of time), total_drift (unwrapped
+        error of the last step), and of the error distances mean_abs_error, rms_error, max_abs_error."""
+        period = self.decoder.period
+        n = max(self.n, 1)
+        periodic = np.isfinite(period)
+        circular_mean = np.arctan2(self._sum_sin, self._sum_cos) * np.where(periodic, period, 1) / (2 * np.pi)
+        mean_error = np.where(periodic, circular_mean, self._sum_error / n)
+        offset_variation = np.where(periodic, 1 - np.hypot(self._sum_cos, self._sum_sin) / n, np.nan)
+        drift = self._c_t_unwrapped / self._m2_t if self._m2_t > 0 else np.full(self._c_t_unwrapped.shape, np.nan)
+        squeeze = (lambda x: x[:, 0]) if self.decoder.is_ring else (lambda x: x)
+        return {
+            "n_steps": self.n,
+            "final_error": squeeze(self.error),
+            "mean_error": squeeze(mean_error),
+            "offset_variation": squeeze(offset_variation),
+            "drift": squeeze(drift),
+            "total_drift": squeeze(self._unwrapped),
+            "mean_abs_error": self._sum_distance / n,
+            "rms_error": np.sqrt(self._sum_distance_sq / n),
+            "max_abs_error": self._max_distance.copy(),
+        }
+
+    def observer(self, truth, columns=slice(None)):
+        """Observer for Simulator.run(observers=[...]): updates with state[:, columns] after the
+        observed steps. truth is a function step -> truth, or an array indexed by step - 1 (steps
+        count from 1, like the recorded steps of the simulator)."""
+        def observe(step, state):
+            value = truth(step) if callable(truth) else truth[step - 1]
+            self.update(state[:, columns], value, t=step * self.dt)
+        return observe
+
+
+def attach(obj, method, tracker, activity, truth):
+    """Hooks tracker into the step loop of a model object: after every call of obj.method(...),
+    tracker.update(activity(obj), truth(obj)). Returns a function that removes the hook.
+
+    e.g. attach(ra, "propagate_onestep", tracker, activity=lambda ra: ra.r, truth=lambda ra: heading[ra.t])
+    """
+    original = getattr(obj, method)
+    overrides_instance_attribute = method in vars(obj)
+
+    def step(*args, **kwargs):
+        result = original(*args, **kwargs)
+        tracker.update(activity(obj), truth(obj))
+        return result
+
+    setattr(obj, method, step)
+
+    def detach():
+        if overrides_instance_attribute:
+            setattr(obj, method, original)
+        else:
+            delattr(obj, method)
+    return detach
+
+
+if __name__ == "__main__":
+    # ring: von Mises bumps moving at 0.2 rad/s ahead of the truth, across several wrap-arounds
+    N, batch, dt = 128, 3, 0.1
+    angles = -np.pi + 2 * np.pi * np.arange(N) / N
+    for mode in BumpDecoder.modes:
+        tracker = PathIntegrationTracker(BumpDecoder(N, mode=mode), batch=batch, dt=dt, offset="first")
+        for step in range(500):
+            truth = wrap(np.array([0.0, 1.0, -2.0]) + 1.5 * step * dt, 2 * np.pi)
+            bump = truth + 0.3 + 0.2 * step * dt
+            tracker.update(np.exp(4 * np.cos(angles - bump[:, np.newaxis])), truth)
+        summary = tracker.summary()
+        # argmax is exact to a cell, the centroid to half a cell
+        tolerance = {"population_vector": 1e-3, "argmax": 2 * np.pi / N, "centroid": np.pi / N}[mode]
+        assert np.allclose(summary["drift"], 0.2, atol=tolerance / 10), (mode, summary["drift"])
+        assert np.allclose(summary["total_drift"], 0.2 * 499 * dt, atol=tolerance), (mode, summary["total_drift"])
+        assert np.all(np.isfinite(summary["rms_error"]))
+
+    # non-periodic sheet: gaussian bumps moving at (0.5, -0.25) cells/s ahead of the truth
+    n, batch, dt = 16, 2, 0.1
+    rows, columns = np.meshgrid(np.arange(n), np.arange(n), indexing="ij")
+    for mode in BumpDecoder.modes:
+        decoder = BumpDecoder((n, n), mode=mode, periodic=False)
+        tracker = PathIntegrationTracker(decoder, batch=batch, dt=dt, offset="first")
+        for step in range(100):
+            truth = np.array([[4.0, 10.0], [6.0, 6.0]]) + 0.02 * step
+            bump = truth + np.array([0.5, -0.25]) * step * dt
+            activity = np.exp(-((rows - bump[:, 0, np.newaxis, np.newaxis]) ** 2
+                                + (columns - bump[:, 1, np.newaxis, np.newaxis]) ** 2) / 4)
+            tracker.update(activity.reshape(batch, -1), truth)
+        summary = tracker.summary()
+        for key in ("final_error", "mean_error", "drift", "total_drift", "rms_error", "max_abs_error"):
+            assert np.all(np.isfinite(summary[key])), (mode, key, summary[key])
+        if mode != "argmax":
+            assert np.allclose(summary["drift"], [0.5, -0.25], atol=0.02), (mode, summary["drift"])
+        assert np.all(np.isnan(summary["offset_variation"]))
+    print("bump_decoding.py: all checks passed")
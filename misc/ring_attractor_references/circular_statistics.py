@@ -0,0 +1,125 @@
+# Vectorized versions of the circular statistics helpers of ring_attractor_0800_drugowitsch_lab.py
+# (circular_mean, offset_variation, robust_mean, sliding_window), working on whole (trials, T) arrays
+# instead of single arrays and windows. back_to_circ already works on whole arrays and is imported
+# from there.
+import numpy as np
+from ring_attractor_0800_drugowitsch_lab import back_to_circ
+
+
+def circular_mean(phi, w=None, axis=-1):
+    """Computes (weighted) circular means of the angles phi along an axis, by converting angles
+    to vectors in C^2 and perform (weighted) averaging there
+    Parameters
+    ---------
+    phi : array-like
+        Angles to take the circular average of
+    w : None or array-like of shape phi.shape(), default=None
+        For weighted averaging. Assumes weights are normalized to one along axis.
+    axis : int, default=-1
+        Axis to average over, e.g. time for an array of shape (trials, T)
+    Returns:
+    --------
+    phi_hat : array-like
+        Circular mean.
+    r_hat : array-like
+        Radius of circular mean.
+    """
+    X = np.average(np.cos(phi), weights=w, axis=axis)
+    Y = np.average(np.sin(phi), weights=w, axis=axis)
+
+    # convert average back to polar coordinates
+    phi_hat = np.arctan2(Y, X)
+    r_hat = np.sqrt( X**2 + Y**2 )
+
+    return phi_hat, r_hat
+
+
+def circular_variance(phi, axis=-1):
+    """Circular variance 1 - r_hat of the angles phi along an axis (see circular_mean())."""
+    _, r_hat = circular_mean(phi, axis=axis)
+    return 1 - r_hat
+
+
+def sliding_circular_mean(phi, windowsize, axis=-1):
+    """Circular means over sliding windows BEFORE each index along an axis: element idx is the
+    circular mean of phi[max(idx-windowsize+1, 0) : idx+1], the window of sliding_window().
+    All windows are computed at once from cumulative sums of cos(phi) and sin(phi).
+    Parameters
+    ---------
+    phi : array-like, e.g. of shape (trials, T)
+        Angles
+    windowsize : int
+        Size of sliding window
+    axis : int, default=-1
+        Axis to slide along
+    Returns:
+    --------
+    phi_hat : np.array of shape phi.shape()
+        Circular means
+    r_hat : np.array of shape phi.shape()
+        Radii of circular means
+    """
+    phi = np.moveaxis(np.asarray(phi, dtype=float), axis, -1)
+    T = phi.shape[-1]
+    # windows are (start, idx] in terms of the cumulative sums with a leading 0
+    stop = np.arange(1, T+1)
+    start = np.maximum(stop - windowsize, 0)
+    length = stop - start
+
+    csum = np.zeros(phi.shape[:-1] + (T+1,))
+    np.cumsum(np.cos(phi), axis=-1, out=csum[..., 1:])
+    X = (csum[..., stop] - csum[..., start]) / length
+    np.cumsum(np.sin(phi), axis=-1, out=csum[..., 1:])
+    Y = (csum[..., stop] - csum[..., start]) / length
+
+    phi_hat = np.arctan2(Y, X)
+    r_hat = np.sqrt( X**2 + Y**2 )
+    return np.moveaxis(phi_hat, -1, axis), np.moveaxis(r_hat, -1, axis)
+
+
+def sliding_circular_variance(phi, windowsize, axis=-1):
+    """Circular variances 1 - r_hat over sliding windows (see sliding_circular_mean())."""
+    _, r_hat = sliding_circular_mean(phi, windowsize, axis=axis)
+    return 1 - r_hat
+
+
+def trimmed_mean(arr, tail=0.2, axis=0):
+    """Computes a robust mean along an axis (of each array column by default), discarding the
+    highest and lowest values, as robust_mean(). Only partitions the values around the two cut
+    points (np.partition) instead of sorting them.
+    Parameters
+    ---------
+    arr : np.array
+    tail : fraction of values in the top and bottom to discard
+    axis : int, default=0
+    """
+    arr = np.asarray(arr)
+    n = arr.shape[axis]
+    idx_start = int(np.floor(tail * n))  # start index
+    idx_stop = n - idx_start             # stop index
+    if idx_start >= idx_stop:            # everything discarded
+        return np.mean(np.take(arr, [], axis=axis), axis=axis)
+    arr_partitioned = np.partition(arr, (idx_start, idx_stop - 1), axis=axis)
+    arr_trimmed = np.take(arr_partitioned, np.arange(idx_start, idx_stop), axis=axis)
+    return np.mean(arr_trimmed, axis=axis)
+
+
+def offset_variation(phi1, phi2, axis=-1):
+    """Computes the offset variation between arrays of angles (in rad), as the circular variance
+    of their differences along an axis. phi1 and phi2 are broadcast against each other, so e.g.
+    bump positions of shape (trials, T) can be compared with one heading of shape (T,), or sets
+    of trials with each other ((sets, 1, T) against (1, trials, T)).
+    Parameters
+    ---------
+    phi1 : array-like
+        First array of angles
+    phi2 : array-like broadcastable with phi1
+        Second array of angles
+    axis : int, default=-1
+        Axis to compute the variation over
+    Returns:
+    --------
+    var : float or np.array
+        Offset variation(s).
+    """
+    return circular_variance(np.subtract(phi1, phi2), axis=axis)
@@ -0,0 +1,597 @@
+# Opt-in hot-path profiling of the reference models: per-phase cumulative timings and allocations of
+# their step functions (and weight construction), exported as a report and as collapsed stacks for
+# flame graphs (flamegraph.pl, speedscope, inferno).
+#
+# usage:
+#     python profiling.py drugowitsch --n 1024 --T 1000 --out drugowitsch.folded
+#     python profiling.py neurorishika_2_4 --T 10000 --allocations --metric alloc_bytes --out lif.folded
+#     python profiling.py waves --port --n 1024 --T 100        # the simulator port (simulator_models.py)
+#     flamegraph.pl drugowitsch.folded > drugowitsch.svg
+#
+# or from python:
+#     profiler = Profiler(allocations=True)
+#     with profiler.instrument(module, {"RingAttractorNetwork.forward": [("weighted", "weighted_input ="), ...]}):
+#         ...                                 # runs the model
+#     print(profiler.report())
+#     profiler.write_collapsed("forward.folded")
+#
+# Instrumentation rewrites the instrumented functions: the source of each function is recompiled
+# with its top-level statements grouped into phases (a phase starts at the first statement whose
+# first source line contains its marker, see REFERENCE_PHASES) wrapped in timing contexts, and the
+# originals are put back when instrument() exits. Nothing is patched unless a profile is taken, so
+# with instrumentation off there is no overhead at all. The simulator profiles its step functions
+# with Simulator(..., profiler=Profiler()).
+#
+# Without allocations, a phase call only records its time (plain Python lists), and the time of the
+# bookkeeping of the phase calls, calibrated when the profiler is created, is subtracted from the
+# times of the phases and of their parents; the alloc kB and blocks columns of the report are empty.
+#
+# Allocations (allocations=True) are traced with tracemalloc, which slows the run down: alloc_bytes
+# of a phase is the memory allocated on top of the live memory within the phase (its temporaries,
+# as alloc_bytes_per_step of benchmark.py), summed over its calls; net_blocks is the change of the
+# number of allocated memory blocks (sys.getallocatedblocks()), i.e. memory kept by the phase, without
+# the bookkeeping of the profiler itself.
+import argparse
+import ast
+import contextlib
+import functools
+import inspect
+import sys
+import textwrap
+import time
+import tracemalloc
+import numpy as np
+
+
+class Profiler:
+    """Cumulative timings and allocations of nested phases, keyed by their stack of phase names.
+
+    Parameters
+    ----------
+    allocations : bool, default=False
+        Trace allocations (tracemalloc) while the profiler is active (with profiler: ...).
+    """
+
+    def __init__(self, allocations=False):
+        self.allocations = allocations
+        self._active = 0
+        self._started_tracing = False
+        self._phases = {}
+        # time (ns) of the bookkeeping of a phase call, charged to the phase itself ("inner") and
+        # to its parent ("outer"), and blocks allocated per call by the bookkeeping, keyed by
+        # whether tracemalloc runs. Subtracted from the statistics.
+        self._time_overhead = {}
+        self._block_overhead = {}
+        if allocations:
+            self._enter, self._exit = self._enter_allocations, self._exit_allocations
+        else:
+            self._enter, self._exit = self._enter_time, self._exit_time
+        self.reset()
+        self._calibrate(False)
+
+    def reset(self):
+        """Clears the collected statistics."""
+        # stack -> [calls, time_ns, alloc_bytes, net_blocks] (np.array with allocations=True)
+        self.records = {}
+        # the entry of a phase is (stack, record, {name: entry of a nested phase})
+        self._root = ((), None, {})
+        # timings only: lists of the open entries and of their start times
+        self._stack = [self._root]
+        self._starts = []
+        # with allocations: the open entries by depth, and their [start time, start blocks, start
+        # traced memory, peak traced memory] in a preallocated array (row 0 is the root, its
+        # columns 0-2 are scratch space), so that the bookkeeping between the measurements of a
+        # phase does not allocate memory blocks itself
+        self._depth = 0
+        self._open = [self._root] * 16
+        self._counters = np.zeros((16, 4), dtype=np.int64)
+        return self
+
+    def _calibrate(self, tracing):
+        # the overheads of a phase whose record exists already, after a warm-up: the smallest of
+        # several runs of n empty phases nested in a phase
+        saved = self.records, self._root, self._stack, self._starts, self._depth, self._open, self._counters
+        self.reset()
+        self._time_overhead[tracing] = (0.0, 0.0)
+        self._block_overhead[tracing] = 0
+        n, inner, outer, blocks = 200, [], [], []
+        for repeat in range(6):
+            start = time.perf_counter_ns()
+            for _ in range(n):
+                pass
+            loop = time.perf_counter_ns() - start
+            with self.phase("calibration"):
+                for _ in range(n):
+                    with self.phase("empty"):
+                        pass
+            parent, child = self.records[("calibration",)], self.records[("calibration", "empty")]
+            if repeat > 0:
+                inner.append(int(child[1]) / n)
+                outer.append(max(int(parent[1]) - loop - int(child[1]), 0) / n)
+                blocks.append(int(child[3]) / n)
+            parent[:] = child[:] = [0, 0, 0, 0]
+        self._time_overhead[tracing] = (min(inner), min(outer))
+        self._block_overhead[tracing] = round(min(blocks)) if self.allocations else 0
+        self.records, self._root, self._stack, self._starts, self._depth, self._open, self._counters = saved
+
+    def __enter__(self):
+        if self._active == 0 and self.allocations and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+        self._active += 1
+        if self.allocations and tracemalloc.is_tracing() and True not in self._block_overhead:
+            self._calibrate(True)
+        return self
+
+    def __exit__(self, *args):
+        self._active -= 1
+        if self._active == 0 and self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+        return False
+
+    def phase(self, name):
+        """Context manager timing a phase, nested in the currently open phase."""
+        phase = self._phases.get(name)
+        if phase is None:
+            if not self.allocations:
+                phase = self._phases[name] = _Phase(self, name)
+                return phase
+            counters = self._counters
+            counters[0, 1] = sys.getallocatedblocks()
+            phase = self._phases[name] = _Phase(self, name)
+            counters[0, 2] = sys.getallocatedblocks()
+            counters[1:self._depth + 1, 1] += counters[0, 2] - counters[0, 1]
+        return phase
+
+    def _new_entry(self, parent, name):
+        stack = parent[0] + (name,)
+        record = self.records[stack] = np.zeros(4, dtype=np.int64) if self.allocations else [0, 0, 0, 0]
+        entry = parent[2][name] = (stack, record, {})
+        return entry
+
+    def _enter_time(self, name):
+        stack = self._stack
+        entry = stack[-1][2].get(name)
+        if entry is None:
+            entry = self._new_entry(stack[-1], name)
+        stack.append(entry)
+        self._starts.append(time.perf_counter_ns())
+
+    def _exit_time(self):
+        end = time.perf_counter_ns()
+        record = self._stack.pop()[1]
+        record[0] += 1
+        record[1] += end - self._starts.pop()
+
+    def _enter_allocations(self, name):
+        depth = self._depth + 1
+        counters = self._counters
+        entry = self._open[depth - 1][2].get(name)
+        if entry is None or depth == len(counters):
+            # a new record or deeper frames are not memory kept by the open phases
+            counters[0, 1] = sys.getallocatedblocks()
+            if entry is None:
+                entry = self._new_entry(self._open[depth - 1], name)
+            if depth == len(counters):
+                self._open = self._open + [self._root] * depth
+                counters = self._counters = np.concatenate((counters, np.zeros_like(counters)))
+            counters[0, 2] = sys.getallocatedblocks()
+            counters[1:depth, 1] += counters[0, 2] - counters[0, 1]
+        self._open[depth] = entry
+        self._depth = depth
+        if tracemalloc.is_tracing():
+            counters[depth, 2:] = tracemalloc.get_traced_memory()
+            counters[depth - 1, 3] = max(counters[depth - 1, 3], counters[depth, 3])
+            counters[depth, 3] = counters[depth, 2]
+            tracemalloc.reset_peak()
+        counters[depth, 1] = sys.getallocatedblocks()
+        counters[depth, 0] = time.perf_counter_ns()
+
+    def _exit_allocations(self):
+        counters = self._counters
+        counters[0, 0] = time.perf_counter_ns()
+        counters[0, 1] = sys.getallocatedblocks()
+        depth = self._depth
+        record = self._open[depth][1]
+        tracing = tracemalloc.is_tracing()
+        record[0] += 1
+        record[1] += counters[0, 0] - counters[depth, 0]
+        record[3] += counters[0, 1] - counters[depth, 1] - self._block_overhead.get(tracing, 0)
+        if tracing:
+            counters[depth, 3] = max(counters[depth, 3], tracemalloc.get_traced_memory()[1])
+            record[2] += counters[depth, 3] - counters[depth, 2]
+            counters[depth - 1, 3] = max(counters[depth - 1, 3], counters[depth, 3])
+        self._depth = depth - 1
+
+    def wrap(self, function, name=None):
+        """function timed as one phase (for functions without python source, e.g. builtins)."""
+        name = name or getattr(function, "__qualname__", repr(function))
+        phase = self.phase(name)
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with phase:
+                return function(*args, **kwargs)
+        return wrapper
+
+    def instrument_function(self, function, name=None, phases=None):
+        """Recompiled function that times itself as the phase name (default: its qualified name)
+        and its top-level statements as nested phases.
+
+        Parameters
+        ----------
+        phases : list of (phase name, marker), default=None
+            Groups the statements: phase i runs from the first statement (after the start of phase
+            i-1) whose first source line contains marker i up to the start of phase i+1. Statements
+            before the first phase are counted in the function itself. None: every statement is its
+            own phase, named by its first source line.
+
+        The closure variables of a nested function are copied, the instrumented function does not
+        share them (nonlocal assignments) with the original.
+        """
+        name = name or function.__qualname__
+        try:
+            source = textwrap.dedent(inspect.getsource(function))
+        except (OSError, TypeError):
+            return self.wrap(function, name)
+        tree = ast.parse(source)
+        definition = tree.body[0]
+        if not isinstance(definition, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            return self.wrap(function, name)  # lambdas
+        definition.decorator_list = []
+        code = function.__code__
+
+        body = definition.body
+        docstring = body[:1] if _is_docstring(body[0]) else []
+        declarations = [node for node in body[len(docstring):] if isinstance(node, (ast.Global, ast.Nonlocal))]
+        statements = [node for node in body[len(docstring):] if not isinstance(node, (ast.Global, ast.Nonlocal))]
+        instrumented = []
+        for label, group in _phase_groups(statements, phases, source, name):
+            instrumented += group if label is None else [_with_phase(label, group)]
+        if "__class__" in code.co_freevars:
+            # zero-argument super() needs __class__ among the free variables of the function
+            declarations.append(ast.Expr(ast.Name(id="__class__", ctx=ast.Load())))
+        definition.body = docstring + declarations + [_with_phase(name, instrumented)]
+
+        # the function is defined inside a factory taking the profiler and the closure variables
+        factory = ast.FunctionDef(
+            name="__instrumented__",
+            args=ast.arguments(
+                posonlyargs=[], args=[ast.arg(arg=var) for var in ("__profiler__",) + code.co_freevars],
+                kwonlyargs=[], kw_defaults=[], defaults=[],
+            ),
+            body=[definition, ast.Return(ast.Name(id=definition.name, ctx=ast.Load()))],
+            decorator_list=[],
+        )
+        module = ast.Module(body=[factory], type_ignores=[])
+        ast.fix_missing_locations(module)
+        ast.increment_lineno(module, code.co_firstlineno - 1)
+        namespace = {}
+        exec(compile(module, code.co_filename, "exec"), function.__globals__, namespace)
+        cells = [cell.cell_contents for cell in function.__closure__ or ()]
+        new_function = namespace["__instrumented__"](self, *cells)
+        new_function.__defaults__ = function.__defaults__
+        new_function.__kwdefaults__ = function.__kwdefaults__
+        return functools.update_wrapper(new_function, function)
+
+    def _instrument_attribute(self, value, name, phases):
+        if isinstance(value, staticmethod):
+            return staticmethod(self.instrument_function(value.__func__, name, phases))
+        if isinstance(value, classmethod):
+            return classmethod(self.instrument_function(value.__func__, name, phases))
+        if isinstance(value, property):
+            return property(self.instrument_function(value.fget, name, phases), value.fset, value.fdel, value.__doc__)
+        if inspect.isfunction(value):
+            return self.instrument_function(value, name, phases)
+        return self.wrap(value, name)
+
+    @contextlib.contextmanager
+    def instrument(self, target, spec):
+        """Instruments functions and methods of target (a module, class or object) while the
+        context is open, see instrument_function().
+
+        Parameters
+        ----------
+        target : module, class or object
+        spec : dict {dotted name: phases}
+            e.g. {"lif_update": [("leak", "I_leak ="), ...], "RingAttractorNetwork.forward": None}
+        """
+        patches = []
+        try:
+            for dotted, phases in spec.items():
+                *path, attribute = dotted.split(".")
+                owner = functools.reduce(getattr, path, target)
+                original = vars(owner)[attribute] if attribute in vars(owner) else getattr(owner, attribute)
+                instrumented = self._instrument_attribute(original, dotted, phases)
+                patches.append((owner, attribute, original))
+                setattr(owner, attribute, instrumented)
+            with self:
+                yield self
+        finally:
+            for owner, attribute, original in reversed(patches):
+                setattr(owner, attribute, original)
+
+    def stats(self):
+        """{stack (tuple of phase names): dict of calls, time (s), self_time (s), alloc_bytes,
+        self_alloc_bytes, net_blocks}, self values without the nested phases. The calibrated time
+        of the bookkeeping of the phase calls is subtracted from the times."""
+        inner, outer = self._time_overhead.get(self.allocations and True in self._time_overhead, (0.0, 0.0))
+        descendant_calls = {}
+        for stack, record in self.records.items():
+            for depth in range(1, len(stack)):
+                descendant_calls[stack[:depth]] = descendant_calls.get(stack[:depth], 0) + int(record[0])
+        corrected = {
+            stack: max(int(record[1]) - int(record[0]) * inner - descendant_calls.get(stack, 0) * (inner + outer), 0.0)
+            for stack, record in self.records.items()
+        }
+        children = {}
+        for stack, record in self.records.items():
+            if len(stack) > 1:
+                child = children.setdefault(stack[:-1], [0.0, 0])
+                child[0] += corrected[stack]
+                child[1] += int(record[2])
+        stats = {}
+        for stack, record in self.records.items():
+            calls, time_ns, alloc_bytes, net_blocks = (int(value) for value in record)
+            child_time, child_alloc = children.get(stack, (0.0, 0))
+            stats[stack] = {
+                "calls": calls,
+                "time": corrected[stack] * 1e-9,
+                "self_time": max(corrected[stack] - child_time, 0.0) * 1e-9,
+                "alloc_bytes": alloc_bytes,
+                "self_alloc_bytes": max(alloc_bytes - child_alloc, 0),
+                "net_blocks": net_blocks,
+            }
+        return stats
+
+    def report(self, min_fraction=0.0):
+        """Table of the phases as a tree, children sorted by time, leaving out phases taking less
+        than min_fraction of the total time."""
+        stats = self.stats()
+        total = sum(entry["time"] for stack, entry in stats.items() if len(stack) == 1) or 1.0
+        lines = [f"{'calls':>10} {'total ms':>11} {'self ms':>11} {'%':>6} {'alloc kB':>11} {'blocks':>8}  phase"]
+
+        def add(parent):
+            stacks = [stack for stack in stats if stack[:-1] == parent]
+            for stack in sorted(stacks, key=lambda stack: -stats[stack]["time"]):
+                entry = stats[stack]
+                if entry["time"] < min_fraction * total:
+                    continue
+                alloc = f"{entry['alloc_bytes'] / 1e3:>11.1f} {entry['net_blocks']:>8}" if self.allocations else f"{'-':>11} {'-':>8}"
+                lines.append(
+                    f"{entry['calls']:>10} {entry['time'] * 1e3:>11.3f} {entry['self_time'] * 1e3:>11.3f}"
+                    f" {100 * entry['time'] / total:>6.1f} {alloc}"
+                    f"  {'  ' * (len(stack) - 1)}{stack[-1]}"
+                )
+                add(stack)
+        add(())
+        return "\n".join(lines)
+
+    def collapsed(self, metric="time"):
+        """Collapsed stacks ("phase;nested phase;... value" lines) of the self values of a metric:
+        "time" (ns), "alloc_bytes" or "calls" (of the innermost phase)."""
+        key = {"time": "self_time", "alloc_bytes": "self_alloc_bytes", "calls": "calls"}[metric]
+        lines = []
+        for stack, entry in sorted(self.stats().items()):
+            value = int(round(entry[key] * 1e9)) if metric == "time" else int(entry[key])
+            if value > 0:
+                lines.append(";".join(name.replace(";", ",") for name in stack) + f" {value}")
+        return lines
+
+    def write_collapsed(self, path, metric="time"):
+        with open(path, "w") as f:
+            f.write("\n".join(self.collapsed(metric)) + "\n")
+
+
+class _Phase:
+    __slots__ = ("profiler", "name")
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.profiler._enter(self.name)
+        return self
+
+    def __exit__(self, *args):
+        self.profiler._exit()
+        return False
+
+
+def _is_docstring(node):
+    return isinstance(node, ast.Expr) and isinstance(node.value, ast.Constant) and isinstance(node.value.value, str)
+
+
+def _first_line(source, node):
+    return (ast.get_source_segment(source, node) or ast.unparse(node)).splitlines()[0].strip()
+
+
+def _phase_groups(statements, phases, source, name):
+    """[(phase name or None, statements)] of a function body, see Profiler.instrument_function()."""
+    if phases is None:
+        return [(_first_line(source, node)[:60], [node]) for node in statements]
+    starts, i = [], 0
+    for label, marker in phases:
+        while i < len(statements) and marker not in _first_line(source, statements[i]):
+            i += 1
+        if i == len(statements):
+            raise ValueError(f"{name}: no statement of phase {label!r} matches {marker!r}")
+        starts.append((i, label))
+        i += 1
+    groups = [(None, statements[:starts[0][0]])]
+    for (start, label), (stop, _) in zip(starts, starts[1:] + [(len(statements), None)]):
+        groups.append((label, statements[start:stop]))
+    return groups
+
+
+def _with_phase(label, body):
+    # with __profiler__.phase(label): body
+    call = ast.Call(
+        func=ast.Attribute(value=ast.Name(id="__profiler__", ctx=ast.Load()), attr="phase", ctx=ast.Load()),
+        args=[ast.Constant(value=label)], keywords=[],
+    )
+    node = ast.With(items=[ast.withitem(context_expr=call)], body=body or [ast.Pass()])
+    return ast.copy_location(node, body[0]) if body else node
+
+
+#
+# phases of the reference models (names as in benchmark.MODELS)
+#
+_LIF_PHASES = [
+    ("leak", "I_leak ="),
+    ("synaptic", "I_inh ="),
+    ("head_direction", "I_hd ="),
+    ("integrate", "x +="),
+    ("gates", "inh_gate +="),
+    ("reset", "x[x>theta]"),
+]
+_SEISMIC_PHASES = {
+    "RingAttractorNetwork.__init__": None,
+    "RingAttractorNetwork._create_weight_blocks": None,
+    "RingAttractorNetwork.update_parameterizations": None,
+    "RingAttractorNetwork.forward": [
+        ("inputs", "dt, velocity, landmarks ="),
+        ("parameters", "gain = self.gain_mask"),
+        ("activation", "neuron_activity ="),
+        ("weighted_input", "weighted_input ="),
+        ("landmark_input", "landmark_input ="),
+        ("velocity_input", "velocity_input ="),
+        ("integrate", "state = state +"),
+        ("noise", "if self.noise_function"),
+        ("output", "output_activity ="),
+    ],
+    "RingAttractorNetwork.calculate_weighted_input": None,
+    "RingAttractorNetwork.calculate_landmark_input": None,
+    "RingAttractorNetwork.calculate_velocity_input": None,
+}
+REFERENCE_PHASES = {
+    "sebastian": {"update_activations": None},
+    "neurorishika_2_4": {"lif_update": _LIF_PHASES},
+    "neurorishika_classical": {"lif_update": _LIF_PHASES},
+    "waves": {
+        "ContinuousAttractorLayer.__init__": None,
+        "ContinuousAttractorLayer.update": None,
+        "ContinuousAttractorLayer._update_place_cell_synapses": None,
+        "ContinuousAttractorLayer._update_place_cell_activations": None,
+        "ContinuousAttractorLayer.peak": None,
+    },
+    "neuro_gpr": {
+        "CANN.__init__": [("parameters", "self.num ="), ("weights", "for i in range(self.num - 1)")],
+        "CANN.update": None,
+        "CANN.get_stimulus_by_pos": None,
+        "int_u": [("rate", "cann_num ="), ("recurrent", "Irec ="), ("derivative", "du =")],
+    },
+    "hippocampi": {
+        "CAN.__init__": None,
+        "CAN._generate_weights": [
+            ("grid", "half_length ="), ("distances", "shifted_grid ="), ("center_surround", "weights ="),
+        ],
+        "CAN._get_envelope": None,
+        "CAN.forward": [
+            ("velocity_input", "b = torch.einsum"),
+            ("envelope", "if (not self.periodic)"),
+            ("recurrent", "state = torch.einsum"),
+            ("activation", "state = self.activation"),
+            ("integrate", "state_step ="),
+        ],
+    },
+    "seismic": _SEISMIC_PHASES,
+    "seismic_no_split": _SEISMIC_PHASES,
+    "xuelong": {
+        "InsectBrainPopulation.cue_integration_output": [
+            ("initial_state", "x = np.zeros"), ("iterate", "for t in range"), ("output", "self.integration_neuron ="),
+        ],
+        "noisy_sigmoid": None,
+    },
+    "drugowitsch": {
+        "RingAttractorNetwork.propagate_onestep": [
+            ("unpack", "tau = self.tau"),
+            ("small_ring", "if self.N < 3"),
+            ("neighbours", "r_prev, r_next, x, x_odd ="),
+            ("recurrent", "np.add(r_prev, r_next"),
+            ("global_inhibition", "x -= beta"),
+            ("input", "x += I"),
+            ("activation", "drive ="),
+            ("integrate", "r *="),
+        ],
+    },
+    "rat_in_a_box": {
+        "NetworkScheduler.run": None,
+        "PyramidalNeurons.update": None,
+        "PyramidalNeurons.get_state": None,
+        "PyramidalNeurons.update_weights": None,
+        "DendriticCompartment.update": None,
+        "DendriticCompartment.get_state": None,
+        "DendriticCompartment.activate": None,
+        "DendriticCompartment.update_weights": None,
+    },
+}
+
+
+def profile_reference(model, n, T, allocations=False, seed=0, profiler=None):
+    """Profiles the benchmark setup (model construction) and T steps of a reference model.
+    Returns the Profiler."""
+    import benchmark
+    setup = benchmark.MODELS[model][0]
+    profiler = profiler or Profiler(allocations=allocations)
+    load_reference = benchmark.load_reference
+    with contextlib.ExitStack() as stack:
+        # the module is instrumented as soon as the setup has loaded it, before the model is built
+        def load_instrumented(*args, **kwargs):
+            module = load_reference(*args, **kwargs)
+            stack.enter_context(profiler.instrument(module, REFERENCE_PHASES[model]))
+            return module
+        benchmark.load_reference = load_instrumented
+        stack.callback(setattr, benchmark, "load_reference", load_reference)
+        stack.enter_context(profiler)
+        with profiler.phase(model):
+            with profiler.phase("setup"):
+                run, _ = setup(n, np.random.default_rng(seed))
+            with profiler.phase("run"):
+                run(T)
+    return profiler
+
+
+def profile_port(model, n, T, backend="numpy", batch=1, allocations=False, seed=0, profiler=None):
+    """Profiles T steps of the simulator port of a model (simulator_models.PORTS). Returns the Profiler."""
+    from simulator import Simulator
+    from simulator_models import PORTS
+    profiler = profiler or Profiler(allocations=allocations)
+    with profiler, profiler.phase(model):
+        with profiler.phase("setup"):
+            simulator = Simulator(PORTS[model](n), backend=backend, batch=batch, seed=seed, profiler=profiler)
+        with profiler.phase("run"):
+            simulator.run(T)
+    return profiler
+
+
+def main(argv=None):
+    import benchmark
+    parser = argparse.ArgumentParser(description="Profile the phases of a ring attractor reference model.")
+    parser.add_argument("model", choices=list(benchmark.MODELS))
+    parser.add_argument("--n", type=int, default=256, help="number of neurons")
+    parser.add_argument("--T", type=int, default=1000, help="number of steps")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--allocations", action="store_true", help="trace allocations (slower)")
+    parser.add_argument("--port", action="store_true", help="profile the simulator port instead of the reference")
+    parser.add_argument("--backend", default="numpy", choices=["numpy", "torch"], help="backend of the port")
+    parser.add_argument("--batch", type=int, default=1, help="batch size of the port")
+    parser.add_argument("--min-fraction", type=float, default=0.001, help="hide phases below this fraction of the time")
+    parser.add_argument("--out", help="file for the collapsed stacks (flame graph input)")
+    parser.add_argument("--metric", default="time", choices=["time", "alloc_bytes", "calls"])
+    args = parser.parse_args(argv)
+
+    if args.port:
+        profiler = profile_port(args.model, args.n, args.T, args.backend, args.batch, args.allocations, args.seed)
+    else:
+        profiler = profile_reference(args.model, args.n, args.T, args.allocations, args.seed)
+    print(profiler.report(args.min_fraction))
+    if args.out:
+        profiler.write_collapsed(args.out, args.metric)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
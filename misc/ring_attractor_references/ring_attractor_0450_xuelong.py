@@ -4,8 +4,10 @@
 # @Author: Xuelong Sun, UoL, UK
 # @Time: 2020-02-17
 
+import time
 import numpy as np
-import random
+from concurrent.futures import ProcessPoolExecutor
+from scipy import sparse
 from scipy.special import expit
 
 
@@ -35,17 +37,20 @@ class MushroomBodyModel(object):
         self.r_en = np.zeros(self.num_en)
 
         # weights
-        self.w_pn2kc = generate_pn2kc_weights(self.num_pn,self.num_kc)
+        self.w_pn2kc = generate_pn2kc_weights_sparse(self.num_pn, self.num_kc)
         self.w_kc2en = np.ones([self.num_kc, self.num_en])
 
         # learning control
         self.reward = False
 
     def generate_w_pn2kc(self):
-        w = np.zeros([self.num_pn, self.num_kc])
-        for i in range(self.num_kc):
-            random_index = random.sample(range(self.num_pn), self.num_pn_per_kc)
-            w[random_index, i] = 1.0
+        # every KC draws 'self.num_pn_per_kc' distinct PNs: the smallest keys of a random
+        # (num_kc, num_pn) matrix, found for all KCs with a single argpartition
+        keys = np.random.random_sample((self.num_kc, self.num_pn))
+        pn_index = np.argpartition(keys, self.num_pn_per_kc - 1, axis=1)[:, :self.num_pn_per_kc]
+        kc_index = np.repeat(np.arange(self.num_kc), self.num_pn_per_kc)
+        w = sparse.csr_matrix((np.ones(kc_index.size), (pn_index.ravel(), kc_index)),
+                              shape=(self.num_pn, self.num_kc))
         return w
 
     def run(self, stimuli):
@@ -53,7 +58,7 @@ class MushroomBodyModel(object):
         # PN directly receive the stimuli's input
         self.r_pn = self.af_pn(self.stimuli)
         # KC receive randomsly selected 'self.num_pn_per_kc' PNs input
-        self.r_kc = self.af_kc(self.r_pn.dot(self.w_pn2kc))
+        self.r_kc = self.af_kc(self.r_pn @ self.w_pn2kc)
         # EN summed all KCs's activation via the weights
         self.r_en = self.af_en(self.r_kc.dot(self.w_kc2en))
 
@@ -78,6 +83,45 @@ class MushroomBodyModel(object):
         temp = (kc >= self.w_kc2en[:, 0]).astype(bool)
         self.w_kc2en[:, 0][temp] = np.maximum(self.w_kc2en[:, 0][temp] - self.learning_rate, 0)
 
+    def run_batch(self, stimuli):
+        """
+        Same as run() for a batch of stimuli of shape (B, num_pn), e.g. all the views of a route.
+        The PN->KC product goes through the sparse connectivity and the KC activity is returned packed
+        along the KC axis (np.unpackbits(r_kc, axis=1, count=self.num_kc) recovers it).
+        If self.reward is set, every view is evaluated with the KC->EN weights left by the views before it,
+        exactly as calling run() in a loop, and the weights are then updated in one step.
+        :param stimuli: array of shape (B, num_pn)
+        :return: (r_en of shape (B, num_en), packed r_kc of shape (B, ceil(num_kc / 8)))
+        """
+        r_pn = self.af_pn(np.atleast_2d(stimuli))
+        r_kc = np.asarray(r_pn @ self.w_pn2kc) > self.tau
+
+        if self.reward:
+            # number of earlier views of the batch that already depressed each KC->EN synapse
+            seen = np.cumsum(r_kc, axis=0, dtype=np.int32) - r_kc
+            w_en = np.maximum(self.w_kc2en[:, 0] - self.learning_rate * seen, 0)
+            r_en = np.sum(w_en, axis=1, where=r_kc)[:, np.newaxis]
+            if self.num_en > 1:
+                r_en = np.hstack([r_en, r_kc @ self.w_kc2en[:, 1:]])
+            r_en = self.af_en(r_en)
+            r_kc = np.packbits(r_kc, axis=1)
+            self.learning_batch(r_kc)
+        else:
+            r_en = self.af_en(r_kc @ self.w_kc2en)
+            r_kc = np.packbits(r_kc, axis=1)
+
+        return r_en, r_kc
+
+    def learning_batch(self, kc):
+        """
+        Applies learning() for a whole batch of rewarded views at once: a KC that fired in n of the views
+        loses n * learning_rate of its KC->EN weight (floored at 0).
+        :param kc: packed KC activity of shape (B, ceil(num_kc / 8)), as returned by run_batch()
+        """
+        counts = np.unpackbits(kc, axis=1, count=self.num_kc).sum(axis=0)
+        active = counts > 0
+        self.w_kc2en[active, 0] = np.maximum(self.w_kc2en[active, 0] - self.learning_rate * counts[active], 0)
+
     def reset(self):
         # initialization
         self.stimuli = np.zeros(self.num_stimuli)
@@ -141,6 +185,10 @@ class AOTuVisualPathwayModel(object):
         self.error = []
         self.learning_rate = []
 
+        # bumped on every weight update, invalidates the cached weights of nn_output_batch()
+        self._weights_version = 0
+        self._inference_cache = None
+
     def forward_propagation(self):
         self.layer1_z = np.dot(self.input, self.weight1)
         self.layer1_a = sigmoid(self.layer1_z)
@@ -154,6 +202,111 @@ class AOTuVisualPathwayModel(object):
         delta_weight1 = np.dot(self.input.T, np.dot(delta, self.weight2.T) * self.layer1_a * (1 - self.layer1_a))
         self.weight1 += delta_weight1 * learning_rate
         self.weight2 += delta_weight2 * learning_rate
+        self._weights_version += 1
+
+    def train(self, x=None, y=None, epochs=100, batch_size=256, learning_rate=1.0, lr_decay=1.0, patience=None,
+              min_delta=0.0, dtype=np.float32, shuffle=True, seed=None, callback=None):
+        """
+        mini-batch training with the same update as back_propagation() (summed over the samples of a batch)
+        :param x: the views, array of shape (samples, inputs). Can be a np.memmap (or np.load(..., mmap_mode='r')),
+                  only one batch is read into memory at a time. Defaults to self.input
+        :param y: the desired headings, array of shape (samples, outputs). Defaults to self.y
+        :param epochs: the maximum number of passes over the data
+        :param batch_size: the number of samples per update
+        :param learning_rate: the learning rate of the first epoch
+        :param lr_decay: the learning rate is multiplied by this after every epoch
+        :param patience: stop when the loss has not improved by more than min_delta for this many epochs
+        :param min_delta:
+        :param dtype: the dtype of the computation (None: the dtype of self.weight1). The weights are trained on
+                      copies in this dtype and written back into self.weight1/weight2, in their own dtype, after
+                      every epoch
+        :param shuffle: visit the batches in a random order every epoch (the samples inside a batch stay
+                        contiguous so that memory-mapped data is read sequentially)
+        :param seed:
+        :param callback: called as callback(epoch, loss, seconds) after every epoch
+        :return: list of (loss, seconds) per epoch, the loss is the mean squared error over the epoch
+        """
+        if x is None:
+            x, y = self.input, self.y
+        sample_num = x.shape[0]
+        rnd = np.random.default_rng(seed)
+
+        if dtype is None:
+            dtype = self.weight1.dtype
+        # the trained weights, the same arrays as self.weight1/weight2 when these already have the dtype
+        weight1 = self.weight1.astype(dtype, copy=False)
+        weight2 = self.weight2.astype(dtype, copy=False)
+
+        # buffers reused by every batch
+        batch_size = min(batch_size, sample_num)
+        n_out = weight2.shape[1]
+        buffers = {
+            "x": np.empty((batch_size, weight1.shape[0]), dtype=dtype),
+            "y": np.empty((batch_size, n_out), dtype=dtype),
+            "layer1": np.empty((batch_size, self.num_neurons), dtype=dtype),
+            "layer2": np.empty((batch_size, n_out), dtype=dtype),
+            "delta1": np.empty((batch_size, self.num_neurons), dtype=dtype),
+            "delta2": np.empty((batch_size, n_out), dtype=dtype),
+        }
+        grad1 = np.empty_like(weight1)
+        grad2 = np.empty_like(weight2)
+
+        history = []
+        best_loss, stale = np.inf, 0
+        starts = np.arange(0, sample_num, batch_size)
+        for epoch in range(epochs):
+            start_time = time.perf_counter()
+            if shuffle:
+                rnd.shuffle(starts)
+            squared_error = 0.0
+            for start in starts:
+                stop = min(start + batch_size, sample_num)
+                b = {key: value[:stop - start] for key, value in buffers.items()}
+                b["x"][:] = x[start:stop]
+                b["y"][:] = y[start:stop]
+                # forward
+                _sigmoid_(np.matmul(b["x"], weight1, out=b["layer1"]))
+                _sigmoid_(np.matmul(b["layer1"], weight2, out=b["layer2"]))
+                # backward, delta2 = 2 (y - out) out (1 - out)
+                np.subtract(b["y"], b["layer2"], out=b["delta2"])
+                squared_error += float(np.vdot(b["delta2"], b["delta2"]))
+                b["delta2"] *= b["layer2"]
+                np.subtract(1, b["layer2"], out=b["layer2"])
+                b["delta2"] *= b["layer2"]
+                b["delta2"] *= 2.0
+                np.matmul(b["delta2"], weight2.T, out=b["delta1"])
+                b["delta1"] *= b["layer1"]
+                np.matmul(b["layer1"].T, b["delta2"], out=grad2)
+                np.subtract(1, b["layer1"], out=b["layer1"])
+                b["delta1"] *= b["layer1"]
+                np.matmul(b["x"].T, b["delta1"], out=grad1)
+                # update
+                grad1 *= learning_rate
+                grad2 *= learning_rate
+                weight1 += grad1
+                weight2 += grad2
+            if weight1 is not self.weight1:
+                self.weight1[...] = weight1
+            if weight2 is not self.weight2:
+                self.weight2[...] = weight2
+            self._weights_version += 1
+
+            loss = squared_error / (sample_num * n_out)
+            seconds = time.perf_counter() - start_time
+            self.error.append(loss)
+            self.learning_rate.append(learning_rate)
+            history.append((loss, seconds))
+            if callback is not None:
+                callback(epoch, loss, seconds)
+
+            learning_rate *= lr_decay
+            if loss < best_loss - min_delta:
+                best_loss, stale = loss, 0
+            else:
+                stale += 1
+                if patience is not None and stale >= patience:
+                    break
+        return history
 
     def nn_output(self, x):
         layer1 = sigmoid(np.dot(x, self.weight1))
@@ -161,6 +314,21 @@ class AOTuVisualPathwayModel(object):
         # reverse the direction (+pi)
         return np.roll(out, 4)
 
+    def nn_output_batch(self, x, batch_size=4096):
+        """
+        nn_output() for many views at once, x is of shape (views, inputs), returns (views, outputs).
+        The +pi reversal is folded into a column-rolled copy of weight2 that is cached until the weights change.
+        """
+        if self._inference_cache is None or self._inference_cache[0] != self._weights_version:
+            self._inference_cache = (self._weights_version, np.roll(self.weight2, 4, axis=1))
+        weight2 = self._inference_cache[1]
+        x = np.atleast_2d(x)
+        out = np.empty((x.shape[0], weight2.shape[1]), dtype=np.result_type(x, weight2))
+        for start in range(0, x.shape[0], batch_size):
+            layer1 = _sigmoid_(np.dot(x[start:start + batch_size], self.weight1))
+            out[start:start + batch_size] = _sigmoid_(np.dot(layer1, weight2))
+        return out
+
 
 class CentralComplexModel(object):
     """Class for the CX of current heading (PB), cue integration (FB) and steering circuit (FB).
@@ -307,6 +475,28 @@ class RingAttractorModel(object):
         self.integration_neuron = np.zeros(16)
         self.inhibition_neuron = np.zeros(2)
 
+        # steady state solver: the excitatory/inhibitory coupling of one hemisphere as a single (9, 9) matrix,
+        # the euler step is then x += (max(0, x W^T + bias + cue) - x) * dt / tau on preallocated buffers
+        n = self.num_neuron
+        W = np.zeros((n + 1, n + 1))
+        W[:n, :n] = self.W_E_E
+        W[:n, n] = self.W_E_I
+        W[n, :n] = self.W_I_E
+        W[n, n] = self.W_I_I
+        self._W_T = W.T.copy()
+        self._bias = np.hstack([np.full(n, self.gammaE), self.gammaI])
+        self._rate = np.hstack([np.full(n, self.dt / self.tauE), self.dt / self.tauI])
+        self._x = np.zeros((2, n + 1))
+        self._cue = np.zeros((2, n + 1))
+        self._drive = np.zeros((2, n + 1))
+        self._dx = np.zeros((2, n + 1))
+        # early exit once no neuron changes by more than tol in one step
+        self.tol = 1e-8
+        # cue inputs are rounded to this resolution and the results memoized (None disables the cache)
+        self.cue_quantum = 1e-4
+        self.cache_size = 4096
+        self._cache = {}
+
     def _generate_w_e2e(self):
         wEE = np.zeros((self.num_neuron, self.num_neuron))
         sigma = 130
@@ -325,56 +515,226 @@ class RingAttractorModel(object):
         :param cue2: the activation of cue1 - an array with size 16x1
         :return: the optimal integration of cue1 and cue2, an array with the same size as cue1 and cue2
         """
-        pi_left = cue1[0:8]
-
-        pi_l = np.zeros((self.num_neuron, int(self.nt)))
-        pi_l[:, int(self.ni):] = np.repeat(pi_left.reshape(self.num_neuron, 1), int(self.nt - self.ni), axis=1)
-
-        pi_right = cue1[8:]
-        pi_r = np.zeros((self.num_neuron, int(self.nt)))
-        pi_r[:, int(self.ni):] = np.repeat(pi_right.reshape(self.num_neuron, 1), int(self.nt - self.ni), axis=1)
-
-        v_left = cue2[0:8]
-        v_l = np.zeros((self.num_neuron, int(self.nt)))
-        v_l[:, int(self.ni):] = np.repeat(v_left.reshape(self.num_neuron, 1), int(self.nt - self.ni), axis=1)
-        v_right = cue2[8:]
-        v_r = np.zeros((self.num_neuron, int(self.nt)))
-        v_r[:, int(self.ni):] = np.repeat(v_right.reshape(self.num_neuron, 1), int(self.nt - self.ni), axis=1)
-
-        # generate the array for integration cells and the uniform inhibitory cell
-        it_l = np.zeros((self.num_neuron, int(self.nt)))
-        it_l[:, 0] = 0.1 * np.ones(self.num_neuron, )
-        it_r = np.zeros((self.num_neuron, int(self.nt)))
-        it_r[:, 0] = 0.1 * np.ones(self.num_neuron, )
-        ul = np.zeros((1, int(self.nt)))
-        ur = np.zeros((1, int(self.nt)))
-        # iteration to the stable state
+        # quantize the cues so that agents revisiting the same inputs hit the cache
+        if self.cue_quantum:
+            cue1 = np.round(np.asarray(cue1) / self.cue_quantum) * self.cue_quantum
+            cue2 = np.round(np.asarray(cue2) / self.cue_quantum) * self.cue_quantum
+            key = cue1.tobytes() + cue2.tobytes()
+            if key in self._cache:
+                integration_neuron, inhibition_neuron = self._cache[key]
+                self.integration_neuron = integration_neuron.copy()
+                self.inhibition_neuron = inhibition_neuron.copy()
+                return self.integration_neuron
+
+        # left and right hemisphere in one (2, 9) state: 8 integration cells and the uniform inhibitory cell
+        x = self._x
+        x[:, :self.num_neuron] = 0.1
+        x[:, self.num_neuron] = 0.0
+        cue = self._cue
+        cue[:] = self._bias
+        cue[:, :self.num_neuron] += (cue1 + cue2).reshape(2, self.num_neuron)
+
+        # iteration to the stable state, the cues are only injected after self.ni steps
+        drive, dx = self._drive, self._dx
         for t in range(1, int(self.nt)):
-            it_l[:, t] = it_l[:, t - 1] + (-it_l[:, t - 1] + np.max(
-                [np.zeros((self.num_neuron,)),
-                 self.gammaE + np.dot(self.W_E_E, it_l[:, t - 1]) + self.W_E_I * ul[:, t - 1] + pi_l[:, t - 1]
-                 + v_l[:, t - 1]], axis=0)) * self.dt / self.tauE
-            ul[:, t] = ul[:, t - 1] + (
-                    -ul[:, t - 1] + np.max([0, self.gammaI + self.W_I_E * np.sum(it_l[:, t - 1]) + self.W_I_I * ul[:, t - 1]],
-                                           axis=0)) * self.dt / self.tauI
-
-            it_r[:, t] = it_r[:, t - 1] + (-it_r[:, t - 1] + np.max(
-                [np.zeros((self.num_neuron,)),
-                 self.gammaE + np.dot(self.W_E_E, it_r[:, t - 1]) + self.W_E_I * ur[:, t - 1] + pi_r[:, t - 1]
-                 + v_r[:, t - 1]], axis=0)) * self.dt / self.tauE
-            ur[:, t] = ur[:, t - 1] + (
-                    -ur[:, t - 1] + np.max([0, self.gammaI + self.W_I_E * np.sum(it_r[:, t - 1]) + self.W_I_I * ur[:, t - 1]],
-                                           axis=0)) * self.dt / self.tauI
+            bias = self._bias if t - 1 < self.ni else cue
+            np.matmul(x, self._W_T, out=drive)
+            drive += bias
+            np.maximum(drive, 0, out=drive)
+            np.subtract(drive, x, out=dx)
+            dx *= self._rate
+            x += dx
+            if t > self.ni and np.abs(dx, out=dx).max() < self.tol:
+                break
 
         # get the final iteration as the output
         # update the neuron activation
-        self.integration_neuron = np.hstack([it_l[:, -1], it_r[:, -1]])
-        self.integration_neuron = noisy_sigmoid(self.integration_neuron, 5.0, 2.5, 0)
-        self.inhibition_neuron = np.hstack([ul[-1], ur[-1]])
+        self.integration_neuron = noisy_sigmoid(x[:, :self.num_neuron].ravel(), 5.0, 2.5, 0)
+        self.inhibition_neuron = x[:, self.num_neuron].copy()
+
+        if self.cue_quantum:
+            if len(self._cache) >= self.cache_size:
+                del self._cache[next(iter(self._cache))]
+            self._cache[key] = (self.integration_neuron.copy(), self.inhibition_neuron.copy())
 
         return self.integration_neuron
 
 
+class InsectBrainPopulation(object):
+    """
+    class for stepping a population of N agents together: the state of every agent is a row of (N, 8)/(N, 16)
+    arrays and every circuit stage of the CentralComplexModel, MushroomBodyModel and RingAttractorModel is
+    evaluated for all the agents with one batched operation. The fixed connectivity is stored once, only the
+    KC->EN weights (which are learned) are kept per agent.
+
+    :param dtype: the dtype of the per-agent KC->EN weights, float64 like MushroomBodyModel. np.float32 halves
+                  their memory (num_agents x num_kc), but the learned weights then drift from the per-agent model
+                  by the float32 rounding.
+    """
+    def __init__(self, num_agents, mb_learning_rate=0.1, mb_tau=0.04, num_pn=81, num_kc=4000, dtype=np.float64):
+        self.num_agents = num_agents
+        # shared circuits, only used for their parameters and connectivity
+        self.cx = CentralComplexModel()
+        self.mb = MushroomBodyModel(mb_learning_rate, mb_tau, num_pn=num_pn, num_kc=num_kc)
+        self.ra = RingAttractorModel()
+
+        # connection weights, transposed once so that the stages are (N, pre) @ (pre, post) products
+        self.W_CL1_TB1_T = self.cx.W_CL1_TB1.T.copy()
+        self.W_TB1_TB1_T = self.cx.W_TB1_TB1.T.copy()
+        self.W_DH_CPU1a_T = self.cx.W_DH_CPU1a.T.astype(float)
+        self.W_CH_CPU1a_T = self.cx.W_CH_CPU1a.T.copy()
+        self.W_DH_CPU1b_T = self.cx.W_DH_CPU1b.T.astype(float)
+        self.W_CH_CPU1b_T = self.cx.W_CH_CPU1b.T.astype(float)
+        self.W_CPU1a_motor_T = self.cx.W_CPU1a_motor.T.astype(float)
+        self.W_CPU1b_motor_T = self.cx.W_CPU1b_motor.T.astype(float)
+
+        # global current heading
+        self.tl2 = np.zeros([num_agents, 16])
+        self.cl1 = np.zeros([num_agents, 16])
+        self.I_tb1 = np.zeros([num_agents, 8])
+        # local current heading
+        self.II_tb1 = np.zeros([num_agents, 8])
+        # steering circuit
+        self.desired_heading_memory = np.zeros([num_agents, 16])
+        self.current_heading_memory = np.zeros([num_agents, 8])
+        self.cpu1a = np.zeros([num_agents, 14])
+        self.cpu1b = np.zeros([num_agents, 2])
+        self.cpu1 = np.zeros([num_agents, 16])
+        self.motor = np.zeros([num_agents, 2])
+        self.motor_value = np.zeros(num_agents)
+        # mushroom body, one row of KC->EN weights per agent
+        self.w_kc2en = np.ones([num_agents, num_kc], dtype=dtype)
+        self.r_en = np.zeros(num_agents)
+        self.reward = np.zeros(num_agents, dtype=bool)
+        # ring attractor
+        self.integration_neuron = np.zeros([num_agents, 16])
+        self.inhibition_neuron = np.zeros([num_agents, 2])
+
+        # other para
+        self.noise = 0.0
+
+    def global_current_heading(self, theta):
+        """batched CentralComplexModel.global_current_heading, theta is an array of shape (N,)"""
+        output = np.cos(np.asarray(theta)[:, np.newaxis] - self.cx.tl2_prefs)
+        self.tl2 = noisy_sigmoid(output, 6.8, 3.0, self.noise)
+        self.cl1 = noisy_sigmoid(-self.tl2, 3.0, -0.5, self.noise)
+        prop_cl1 = 0.667  # Proportion of input from CL1 vs TB1
+        prop_I_tb1 = 1.0 - prop_cl1
+        output = (prop_cl1 * (self.cl1 @ self.W_CL1_TB1_T) -
+                  prop_I_tb1 * (self.I_tb1 @ self.W_TB1_TB1_T))
+        self.I_tb1 = noisy_sigmoid(output, 5.0, 0.0, self.noise)
+        return self.I_tb1
+
+    def local_current_heading(self, phase):
+        """batched CentralComplexModel.local_current_heading, phase (in degrees) is an array of shape (N,)"""
+        vc_mem_ring = np.cos(np.deg2rad(np.asarray(phase))[:, np.newaxis] - self.cx.phase_prefs)
+        self.II_tb1 = 1 / (1 + np.exp(-vc_mem_ring * 3 - 1.0))
+        return self.II_tb1
+
+    def steering_circuit_out(self):
+        """batched CentralComplexModel.steering_circuit_out, returns the motor values of shape (N,)"""
+        current_heading = 1.0 - self.current_heading_memory
+        inputs = (self.desired_heading_memory @ self.W_DH_CPU1a_T) * (current_heading @ self.W_CH_CPU1a_T)
+        self.cpu1a = noisy_sigmoid(inputs, 5.0, 2.5, self.noise)
+        inputs = (self.desired_heading_memory @ self.W_DH_CPU1b_T) * (current_heading @ self.W_CH_CPU1b_T)
+        self.cpu1b = noisy_sigmoid(inputs, 5.0, 2.5, self.noise)
+
+        self.cpu1 = np.hstack([self.cpu1b[:, -1:], self.cpu1a, self.cpu1b[:, :1]])
+
+        self.motor = self.cpu1a @ self.W_CPU1a_motor_T + self.cpu1b @ self.W_CPU1b_motor_T
+        self.motor_value = (self.motor[:, 0] - self.motor[:, 1]) * 0.25
+        return self.motor_value
+
+    def mushroom_body_output(self, stimuli):
+        """
+        batched MushroomBodyModel.run, every agent views one stimulus (stimuli is of shape (N, num_pn)) through
+        the shared PN->KC connectivity and its own KC->EN weights. Agents with self.reward set learn.
+        """
+        r_pn = self.mb.af_pn(stimuli)
+        r_kc = np.asarray(r_pn @ self.mb.w_pn2kc) > self.mb.tau
+        self.r_en = self.mb.af_en(np.sum(self.w_kc2en, axis=1, where=r_kc))
+        if self.reward.any():
+            learn = r_kc & self.reward[:, np.newaxis]
+            np.subtract(self.w_kc2en, self.mb.learning_rate, out=self.w_kc2en, where=learn)
+            np.maximum(self.w_kc2en, 0, out=self.w_kc2en)
+        return self.r_en
+
+    def cue_integration_output(self, cue1, cue2):
+        """
+        batched RingAttractorModel.cue_integration_output, cue1 and cue2 are of shape (N, 16). The cues are quantised
+        and looked up in the cache of self.ra like in the single-agent model, the distinct cues left are iterated
+        together and every one of them is frozen once none of its neurons moves by more than self.ra.tol, so every
+        agent gets the output of RingAttractorModel.cue_integration_output, whatever the rest of the batch.
+        """
+        ra = self.ra
+        n = ra.num_neuron
+        cue1 = np.asarray(cue1).reshape(self.num_agents, 2 * n)
+        cue2 = np.asarray(cue2).reshape(self.num_agents, 2 * n)
+        if ra.cue_quantum:
+            cue1 = np.round(cue1 / ra.cue_quantum) * ra.cue_quantum
+            cue2 = np.round(cue2 / ra.cue_quantum) * ra.cue_quantum
+        integration_neuron = np.empty((self.num_agents, 2 * n))
+        inhibition_neuron = np.empty((self.num_agents, 2))
+        # agents -> rows of the distinct cues missing from the cache, first agent of every row
+        rows = {}
+        agents = []
+        agent_rows = np.full(self.num_agents, -1)
+        for i in range(self.num_agents):
+            key = cue1[i].tobytes() + cue2[i].tobytes()
+            if ra.cue_quantum and key in ra._cache:
+                integration_neuron[i], inhibition_neuron[i] = ra._cache[key]
+            else:
+                if key not in rows:
+                    rows[key] = len(agents)
+                    agents.append(i)
+                agent_rows[i] = rows[key]
+
+        m = len(agents)
+        x = np.zeros((m, 2, n + 1))
+        x[:, :, :n] = 0.1
+        cue = np.empty_like(x)
+        cue[:] = ra._bias
+        cue[:, :, :n] += (cue1[agents] + cue2[agents]).reshape(m, 2, n)
+        drive = np.empty_like(x)
+        dx = np.empty_like(x)
+        # the final states, and the rows still iterated (x, cue, drive and dx only hold these)
+        x_final = np.empty_like(x)
+        active = np.arange(m)
+
+        for t in range(1, int(ra.nt)):
+            if not active.size:
+                break
+            bias = ra._bias if t - 1 < ra.ni else cue
+            np.matmul(x, ra._W_T, out=drive)
+            drive += bias
+            np.maximum(drive, 0, out=drive)
+            np.subtract(drive, x, out=dx)
+            dx *= ra._rate
+            x += dx
+            if t > ra.ni:
+                converged = np.abs(dx, out=dx).max(axis=(1, 2)) < ra.tol
+                if converged.any():
+                    x_final[active[converged]] = x[converged]
+                    keep = ~converged
+                    active, x, cue = active[keep], x[keep], cue[keep]
+                    drive, dx = drive[:active.size], dx[:active.size]
+        x_final[active] = x
+
+        rows_integration = noisy_sigmoid(x_final[:, :, :n].reshape(m, 2 * n), 5.0, 2.5, 0)
+        rows_inhibition = x_final[:, :, n]
+        if ra.cue_quantum:
+            for key, row in rows.items():
+                if len(ra._cache) >= ra.cache_size:
+                    del ra._cache[next(iter(ra._cache))]
+                ra._cache[key] = (rows_integration[row].copy(), rows_inhibition[row].copy())
+        missing = agent_rows >= 0
+        integration_neuron[missing] = rows_integration[agent_rows[missing]]
+        inhibition_neuron[missing] = rows_inhibition[agent_rows[missing]]
+        self.integration_neuron = integration_neuron
+        self.inhibition_neuron = inhibition_neuron
+        return self.integration_neuron
+
+
 def generate_pn2kc_weights(nb_pn, nb_kc, min_pn=10, max_pn=20, aff_pn2kc=None, nb_trials=100000, baseline=25000,
                            rnd=np.random.RandomState(2018), dtype=np.float32):
     """
@@ -432,6 +792,95 @@ def generate_pn2kc_weights(nb_pn, nb_kc, min_pn=10, max_pn=20, aff_pn2kc=None, n
     return best_pn2kc
 
 
+def generate_pn2kc_weights_sparse(nb_pn, nb_kc, min_pn=10, max_pn=20, aff_pn2kc=None, nb_trials=100000,
+                                  baseline=25000, seed=2018, dtype=np.float32, n_jobs=1, chunk_size=256):
+    """
+    Vectorized version of generate_pn2kc_weights() that returns a scipy.sparse CSR matrix of shape (nb_pn, nb_kc).
+    Every trial draws all the afferents with one argpartition and the dispersion is checked on integer counts,
+    so no dense (nb_pn, nb_kc) matrix is kept per trial. Trial t is always sampled from the generator seeded
+    with [seed, t], which makes the result reproducible whatever the number of processes.
+
+    :param nb_pn:       the number of the Projection Neurons (PNs)
+    :param nb_kc:       the number of the Kenyon Cells (KCs)
+    :param min_pn:
+    :param max_pn:
+    :param aff_pn2kc:   the number of the KCs every PN projects to, random in [min_pn, max_pn] if None or <= 0
+    :param nb_trials:   the number of trials in order to find a acceptable sample
+    :param baseline:    distance between max-min number of projections per KC
+    :param seed:        seed of the trials
+    :param dtype:
+    :param n_jobs:      the number of processes the trials are spread over
+    :param chunk_size:  the number of trials handed to a process at once
+    """
+    chunks = [range(start, min(start + chunk_size, nb_trials)) for start in range(0, nb_trials, chunk_size)]
+    args = (nb_pn, nb_kc, min_pn, max_pn, aff_pn2kc, seed, baseline)
+
+    if n_jobs == 1:
+        results = (_pn2kc_chunk_dispersion(args + (chunk,)) for chunk in chunks)
+        best_trial, _ = _select_pn2kc_trial(chunks, results, baseline)
+    else:
+        with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+            futures = [executor.submit(_pn2kc_chunk_dispersion, args + (chunk,)) for chunk in chunks]
+            results = (future.result() for future in futures)
+            best_trial, _ = _select_pn2kc_trial(chunks, results, baseline)
+            for future in futures:
+                future.cancel()
+
+    # only the selected trial gets turned into a matrix, it is re-drawn from its own seed
+    pn_index, mask = _sample_pn2kc_trial(nb_pn, nb_kc, min_pn, max_pn, aff_pn2kc, seed, best_trial)
+    indptr = np.concatenate([[0], np.cumsum(mask.sum(axis=1))])
+    pn2kc = sparse.csr_matrix((np.ones(indptr[-1], dtype=dtype), pn_index[mask], indptr), shape=(nb_pn, nb_kc))
+    pn2kc.sort_indices()
+    return pn2kc
+
+
+def _sample_pn2kc_trial(nb_pn, nb_kc, min_pn, max_pn, aff_pn2kc, seed, trial):
+    """Draws the KCs targeted by every PN in one trial, as a (nb_pn, k) index array and the mask of its valid
+    entries (row i keeps its first vaff_pn2kc[i] indices)."""
+    rnd = np.random.default_rng([seed, trial])
+    if aff_pn2kc is None or aff_pn2kc <= 0:
+        vaff_pn2kc = rnd.integers(min_pn, max_pn + 1, size=nb_pn)
+    else:
+        vaff_pn2kc = np.full(nb_pn, int(aff_pn2kc))
+    vaff_pn2kc = np.minimum(vaff_pn2kc, nb_kc)
+    k = int(vaff_pn2kc.max())
+
+    # the k smallest uniform keys of a row are a random k-subset of the KCs, sorting them (k << nb_kc)
+    # makes every prefix of the row a random subset as well
+    keys = rnd.random((nb_pn, nb_kc))
+    pn_index = np.argpartition(keys, k - 1, axis=1)[:, :k]
+    order = np.argsort(np.take_along_axis(keys, pn_index, axis=1), axis=1)
+    pn_index = np.take_along_axis(pn_index, order, axis=1)
+    mask = np.arange(k) < vaff_pn2kc[:, np.newaxis]
+    return pn_index, mask
+
+
+def _pn2kc_chunk_dispersion(args):
+    """Dispersions of a chunk of trials, stopping after the first one that is below the baseline."""
+    nb_pn, nb_kc, min_pn, max_pn, aff_pn2kc, seed, baseline, trials = args
+    dispersion = []
+    for trial in trials:
+        pn_index, mask = _sample_pn2kc_trial(nb_pn, nb_kc, min_pn, max_pn, aff_pn2kc, seed, trial)
+        pn2kc_sum = np.bincount(pn_index[mask], minlength=nb_kc)
+        dispersion.append(int(pn2kc_sum.max() - pn2kc_sum.min()))
+        if dispersion[-1] <= baseline:
+            break
+    return dispersion
+
+
+def _select_pn2kc_trial(chunks, results, baseline):
+    """Same selection as generate_pn2kc_weights(): the first trial below the baseline, otherwise the first one
+    with the lowest dispersion."""
+    best_trial, best_dispersion = None, None
+    for chunk, dispersion in zip(chunks, results):
+        for trial, value in zip(chunk, dispersion):
+            if value <= baseline:
+                return trial, value
+            if best_dispersion is None or value < best_dispersion:
+                best_trial, best_dispersion = trial, value
+    return best_trial, best_dispersion
+
+
 def gen_tb_tb_weights(weight=1.):
     """Weight matrix to map inhibitory connections from TB1 to other neurons"""
     W = np.zeros([8, 8])
@@ -448,7 +897,7 @@ def noisy_sigmoid(v, slope=1.0, bias=0.5, noise=0.01):
     between 0 and 1"""
     sig = expit(v * slope - bias)
     if noise > 0:
-        sig += np.random.normal(scale=noise, size=len(v))
+        sig += np.random.normal(scale=noise, size=np.shape(v))
     return np.clip(sig, 0, 1)
 
 
@@ -456,3 +905,12 @@ def sigmoid(x, deriv=False):
     if (deriv == True):
         return x * (1 - x)
     return 1 / (1 + np.exp(-x))
+
+
+def _sigmoid_(x):
+    """in-place sigmoid, returns x"""
+    np.negative(x, out=x)
+    np.exp(x, out=x)
+    x += 1
+    np.reciprocal(x, out=x)
+    return x
@@ -1,5 +1,15 @@
 # from: https://github.com/DrugowitschLab/MultimodalHDCueIntegrationSims/blob/4ff3d8d486ed90a61128ae9f28e61b8a3ab3ef7b/ra_network.py
 from cmath import e
+import os
+import time
+import json
+import tempfile
+import hashlib
+import types
+import warnings
+import multiprocessing
+from multiprocessing import shared_memory
+from concurrent.futures import ProcessPoolExecutor, as_completed
 import numpy as np
 import matplotlib.pyplot as plt
 from copy import deepcopy
@@ -81,6 +91,10 @@ class RingAttractorNetwork():
         Full history of postsynaptically-gated boost weight matrix changes.
     dW_decay_trace : np array of shape (T/dt,N,N_g)
         Full history of postsynaptically-gated weight-decay changes.
+    trace_policy : TracePolicy
+        How W_trace, dW_*_trace and their 2nd cue counterparts are stored (sampling stride,
+        dtype, memory-mapping, dW reconstruction). By default every step is stored in
+        float64 arrays, so the shapes above hold. See TracePolicy.
 
     g2_trace : np array of shape (T/dt,N)
         Full history of input neuron activity of last simulation.
@@ -112,12 +126,14 @@ class RingAttractorNetwork():
             Determines initialization state of the network
             Options for strings:
             'steady-state' - network is initialized with steady-state bump after burn-in. 
-                Bump will be at position 0.
+                Bump will be at position 0. The burn-in is cached per parameter set, see
+                steady_state_r_init().
             'random' - random initialization, activities between 0 and 1
             'zeros' - network initialized with all zeros
             'bumpatzero' - bump initialization at 0
         """
         
+        self.trace_policy = TracePolicy()
         for key, value in network_params.items():
             setattr(self, key, value)
 
@@ -131,12 +147,14 @@ class RingAttractorNetwork():
             J_even[i,np.mod(i+1,self.N)] = self.D
         self.J_odd = J_odd
         self.J_even = J_even
+        # work buffers of propagate_onestep() (neighbour states, recurrent input)
+        self._r_prev, self._r_next, self._x, self._x_odd = np.zeros((4,self.N))
 
         # initialize network state
-        if init == 'steady_state':
-            ra_init = RingAttractorNetwork(network_params,init='bumpatzero')
-            ra_init.simulate(T=20,trace=False)
-            self.r_init = ra_init.r.copy()
+        if isinstance(init,np.ndarray):
+            self.r_init = init
+        elif init == 'steady_state':
+            self.r_init = steady_state_r_init(network_params)
         elif init == 'random':
             self.r_init = np.random.uniform(0,1,self.N)
         elif init == 'zeros':
@@ -157,42 +175,133 @@ class RingAttractorNetwork():
         self.r = self.r_init.copy()
         return self
     
-    def copy(self):
+    def copy(self,deep=False,traces='share'):
         """
-        Deep-copy of instance.
+        Copy of instance, e.g. to branch off simulations from a checkpoint.
+        By default a cheap clone: parameters, connectivity (J_even, J_odd), f_act and r_init
+        are shared, the mutable state (r, W, W2 and the work buffers of propagate_onestep())
+        and the trace policy are copied. Simulations never write into existing traces (they
+        allocate new ones, memory-mapped ones in new files), so traces are shared read-only
+        unless asked for otherwise. The traces are not copied on write: writing into a shared
+        trace raises, fork_traces() makes them private and writable first.
+        Parameters
+        ----------
+        deep : Boolean, default=False
+            Deep-copy everything instead (the previous behaviour).
+        traces : string, default='share'
+            What happens to the *_trace attributes of a cheap clone:
+            'share' - read-only views of this instance's traces
+            'copy' - private copies
+            'drop' - not carried over
         """
-        copied_self = deepcopy(self)
+        if deep:
+            copied_self = deepcopy(self)
+            return copied_self
+
+        copied_self = object.__new__(type(self))
+        copied_self.__dict__.update(self.__dict__)
+        for name in ('r','W','W2'):
+            if isinstance(getattr(self,name,None),np.ndarray):
+                setattr(copied_self,name,getattr(self,name).copy())
+        copied_self._r_prev, copied_self._r_next, copied_self._x, copied_self._x_odd = np.zeros((4,self.N))
+        copied_self.trace_policy = deepcopy(self.trace_policy)
+        for name, value in self.__dict__.items():
+            if not (name.endswith('_trace') and isinstance(value,np.ndarray)):
+                continue
+            if traces == 'share':
+                value = value.view(np.ndarray)
+                value.flags.writeable = False
+                setattr(copied_self,name,value)
+            elif traces == 'copy':
+                setattr(copied_self,name,np.array(value))
+            elif traces == 'drop':
+                delattr(copied_self,name)
+            else:
+                raise ValueError("traces must be 'share', 'copy' or 'drop', not "+repr(traces))
         return copied_self
 
+    def fork_traces(self):
+        """
+        Replaces traces shared read-only with another instance (see copy()) by private,
+        writable copies.
+        """
+        for name, value in list(self.__dict__.items()):
+            if name.endswith('_trace') and isinstance(value,np.ndarray) and not value.flags.writeable:
+                setattr(self,name,np.array(value))
+        return self
+
+    def _init_weight_traces(self,n_steps,W_name='W'):
+        """
+        Allocates <W_name>_trace and d<W_name>_{Hebb,postboost,decay}_trace through
+        self.trace_policy, with the current weights as first sample.
+        """
+        policy = self.trace_policy
+        W_trace = policy.allocate(W_name+'_trace',n_steps,(self.N,self.N_g))
+        W_trace[0] = getattr(self,W_name)
+        setattr(self,W_name+'_trace',W_trace)
+        for term in ('Hebb','postboost','decay'):
+            name = 'd'+W_name+'_'+term+'_trace'
+            setattr(self,name,policy.allocate(name,n_steps,(self.N,self.N_g)) if policy.store_dW else None)
+
+    def _record_weights(self,t,W_name,dW_Hebb,dW_postboost,dW_decay):
+        """
+        Stores the weights and weight changes of time step t, if self.trace_policy keeps it.
+        """
+        policy = self.trace_policy
+        if not policy.keeps(t):
+            return
+        row = policy.row(t)
+        getattr(self,W_name+'_trace')[row] = getattr(self,W_name)
+        if policy.store_dW:
+            getattr(self,'d'+W_name+'_Hebb_trace')[row] = dW_Hebb
+            getattr(self,'d'+W_name+'_postboost_trace')[row] = dW_postboost
+            getattr(self,'d'+W_name+'_decay_trace')[row] = dW_decay
+
 
     def propagate_onestep(self,v=0,I=0):
         """
         Propages the network dynamics one time step forward.
+        J_even and J_odd are nearest-neighbour stencils, so J @ r is computed from the
+        two ring neighbours of each neuron,
+            (J_even @ r)[i] = D * (r[i-1] + r[i+1]),  (J_odd @ r)[i] = (r[i+1] - r[i-1]) / 2,
+        and self.r is updated in place: O(N) per step, no N x N matrix.
         """
         # unpack parameters
         tau = self.tau
         alpha = self.alpha
         beta = self.beta
         f_act = self.f_act 
+        dt = self.dt
 
-        # create effective recurrent connectivity
-        J =  self.J_even - self.J_odd * v/self.v_rel
         r = self.r
-
-        r_out = ( r
-                - 1/tau * r * self.dt # decay
-                + 1/tau * f_act(
-                    alpha * r # self-excitation
-                    + J @ r # even and odd recurrent connectivities
-                    - beta * np.sum(r) # global inhibition
-                    + I # external input
-                    ) * self.dt
-                )
-        self.r = r_out
+        if self.N < 3: # neighbours i-1 and i+1 coincide, use the matrices
+            J = self.J_even - self.J_odd * v/self.v_rel
+            self.r = r - 1/tau * r * dt + 1/tau * f_act(alpha * r + J @ r - beta * np.sum(r) + I) * dt
+            return self
+
+        r_prev, r_next, x, x_odd = self._r_prev, self._r_next, self._x, self._x_odd
+        r_prev[0] = r[-1]
+        r_prev[1:] = r[:-1]
+        r_next[-1] = r[0]
+        r_next[:-1] = r[1:]
+        # even and odd recurrent connectivities, J @ r = J_even @ r - v/v_rel * J_odd @ r
+        np.add(r_prev, r_next, out=x)
+        x *= self.D
+        np.subtract(r_next, r_prev, out=x_odd)
+        x_odd *= 0.5 * v/self.v_rel
+        x -= x_odd
+        np.multiply(r, alpha, out=x_odd)
+        x += x_odd # self-excitation
+        x -= beta * np.sum(r) # global inhibition
+        x += I # external input
+
+        drive = np.multiply(f_act(x), dt/tau, out=x)
+        r *= 1 - dt/tau # decay
+        r += drive
         return self
 
 
-    def simulate(self,T,v=None,I=None,g=None,trace=True,learn=False,reset=True):
+    def simulate(self,T,v=None,I=None,g=None,trace=True,learn=False,reset=True,trace_policy=None):
         """Full network simulation.
         Parameters
         ----------
@@ -211,8 +320,13 @@ class RingAttractorNetwork():
             constant (False)
         reset : Boolean, default=True
             Resets the network state to the initial state.
+        trace_policy : None or TracePolicy, default=None
+            Replaces self.trace_policy, which determines how the weight traces are stored.
+        The speed reached is stored in self.steps_per_second.
         """
 
+        if trace_policy is not None:
+            self.trace_policy = trace_policy
         if reset:
             self.reset_network()
         
@@ -239,13 +353,10 @@ class RingAttractorNetwork():
             else:
                 self.I_trace[0] = I[0]
             if learn:
-                self.W_trace = np.zeros([int(T/self.dt),self.N,self.N_g])
-                self.W_trace[0] = self.W.copy()
-                self.dW_Hebb_trace = np.zeros([int(T/self.dt),self.N,self.N_g])
-                self.dW_postboost_trace = np.zeros([int(T/self.dt),self.N,self.N_g])
-                self.dW_decay_trace = np.zeros([int(T/self.dt),self.N,self.N_g])
+                self._init_weight_traces(int(T/self.dt),'W')
 
         # the ACTUAL simulation
+        start = time.perf_counter()
         for t in np.arange(1,int(T/self.dt)):
 
             if g is not None:
@@ -274,15 +385,149 @@ class RingAttractorNetwork():
                 # pruning step, no negative weights
                 self.W[ self.W < 0 ] = 0
                 if trace:
-                    self.W_trace[t] = np.copy(self.W)
-                    self.dW_Hebb_trace[t] = dW_Hebb
-                    self.dW_postboost_trace[t] = dW_postboost
-                    self.dW_decay_trace[t] = dW_decay
+                    self._record_weights(t,'W',dW_Hebb,dW_postboost,dW_decay)
+
+        elapsed = time.perf_counter() - start
+        self.steps_per_second = (int(T/self.dt) - 1) / elapsed if elapsed > 0 else np.inf
+        return self
+
+
+    def simulate_fast(self,T,v=None,I=None,g=None,trace=True,learn=False,reset=True,trace_policy=None):
+        """Full network simulation, same parameters, attributes and (bit-for-bit) results as
+        simulate(), for long runs.
+        The whole trajectory runs in a single loop over preallocated arrays: the network step
+        of propagate_onestep() is inlined and writes straight into r_trace, the FF input uses
+        a negated copy of W that is only refreshed when W changes, and the learning rule
+        updates W in place, with dW_Hebb, dW_postboost and dW_decay computed into their trace
+        rows (or reused buffers) instead of three np.outer matrices per step. Every
+        elementwise operation is done in the same order as in simulate(), which is what keeps
+        the results identical (check_simulate_fast() compares the two, learn=False and True;
+        the FF input stays one W @ g[t] product per step, as a block product over many steps
+        differs from it in the last bits). The speed reached is stored in self.steps_per_second.
+        W is copied at the start, so an array assigned to self.W beforehand is not modified.
+        """
+        if trace_policy is not None:
+            self.trace_policy = trace_policy
+        if self.N < 3: # see propagate_onestep()
+            start = time.perf_counter()
+            self.simulate(T,v=v,I=I,g=g,trace=trace,learn=learn,reset=reset)
+            self.steps_per_second = (int(T/self.dt) - 1) / (time.perf_counter() - start)
+            return self
+
+        if reset:
+            self.reset_network()
+
+        n_steps = int(T/self.dt)
+        if v is None:
+            v = np.zeros(n_steps)
+        elif np.isscalar(v):
+            v = v * np.ones(n_steps)
+        if I is None:
+            I = np.zeros(n_steps)
+        elif np.isscalar(I):
+            I = I * np.ones(n_steps)
+        elif (np.ndim(I) == 1 and len(I) == self.N):
+            I = I[np.newaxis,:] * np.ones((n_steps,self.N))
+        if g is not None:
+            self.N_g = g.shape[1]
+            self.g_trace = g
+            self.W = np.array(self.W, dtype=float)
+            W = self.W
+            W_neg = -W
+            I_g = np.zeros(self.N)
+            I_t = np.zeros(self.N)
+
+        if trace:
+            self.r_trace = np.zeros([n_steps,self.N])
+            self.r_trace[0] = self.r
+            self.I_trace = np.zeros([n_steps,self.N])
+            if g is not None:
+                self.I_trace[0] = I[0] - self.W @ g[0]
+            else:
+                self.I_trace[:] = I if np.ndim(I) == 2 else I[:,np.newaxis]
+            if learn:
+                self._init_weight_traces(n_steps,'W')
+            r_rows = self.r_trace
+        else: # alternate between two rows
+            r_rows = np.zeros([2,self.N])
+            r_rows[0] = self.r
+        if learn:
+            dW_Hebb, dW_postboost, dW_decay, dW = np.zeros((4,self.N,self.N_g))
+            pruned = np.zeros((self.N,self.N_g), dtype=bool)
+            eta_v = self.eta * np.abs(v)
+            # dW terms can be computed straight into the trace rows if every step is stored as is
+            policy = self.trace_policy
+            into_trace = (trace and policy.store_dW and policy.stride == 1
+                          and np.dtype(policy.dtype) == np.float64)
+
+        # per step constants of propagate_onestep()
+        f_act = self.f_act
+        D, alpha, beta = self.D, self.alpha, self.beta
+        decay = 1 - self.dt/self.tau
+        gain = self.dt/self.tau
+        odd_scale = 0.5 * v/self.v_rel
+        r_prev, r_next, x, x_odd = self._r_prev, self._r_next, self._x, self._x_odd
+
+        start = time.perf_counter()
+        r = r_rows[0]
+        for t in range(1,n_steps):
+            r_out = r_rows[t] if trace else r_rows[t % 2]
+
+            # network step, as in propagate_onestep()
+            r_prev[0] = r[-1]
+            r_prev[1:] = r[:-1]
+            r_next[-1] = r[0]
+            r_next[:-1] = r[1:]
+            np.add(r_prev, r_next, out=x)
+            x *= D
+            np.subtract(r_next, r_prev, out=x_odd)
+            x_odd *= odd_scale[t]
+            x -= x_odd
+            np.multiply(r, alpha, out=x_odd)
+            x += x_odd
+            x -= beta * np.sum(r)
+            if g is not None:
+                np.matmul(W_neg, g[t], out=I_g)
+                I_t = np.add(I[t], I_g, out=self.I_trace[t] if trace else I_t)
+                x += I_t
+            else:
+                x += I[t]
+            drive = np.multiply(f_act(x), gain, out=x)
+            np.multiply(r, decay, out=r_out)
+            r_out += drive
+            r = r_out
 
+            # learn feed-forward weights, as in simulate()
+            if learn:
+                if into_trace:
+                    dW_Hebb = self.dW_Hebb_trace[t]
+                    dW_postboost = self.dW_postboost_trace[t]
+                    dW_decay = self.dW_decay_trace[t]
+                np.multiply.outer(r, g[t], out=dW_Hebb)
+                dW_Hebb *= -self.gamma_Hebb
+                np.multiply(r[:,np.newaxis], self.gamma_postboost, out=dW_postboost)
+                np.multiply(W, -self.gamma_decay, out=dW_decay)
+                dW_decay *= r[:,np.newaxis]
+                np.add(dW_Hebb, dW_postboost, out=dW)
+                dW += dW_decay
+                dW *= eta_v[t]
+                W += dW
+                # pruning step, no negative weights
+                np.less(W, 0, out=pruned)
+                np.copyto(W, 0, where=pruned)
+                np.negative(W, out=W_neg)
+                if into_trace:
+                    self.W_trace[t] = W
+                elif trace:
+                    self._record_weights(t,'W',dW_Hebb,dW_postboost,dW_decay)
+
+        elapsed = time.perf_counter() - start
+        self.r = r.copy()
+        self.steps_per_second = (n_steps - 1) / elapsed if elapsed > 0 else np.inf
         return self
 
 
-    def simulate_two_cues(self,T,v=None,I=None,g=None,g2=None,trace=True,learn=False,reset=True):
+    def simulate_two_cues(self,T,v=None,I=None,g=None,g2=None,trace=True,learn=False,reset=True,trace_policy=None):
         """Full network simulation.
         Parameters
         ----------
@@ -301,8 +546,12 @@ class RingAttractorNetwork():
             constant (False)
         reset : Boolean, default=True
             Resets the network state to the initial state.
+        trace_policy : None or TracePolicy, default=None
+            Replaces self.trace_policy, which determines how the weight traces are stored.
         """
 
+        if trace_policy is not None:
+            self.trace_policy = trace_policy
         if reset:
             self.reset_network()
         
@@ -331,17 +580,8 @@ class RingAttractorNetwork():
             else:
                 self.I_trace[0] = I[0]
             if learn:
-                self.W_trace = np.zeros([int(T/self.dt),self.N,self.N_g])
-                self.W_trace[0] = self.W.copy()
-                self.dW_Hebb_trace = np.zeros([int(T/self.dt),self.N,self.N_g])
-                self.dW_postboost_trace = np.zeros([int(T/self.dt),self.N,self.N_g])
-                self.dW_decay_trace = np.zeros([int(T/self.dt),self.N,self.N_g])
-
-                self.W2_trace = np.zeros([int(T/self.dt),self.N,self.N_g])
-                self.W2_trace[0] = self.W2.copy()
-                self.dW2_Hebb_trace = np.zeros([int(T/self.dt),self.N,self.N_g])
-                self.dW2_postboost_trace = np.zeros([int(T/self.dt),self.N,self.N_g])
-                self.dW2_decay_trace = np.zeros([int(T/self.dt),self.N,self.N_g])
+                self._init_weight_traces(int(T/self.dt),'W')
+                self._init_weight_traces(int(T/self.dt),'W2')
 
         # the ACTUAL simulation
         for t in np.arange(1,int(T/self.dt)):
@@ -377,10 +617,7 @@ class RingAttractorNetwork():
                 # pruning step, no negative weights
                 self.W[ self.W < 0 ] = 0
                 if trace:
-                    self.W_trace[t] = np.copy(self.W)
-                    self.dW_Hebb_trace[t] = dW_Hebb
-                    self.dW_postboost_trace[t] = dW_postboost
-                    self.dW_decay_trace[t] = dW_decay
+                    self._record_weights(t,'W',dW_Hebb,dW_postboost,dW_decay)
 
                 dW2_Hebb = - self.gamma_Hebb_2 * np.outer(self.r,g2[t])
                 dW2_postboost = self.gamma_postboost_2 * np.outer(self.r, np.ones(len(g2[t]))) 
@@ -390,10 +627,7 @@ class RingAttractorNetwork():
                 # pruning step, no negative weights
                 self.W2[self.W2 < 0] = 0
                 if trace:
-                    self.W2_trace[t] = np.copy(self.W2)
-                    self.dW2_Hebb_trace[t] = dW2_Hebb
-                    self.dW2_postboost_trace[t] = dW2_postboost
-                    self.dW2_decay_trace[t] = dW2_decay
+                    self._record_weights(t,'W2',dW2_Hebb,dW2_postboost,dW2_decay)
 
         return self
 
@@ -471,6 +705,78 @@ class RingAttractorNetwork():
 
         return bump_pos
 
+    def determine_features(self,ydata=None,chunk_size=2**16):
+        """Determines height (max-min), full width at half maximum and sub-bin peak
+        position of every bump profile of a trace at once.
+        Vectorized counterpart of determine_features_basic() and determine_bumpPosition():
+        instead of upsampling each profile to 1000 points, the half-maximum crossings on
+        both sides of the peak are found on the samples and placed by linear interpolation
+        between the two samples around them, and the peak position is refined with a
+        parabola through the maximum and its two neighbours. Profiles are treated as
+        circular. Profiles are processed chunk_size at a time to bound memory.
+        Parameters
+        ----------
+        ydata : None or np.array of shape (M,) or (T,M), default=None
+            Profiles to determine bump parameters from. If None, then bump parameters are
+            determined from the network trace r_trace.
+        chunk_size : int, default=2**16
+            Number of profiles processed at once.
+        Returns
+        -------
+        height : float or np.array of shape (T,)
+            Bump height
+        width : float or np.array of shape (T,)
+            Bump width (rad), nan if the profile never drops below half maximum
+        bump_pos : float or np.array of shape (T,)
+            Bump position (rad), between [-pi,pi)
+        """
+        if ydata is None:
+            ydata = self.r_trace
+        single = np.ndim(ydata) == 1
+        ydata = np.atleast_2d(ydata)
+        T, N = ydata.shape
+        height = np.zeros(T)
+        width = np.zeros(T)
+        bump_pos = np.zeros(T)
+        phi_0 = np.arange(-np.pi,np.pi,2*np.pi/N)
+        rows = np.arange(min(chunk_size,T))[:,np.newaxis]
+
+        for start in range(0,T,chunk_size):
+            y = np.asarray(ydata[start:start+chunk_size],dtype=float)
+            n = len(y)
+            ind_max = np.argmax(y,axis=1)
+            y_max = y[rows[:n,0],ind_max]
+            y_min = np.min(y,axis=1)
+            half = (y_max + y_min)/2
+
+            # move peak to 0 and find the first samples below half maximum on both sides
+            y_s = y[rows[:n],(ind_max[:,np.newaxis] + np.arange(N)) % N]
+            below = y_s < half[:,np.newaxis]
+            ind_right = np.argmax(below,axis=1)
+            ind_left = N - 1 - np.argmax(below[:,::-1],axis=1)
+            # linear interpolation between the samples around each crossing
+            y_r0, y_r1 = y_s[rows[:n,0],ind_right-1], y_s[rows[:n,0],ind_right]
+            y_l0, y_l1 = y_s[rows[:n,0],ind_left], y_s[rows[:n,0],(ind_left+1) % N]
+            with np.errstate(invalid='ignore',divide='ignore'):
+                x_right = ind_right - 1 + (y_r0 - half)/(y_r0 - y_r1)
+                x_left = ind_left + (half - y_l0)/(y_l1 - y_l0)
+                w = (x_right + N - x_left)/N * 2*np.pi
+            w[~below.any(axis=1)] = np.nan
+
+            # parabolic peak interpolation
+            y_prev, y_next = y_s[:,-1], y_s[:,1]
+            curvature = y_prev - 2*y_max + y_next
+            with np.errstate(invalid='ignore',divide='ignore'):
+                offset = np.where(curvature < 0, 0.5*(y_prev - y_next)/curvature, 0)
+
+            height[start:start+n] = y_max - y_min
+            width[start:start+n] = w
+            bump_pos[start:start+n] = back_to_circ(phi_0[ind_max] + offset*2*np.pi/N)
+
+        if single:
+            return height[0], width[0], bump_pos[0]
+        return height, width, bump_pos
+
 
     def create_vM_input(self,mu,w,amplitude):
         """Creates a von-Mises shaped input profile of size (N,). Not sure why I made
@@ -490,15 +796,7 @@ class RingAttractorNetwork():
             von-Mises shaped bump profile
         """
 
-        kappa = np.log(1/2) / ( np.cos(1/2 * w) -1 ) 
-
-        arg = np.linspace(-np.pi,np.pi-2*np.pi/self.N,self.N)
-        if kappa > 5 : 
-            tunedInp = np.exp(kappa*(np.cos(arg - mu) - 1) )
-        else:
-            tunedInp = (np.exp(kappa*(np.cos(arg - mu) + 1)) - 1) / (np.exp(2*kappa) - 1)
-
-        profile = amplitude * tunedInp
+        profile = vM_input_bank(np.array([mu]),self.N,w,amplitude)[0]
         return profile
     
     def plot(self,T_min=0,T_max = None):
@@ -528,6 +826,382 @@ class RingAttractorNetwork():
 
 
 
+class TracePolicy():
+    """Storage policy for the weight histories of learning simulations (W_trace,
+    dW_Hebb_trace, dW_postboost_trace, dW_decay_trace and the W2 counterparts).
+    With N=N_g=32 and dt=1e-4, storing every step in float64 takes ~8 GB per trace per
+    100 s of simulation. Long runs can instead subsample, store in lower precision, write
+    to disk and/or drop the dW terms, which are then recomputed from r_trace and g_trace.
+    The default stores everything, every step, in float64 memory.
+    Parameters
+    ----------
+    stride : int, default=1
+        Only time steps 0, stride, 2*stride, ... are stored. Row k of a trace is step k*stride.
+    dtype : numpy dtype, default=np.float64
+        Storage type of the traces, e.g. np.float32 or np.float16.
+    memmap_dir : None or str, default=None
+        If given, traces are memory-mapped .npy files in this directory instead of arrays in
+        memory. Every allocation gets a new file named after the attribute with a unique
+        suffix (e.g. W_trace_k3x9q1.npy, trace.filename is its path), so simulations and
+        networks sharing a policy never overwrite each other's traces. The files are not
+        deleted.
+    store_dW : Boolean, default=True
+        If False the dW_* traces are not stored (set to None); dW() then reconstructs them
+        at step t from r_trace[t], g_trace[t] and the stored weights of step t-1.
+    Traces should be read through W() and dW(), which map time steps to stored samples.
+    """
+
+    def __init__(self,stride=1,dtype=np.float64,memmap_dir=None,store_dW=True):
+        self.stride = int(stride)
+        self.dtype = dtype
+        self.memmap_dir = memmap_dir
+        self.store_dW = store_dW
+
+    def keeps(self,t):
+        return t % self.stride == 0
+
+    def row(self,t):
+        return t // self.stride
+
+    def allocate(self,name,n_steps,shape):
+        """
+        Returns a zero-initialised trace for n_steps time steps of arrays of the given shape.
+        """
+        shape = ((n_steps-1)//self.stride + 1,) + tuple(shape)
+        if self.memmap_dir is None:
+            return np.zeros(shape,dtype=self.dtype)
+        os.makedirs(self.memmap_dir,exist_ok=True)
+        fd, path = tempfile.mkstemp(suffix='.npy',prefix=name+'_',dir=self.memmap_dir)
+        os.close(fd)
+        return np.lib.format.open_memmap(path,mode='w+',dtype=self.dtype,shape=shape)
+
+    def W(self,ra,t,cue=1):
+        """
+        Feed-forward weights of ra (W, or W2 for cue=2) at the last stored step <= t.
+        Returns
+        -------
+        step : int
+            The time step the weights belong to.
+        W : np array of shape (N,N_g)
+        """
+        W_trace = ra.W_trace if cue == 1 else ra.W2_trace
+        step = self.row(t) * self.stride
+        return step, np.asarray(W_trace[self.row(t)],dtype=float)
+
+    def dW(self,ra,t,cue=1):
+        """
+        Hebbian, postboost and decay weight changes of ra (of W, or W2 for cue=2) at the
+        last step <= t for which they are available: a stored step, or with store_dW=False
+        a step following a stored step (the decay term needs the weights before the update).
+        Returns
+        -------
+        step : int
+            The time step the weight changes belong to.
+        dW_terms : tuple (dW_Hebb, dW_postboost, dW_decay) of np arrays of shape (N,N_g)
+        """
+        if self.store_dW:
+            step = self.row(t) * self.stride
+            prefix = 'dW_' if cue == 1 else 'dW2_'
+            return step, tuple(np.asarray(getattr(ra,prefix+term+'_trace')[self.row(t)],dtype=float)
+                               for term in ('Hebb','postboost','decay'))
+        step = max(self.row(t-1) * self.stride + 1, 1)
+        suffix = '' if cue == 1 else '_2'
+        r = ra.r_trace[step]
+        g = (ra.g_trace if cue == 1 else ra.g2_trace)[step]
+        _, W = self.W(ra,step-1,cue)
+        # as in RingAttractorNetwork.simulate()
+        dW_Hebb = - getattr(ra,'gamma_Hebb'+suffix) * np.outer(r,g)
+        dW_postboost = getattr(ra,'gamma_postboost'+suffix) * np.outer(r, np.ones(len(g)))
+        dW_decay = - getattr(ra,'gamma_decay'+suffix) * W * np.outer(r, np.ones(len(g)))
+        return step, (dW_Hebb, dW_postboost, dW_decay)
+
+
+
+
+def check_simulate_fast(network_params,T=0.5,N_g=16,seed=0):
+    """Runs simulate() and simulate_fast() side by side on the same random AV and ER input
+    (np.random.seed(seed)), without and with learning of the feed-forward weights, and raises
+    an AssertionError unless r, W and all traces are bit-for-bit equal.
+    Parameters
+    ---------
+    network_params : dict
+    T : float
+        Simulation time [s]
+    N_g : int
+        Number of input neurons
+    seed : int
+    """
+    np.random.seed(seed)
+    n_steps = int(T/network_params['dt'])
+    v = np.random.normal(0,1,n_steps)
+    g = np.random.uniform(0,1,(n_steps,N_g))
+    W = np.random.uniform(0,1,(network_params['N'],N_g))
+    for learn in (False,True):
+        reference = RingAttractorNetwork(network_params,init='bumpatzero')
+        fast = RingAttractorNetwork(network_params,init='bumpatzero')
+        reference.W, fast.W = W.copy(), W.copy()
+        reference.simulate(T,v=v,g=g,learn=learn)
+        fast.simulate_fast(T,v=v,g=g,learn=learn)
+        names = ['r','W','r_trace','I_trace']
+        if learn:
+            names += ['W_trace','dW_Hebb_trace','dW_postboost_trace','dW_decay_trace']
+        for name in names:
+            a, b = np.asarray(getattr(reference,name)), np.asarray(getattr(fast,name))
+            assert a.shape == b.shape and np.array_equal(a.view(np.uint64),b.view(np.uint64)), \
+                'simulate_fast() differs from simulate() in '+name+' (learn='+str(learn)+')'
+
+
+
+######### steady-state cache and Monte-Carlo runs
+
+_r_init_cache = {}
+
+def _update_content_hash(h,value,seen):
+    # feeds a type tag and the contents of value into h, recursively
+    if isinstance(value,(type(None),bool,int,float,complex,str,bytes)):
+        h.update(repr((type(value).__name__,value)).encode())
+    elif isinstance(value,(np.ndarray,np.generic)):
+        value = np.ascontiguousarray(value)
+        if value.dtype.hasobject:
+            raise TypeError('object arrays cannot be hashed by content')
+        h.update(repr(('ndarray',value.dtype.str,value.shape)).encode())
+        h.update(value.tobytes())
+    elif isinstance(value,(tuple,list)):
+        h.update(repr((type(value).__name__,len(value))).encode())
+        for item in value:
+            _update_content_hash(h,item,seen)
+    elif isinstance(value,(set,frozenset)):
+        h.update(repr((type(value).__name__,sorted(network_params_hash({'item': item}) for item in value))).encode())
+    elif isinstance(value,dict):
+        h.update(repr(('dict',len(value))).encode())
+        for key in sorted(value,key=repr):
+            _update_content_hash(h,key,seen)
+            _update_content_hash(h,value[key],seen)
+    elif isinstance(value,types.CodeType):
+        h.update(repr(('code',value.co_name,value.co_argcount,value.co_kwonlyargcount,value.co_flags,
+                       value.co_names,value.co_varnames,value.co_freevars,value.co_cellvars)).encode())
+        h.update(value.co_code)
+        # nested code objects (comprehensions, inner lambdas) are hashed by content, not by repr
+        _update_content_hash(h,value.co_consts,seen)
+    elif isinstance(value,types.FunctionType):
+        if id(value) in seen:
+            # recursion through the globals
+            h.update(repr(('function',value.__qualname__)).encode())
+            return
+        seen.add(id(value))
+        code = value.__code__
+        h.update(repr(('function',value.__module__,value.__qualname__)).encode())
+        _update_content_hash(h,code,seen)
+        _update_content_hash(h,value.__defaults__,seen)
+        _update_content_hash(h,value.__kwdefaults__,seen)
+        _update_content_hash(h,[cell.cell_contents for cell in (value.__closure__ or ())],seen)
+        # the globals the function (or its nested code) reads, builtins are fixed
+        for name in sorted(_global_names(code)):
+            if name in value.__globals__:
+                h.update(repr(('global',name)).encode())
+                _update_content_hash(h,value.__globals__[name],seen)
+    elif isinstance(value,types.ModuleType):
+        h.update(repr(('module',value.__name__)).encode())
+    elif isinstance(value,(types.BuiltinFunctionType,np.ufunc,type)):
+        h.update(repr(('builtin',getattr(value,'__module__',None),getattr(value,'__qualname__',value.__name__))).encode())
+    else:
+        raise TypeError('cannot hash a '+type(value).__name__+' by content')
+
+def _global_names(code):
+    names = set(code.co_names)
+    for const in code.co_consts:
+        if isinstance(const,types.CodeType):
+            names |= _global_names(const)
+    return names
+
+def network_params_hash(network_params):
+    """Content hash of a dictionary of network parameters, equal across processes for equal
+    parameters. Arrays are hashed by their bytes, functions (e.g. f_act) recursively by their
+    code (including nested code objects), defaults, closure values and the globals they use.
+    Parameters
+    ---------
+    network_params : dict
+    Returns:
+    --------
+    hash : str
+    Raises:
+    -------
+    TypeError
+        If a value (e.g. an object captured by f_act) cannot be hashed by content.
+    """
+    h = hashlib.sha1()
+    _update_content_hash(h,network_params,set())
+    return h.hexdigest()
+
+def steady_state_r_init(network_params,cache_dir=None):
+    """Steady-state network state after a 20 s burn-in from a bump at 0 (init='steady_state').
+    The burn-in is deterministic, so it is only run once per parameter set (network_params_hash())
+    and process; with cache_dir also across processes, as cache_dir/r_init_<hash>.npy.
+    Parameters that cannot be hashed by content are not cached (with a warning).
+    Parameters
+    ---------
+    network_params : dict
+    cache_dir : None or str, default=None
+    Returns:
+    --------
+    r_init : np.array of shape (N,)
+    """
+    try:
+        key = network_params_hash(network_params)
+    except TypeError as error:
+        warnings.warn('r_init is not cached, the network parameters cannot be hashed: '+str(error))
+        ra_init = RingAttractorNetwork(network_params,init='bumpatzero')
+        ra_init.simulate(T=20,trace=False)
+        return ra_init.r.copy()
+    path = None if cache_dir is None else os.path.join(cache_dir,'r_init_'+key+'.npy')
+    if key not in _r_init_cache:
+        if path is not None and os.path.exists(path):
+            _r_init_cache[key] = np.load(path)
+        else:
+            ra_init = RingAttractorNetwork(network_params,init='bumpatzero')
+            ra_init.simulate(T=20,trace=False)
+            _r_init_cache[key] = ra_init.r.copy()
+    if path is not None and not os.path.exists(path):
+        os.makedirs(cache_dir,exist_ok=True)
+        np.save(path,_r_init_cache[key])
+    return _r_init_cache[key].copy()
+
+def cue_integration_trial(ra,T,seed,shared,sigma_AV=1,sigma_g=1,w=0.8,h_scale=2,invert=False,learn=False):
+    """One cue-integration trial: generates ground truth, ER input and input noise for the
+    given seed, simulates the network and summarises how well the bump tracks the heading.
+    Default trial of run_monte_carlo().
+    Parameters
+    ---------
+    ra : RingAttractorNetwork
+    T : float
+        Simulation time [s]
+    seed : int
+        Seed of np.random for this trial
+    shared : dict of np.arrays
+        Inputs shared by all trials. If it holds 'W', the feed-forward weights, the network
+        gets (noisy) ER input, otherwise only (noisy) AV input.
+    sigma_AV, sigma_g, w, h_scale : float
+        See generate_AV_input_noise(), generate_ER_input_noise() and generate_ER_input()
+    invert : Boolean, default=False
+        Use the inverted gain ER input.
+    learn : Boolean, default=False
+        Learn the feed-forward weights during the trial, starting from shared['W'].
+    Returns:
+    --------
+    summary : dict
+        offset_variation (offset_variation() of bump position and heading), mean, rms and
+        final bump position error [rad]
+    """
+    if learn and 'W' not in shared:
+        raise ValueError("learn=True needs the initial feed-forward weights, shared['W']")
+    np.random.seed(seed)
+    v_AV, z_HD = generate_ground_truth(ra.dt,T)
+    noise_AV = generate_AV_input_noise(ra.dt,T,sigma_AV)
+    g = None
+    if 'W' in shared:
+        g, g_invert, _ = generate_ER_input(ra,T,v_AV,z_HD,w,h_scale)
+        if invert:
+            g = g_invert
+        g = g + generate_ER_input_noise(g,sigma_g)
+        ra.W = shared['W'].copy()
+    # the weight history is not used, only step 0 is stored (the final weights are in ra.W)
+    policy = TracePolicy(stride=int(T/ra.dt),store_dW=False)
+    ra.simulate_fast(T,v=v_AV+noise_AV,g=g,learn=learn,trace_policy=policy)
+    _, _, bump_pos = ra.determine_features()
+    error = back_to_circ(bump_pos - z_HD)
+    return {
+        'offset_variation': float(offset_variation(bump_pos,z_HD)),
+        'bump_error_mean': float(circular_mean(error)[0]),
+        'bump_error_rms': float(np.sqrt(np.mean(error**2))),
+        'bump_error_final': float(error[-1]),
+    }
+
+# per worker process state of run_monte_carlo()
+_monte_carlo_worker = {}
+
+def _init_monte_carlo_worker(network_params,r_init,shared_specs,trial,trial_kwargs):
+    blocks, shared = [], {}
+    for name, (block_name, shape, dtype) in shared_specs.items():
+        block = shared_memory.SharedMemory(name=block_name)
+        shared[name] = np.ndarray(shape,dtype=dtype,buffer=block.buf)
+        shared[name].flags.writeable = False
+        blocks.append(block)
+    _monte_carlo_worker.update(
+        ra=RingAttractorNetwork(network_params,init=r_init),
+        blocks=blocks, shared=shared, trial=trial, trial_kwargs=trial_kwargs,
+    )
+
+def _run_monte_carlo_trial(T,seed):
+    worker = _monte_carlo_worker
+    return seed, worker['trial'](worker['ra'],T,seed,worker['shared'],**worker['trial_kwargs'])
+
+def run_monte_carlo(network_params,seeds,T,out_path,trial=cue_integration_trial,shared=None,n_jobs=None,cache_dir=None,**trial_kwargs):
+    """Runs trial(ra,T,seed,shared,**trial_kwargs) for every seed over a process pool and
+    streams the returned summary metrics to out_path, one JSON line {"seed": seed, ...} per
+    trial as they complete, instead of keeping traces around.
+    The steady-state r_init is computed (or loaded from cache_dir) once, see
+    steady_state_r_init(), and every worker builds one network from it that is reused by
+    its trials. The arrays in shared (e.g. {'W': W}) are put in shared memory once and
+    handed to the trials read-only, instead of being pickled per trial.
+    Workers are forked where possible, so network_params may hold lambdas; with n_jobs=1
+    the trials run in this process.
+    Parameters
+    ---------
+    network_params : dict
+    seeds : iterable of int
+    T : float
+        Simulation time of each trial [s]
+    out_path : str
+        JSON lines file, appended to
+    trial : function, default=cue_integration_trial
+    shared : None or dict of np.arrays, default=None
+    n_jobs : None or int, default=None
+        Number of worker processes, None for one per CPU
+    cache_dir : None or str, default=None
+        Directory of the r_init cache
+    Returns:
+    --------
+    summaries : list of dicts
+        The summaries in order of completion
+    """
+    r_init = steady_state_r_init(network_params,cache_dir)
+    shared = {} if shared is None else shared
+    summaries = []
+    with open(out_path,'a') as f:
+        def write(seed,summary):
+            summary = {'seed': int(seed), **summary}
+            f.write(json.dumps(summary) + '\n')
+            f.flush()
+            summaries.append(summary)
+
+        if n_jobs == 1:
+            ra = RingAttractorNetwork(network_params,init=r_init)
+            for seed in seeds:
+                write(seed,trial(ra,T,seed,shared,**trial_kwargs))
+            return summaries
+
+        blocks, specs = [], {}
+        try:
+            for name, arr in shared.items():
+                arr = np.ascontiguousarray(arr)
+                block = shared_memory.SharedMemory(create=True,size=max(arr.nbytes,1))
+                blocks.append(block)
+                np.ndarray(arr.shape,dtype=arr.dtype,buffer=block.buf)[...] = arr
+                specs[name] = (block.name, arr.shape, arr.dtype.str)
+            methods = multiprocessing.get_all_start_methods()
+            context = multiprocessing.get_context('fork' if 'fork' in methods else None)
+            with ProcessPoolExecutor(max_workers=n_jobs,mp_context=context,initializer=_init_monte_carlo_worker,
+                                     initargs=(network_params,r_init,specs,trial,trial_kwargs)) as executor:
+                futures = [executor.submit(_run_monte_carlo_trial,T,seed) for seed in seeds]
+                for future in as_completed(futures):
+                    write(*future.result())
+        finally:
+            for block in blocks:
+                block.close()
+                block.unlink()
+    return summaries
+
+
 ######### Some other useful helper functions
 
 
@@ -608,14 +1282,30 @@ def movmean(arr, windowsize):
     arr : one-dimensional np.array
     windowsize : scalar
         Size of moving window in time steps
+    Element i is the average of arr[:i+floor(windowsize/2)] for i <= floor(windowsize/2),
+    and of arr[i-ceil(windowsize/2):i+floor(windowsize/2)] otherwise (nan for empty windows).
+    All windows are computed at once from a cumulative sum, O(len(arr)).
     '''
     
-    arr_smooth = np.zeros(len(arr))  # initialize
-    for i in range(len(arr)):
-        if i <= np.floor(windowsize/2):
-            arr_smooth[i] = np.average(arr[:i+int(np.floor(windowsize/2))])
-        else:
-            arr_smooth[i] = np.average(arr[i-int(np.ceil(windowsize/2)):i+int(np.floor(windowsize/2))])
+    n = len(arr)
+    half_before = int(np.ceil(windowsize/2))
+    half_after = int(np.floor(windowsize/2))
+    # window of element i is [max(i-half_before,0), min(i+half_after,n)), as half_after <= half_before
+    csum = np.zeros(n+1)
+    np.cumsum(arr, out=csum[1:])
+    n_inside = max(n - half_after, 0)  # windows ending before the end of arr
+    arr_smooth = np.empty(n)
+    arr_smooth[:n_inside] = csum[half_after:half_after+n_inside]
+    arr_smooth[n_inside:] = csum[n]
+    if half_before < n:
+        arr_smooth[half_before:] -= csum[:n-half_before]
+    length = np.full(n, float(half_before + half_after))  # shorter only at both ends
+    i = np.arange(min(half_before, n))
+    length[:len(i)] = np.minimum(i + half_after, n)
+    i = np.arange(n_inside, n)
+    length[n_inside:] = n - np.maximum(i - half_before, 0)
+    with np.errstate(invalid='ignore', divide='ignore'):  # empty windows give nan, as np.average
+        arr_smooth /= length
     
     return arr_smooth
 
@@ -719,39 +1409,46 @@ def plot_all(ra,T_min,T_max):
     ax[0,2].set_ylabel('Activity')
     ax[0,2].legend()
 
-    pos = ax[1,0].imshow(ra.W_trace[ind_min],aspect='auto',interpolation='nearest',extent=[0,N_g,N,0])
-    ax[1,0].set_title('W, t ='+str(T_min))
+    # weights are read through the trace policy, which may only hold some of the steps
+    policy = ra.trace_policy
+    label = lambda step, ind, T: str(T) if step == ind else str(round(step*dt,10))
+    step_min, W_min = policy.W(ra,ind_min)
+    step_max, W_max = policy.W(ra,ind_max)
+    step_dW, (dW_Hebb, dW_postboost, dW_decay) = policy.dW(ra,ind_max)
+
+    pos = ax[1,0].imshow(W_min,aspect='auto',interpolation='nearest',extent=[0,N_g,N,0])
+    ax[1,0].set_title('W, t ='+label(step_min,ind_min,T_min))
     ax[1,0].set_xlabel('Input neuron #')
     ax[1,0].set_ylabel('RA neuron #')
     fig.colorbar(pos,ax=ax[1,0])
 
-    pos = ax[1,1].imshow(ra.W_trace[ind_max],aspect='auto',interpolation='nearest',extent=[0,N_g,N,0])
-    ax[1,1].set_title('W, t ='+str(T_max))
+    pos = ax[1,1].imshow(W_max,aspect='auto',interpolation='nearest',extent=[0,N_g,N,0])
+    ax[1,1].set_title('W, t ='+label(step_max,ind_max,T_max))
     ax[1,1].set_xlabel('Input neuron #')
     ax[1,1].set_ylabel('RA neuron #')
     fig.colorbar(pos,ax=ax[1,1])
     
-    dW = ra.dW_Hebb_trace[ind_max] + ra.dW_postboost_trace[ind_max] + ra.dW_decay_trace[ind_max]
+    dW = dW_Hebb + dW_postboost + dW_decay
     pos = ax[1,2].imshow(dW,aspect='auto',interpolation='nearest',extent=[0,N_g,N,0])
-    ax[1,2].set_title('dW, t ='+str(T_max))
+    ax[1,2].set_title('dW, t ='+label(step_dW,ind_max,T_max))
     ax[1,2].set_xlabel('Input neuron #')
     ax[1,2].set_ylabel('RA neuron #')
     fig.colorbar(pos,ax=ax[1,2])
 
-    pos = ax[2,0].imshow(ra.dW_Hebb_trace[ind_max],aspect='auto',interpolation='nearest',extent=[0,N_g,N,0])
-    ax[2,0].set_title('dW Hebb, t='+str(T_max))
+    pos = ax[2,0].imshow(dW_Hebb,aspect='auto',interpolation='nearest',extent=[0,N_g,N,0])
+    ax[2,0].set_title('dW Hebb, t='+label(step_dW,ind_max,T_max))
     ax[2,0].set_xlabel('Input neuron #')
     ax[2,0].set_ylabel('RA neuron #')
     fig.colorbar(pos,ax=ax[2,0])
 
-    pos = ax[2,1].imshow(ra.dW_postboost_trace[ind_max] ,aspect='auto',interpolation='nearest',extent=[0,N_g,N,0])
-    ax[2,1].set_title('dW postboost, t='+str(T_max))
+    pos = ax[2,1].imshow(dW_postboost,aspect='auto',interpolation='nearest',extent=[0,N_g,N,0])
+    ax[2,1].set_title('dW postboost, t='+label(step_dW,ind_max,T_max))
     ax[2,1].set_xlabel('Input neuron #')
     ax[2,1].set_ylabel('RA neuron #')
     fig.colorbar(pos,ax=ax[2,1])
 
-    pos = ax[2,2].imshow(ra.dW_decay_trace[ind_max] ,aspect='auto',interpolation='nearest',extent=[0,N_g,N,0])
-    ax[2,2].set_title('dW decay, t='+str(T_max))
+    pos = ax[2,2].imshow(dW_decay,aspect='auto',interpolation='nearest',extent=[0,N_g,N,0])
+    ax[2,2].set_title('dW decay, t='+label(step_dW,ind_max,T_max))
     ax[2,2].set_xlabel('Input neuron #')
     ax[2,2].set_ylabel('RA neuron #')
     fig.colorbar(pos,ax=ax[2,2])
@@ -784,15 +1481,56 @@ def generate_ground_truth(dt, T, sigma_diffusion = 8, windowsize_diffusion = 100
 
     # ground truth HD
     z_HD = np.zeros(n_timesteps)  # initialize array for storing ground truth HD
-    z = du[0].copy()              # initialize HD
-    z_HD[0] = z
-    for t in range(1, n_timesteps):
-        z = back_to_circ(z + v_AV[t] * dt)  # integrate ground truth AV
-        z_HD[t] = z
+    z_HD[0] = du[0]               # initialize HD
+    np.cumsum(v_AV[1:] * dt, out=z_HD[1:])  # integrate ground truth AV
+    z_HD[1:] = back_to_circ(z_HD[1:] + du[0])  # and wrap once
 
     return v_AV, z_HD
 
-def generate_ER_input(ra, T, v_AV, z_HD, w = 0.8, h_scale = 2):
+def vM_input_bank(mu, N, w, amplitude, out = None, chunk_size = 2**14):
+    """von Mises shaped input profiles for a whole sequence of peak positions at once, as
+    RingAttractorNetwork.create_vM_input() (the function found in the code of Kim et al.
+    2017), for any ring of N neurons. kappa and the neuron angle grid are computed once and
+    the profiles chunk_size rows at a time, straight into out.
+    Args:
+        mu: (np.ndarray of shape (n_timesteps,)) peak positions [radian]
+        N: (int) number of neurons
+        w: (float) width of profile, only accurate up to a certain width (~3)
+        amplitude: (float) height of profile
+        out: (None or np.ndarray of shape (n_timesteps, N)) array to write the profiles to,
+            e.g. a memory-mapped one (np.lib.format.open_memmap)
+        chunk_size: (int) number of profiles computed at once
+    Returns:
+        profiles: (np.ndarray of shape (n_timesteps, N)) von Mises profiles (out if given)
+    """
+
+    mu = np.asarray(mu)
+    if out is None:
+        out = np.zeros((len(mu), N))
+    kappa = np.log(1/2) / ( np.cos(1/2 * w) -1 )
+    arg = np.linspace(-np.pi,np.pi-2*np.pi/N,N)
+
+    x_chunk = np.zeros((min(chunk_size, len(mu)), N))
+    for start in range(0, len(mu), chunk_size):
+        stop = min(start + chunk_size, len(mu))
+        x = x_chunk[:stop - start]
+        np.subtract(arg, mu[start:stop, np.newaxis], out = x)
+        np.cos(x, out = x)
+        if kappa > 5:
+            x -= 1
+            x *= kappa
+            np.exp(x, out = x)
+        else:
+            x += 1
+            x *= kappa
+            np.exp(x, out = x)
+            x -= 1
+            x /= np.exp(2*kappa) - 1
+        np.multiply(x, amplitude, out = out[start:stop])
+
+    return out
+
+def generate_ER_input(ra, T, v_AV, z_HD, w = 0.8, h_scale = 2, g_out = None, g_invert_out = None):
     """generate normal and inverted gain ER inputs
     Args:
         ra: ring attractor object from the class RingAttractorNetwork()
@@ -802,6 +1540,8 @@ def generate_ER_input(ra, T, v_AV, z_HD, w = 0.8, h_scale = 2):
         w: (float) width of ER input
         h_scale: (float) amplitude of ER input relative to steady-state bump amplitude
             of ring attractor (RA) with neither ER input nor noise
+        g_out, g_invert_out: (None or np.ndarray of shape (n_timesteps, ra.N)) arrays to
+            write g and g_invert to, e.g. memory-mapped ones
     Returns:
         g: (np.ndarray of shape (n_timesteps, ra.N)) normal gain ER input
         g_invert: (np.ndarray of shape (n_timesteps, ra.N)) inverted gain ER input
@@ -815,23 +1555,18 @@ def generate_ER_input(ra, T, v_AV, z_HD, w = 0.8, h_scale = 2):
     h0, _ = ra.determine_features_basic(ydata = ra.r_init)  # steady-state RA bump amplitude
     h = h_scale * h0
 
-    # initialization
-    z = z_HD[0].copy()  # initialize HD for normal gain
-    z_invert = z_HD[0].copy()  # initialize HD for inverted gain
-    g = np.zeros((n_timesteps, ra.N))  # initialize array for storing normal gain ER input
-    g_invert = np.zeros((n_timesteps, ra.N))  # initialize array for storing inverted gain ER input
+    # inverted gain HD, integrated from the initial HD with the AV sign flipped
+    z_invert = np.zeros(n_timesteps)
+    z_invert[0] = z_HD[0]
+    np.cumsum(- v_AV[1:n_timesteps] * ra.dt, out = z_invert[1:])
+    z_invert[1:] = back_to_circ(z_invert[1:] + z_HD[0])
 
-    # generate inhibitory von Mises ER input
-    g[0] = ra.create_vM_input(back_to_circ(z + np.pi), w, h)
-    g_invert[0] = ra.create_vM_input(back_to_circ(z_invert + np.pi), w, h)
-    for t in range(1,int(T/ra.dt)):
-        # normal gain
-        z = z_HD[t]
-        g[t] = ra.create_vM_input(z + np.pi, w, h)  # center von Mises opposite HD
-
-        # inverted gain
-        z_invert = back_to_circ(z_invert - v_AV[t] * ra.dt)  # update HD according to inverted gain
-        g_invert[t] = ra.create_vM_input(z_invert + np.pi, w, h)  # center von Mises opposite inverted gain HD
+    # generate inhibitory von Mises ER input, centered opposite (inverted gain) HD
+    mu = z_HD[:n_timesteps] + np.pi
+    mu_invert = z_invert + np.pi
+    mu[0] = mu_invert[0] = back_to_circ(z_HD[0] + np.pi)
+    g = vM_input_bank(mu, ra.N, w, h, out = g_out)  # normal gain
+    g_invert = vM_input_bank(mu_invert, ra.N, w, h, out = g_invert_out)  # inverted gain
 
     return g, g_invert, h
 
@@ -868,4 +1603,14 @@ def generate_ER_input_noise(g, sigma_g = 1):
 
     noise_g = np.random.uniform(0, sigma_g, g.shape)
 
-    return noise_g
\ No newline at end of file
+    return noise_g
+
+
+if __name__ == "__main__":
+    # simulate_fast() against simulate(), bit for bit
+    network_params = {
+        'N': 64, 'tau': 0.1, 'alpha': 3.0, 'D': 0.5, 'beta': 20/64, 'f_act': lambda x: np.maximum(x,0),
+        'v_rel': 1.0, 'dt': 0.001, 'gamma_Hebb': 0.5, 'gamma_postboost': 0.2, 'gamma_decay': 0.1, 'eta': 0.05,
+    }
+    check_simulate_fast(network_params)
+    print('ring_attractor_0800_drugowitsch_lab.py: simulate_fast() equals simulate() bit for bit')
@@ -78,6 +78,7 @@ ratinabox.stylize_plots(); ratinabox.autosave_plots = True; ratinabox.figure_dir
 import numpy as np
 import matplotlib
 import matplotlib.pyplot as plt
+from scipy.linalg import blas
 
 %load_ext autoreload
 %autoreload 2
@@ -88,7 +89,140 @@ from tqdm import tqdm
 # ### Defining the `PyramidalNeurons` class 
 
 # %%
-class PyramidalNeurons(Neurons):
+class HistoryBuffer:
+    """A typed, preallocated ring buffer recording one quantity (a scalar or an array of fixed shape) against time.
+
+    Only every `decimation`-th call to append() is stored. Once `capacity` samples are held the oldest ones are
+    overwritten or, if `spill_path` is given, the full buffer is appended to the memory-mapped files
+    `{spill_path}_t.bin` / `{spill_path}_values.bin` first, so that nothing is lost and memory stays bounded.
+    """
+
+    def __init__(self, shape=(), dtype=np.float32, capacity=100_000, decimation=1, spill_path=None):
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self.capacity = capacity
+        self.decimation = decimation
+        self.spill_path = spill_path
+        self._t = np.empty(capacity, dtype=np.float64)
+        self._values = np.empty((capacity,) + self.shape, dtype=self.dtype)
+        self.reset()
+
+    def reset(self):
+        self._calls = 0
+        self._head = 0
+        self._size = 0
+        self._spilled = 0
+        if self.spill_path is not None:
+            open(f"{self.spill_path}_t.bin", "wb").close()
+            open(f"{self.spill_path}_values.bin", "wb").close()
+
+    def append(self, t, value):
+        self._calls += 1
+        if (self._calls - 1) % self.decimation:
+            return
+        if self._size == self.capacity and self.spill_path is not None:
+            # the buffer is full and chronological (head is back at 0), move it to disk
+            with open(f"{self.spill_path}_t.bin", "ab") as f:
+                self._t.tofile(f)
+            with open(f"{self.spill_path}_values.bin", "ab") as f:
+                self._values.tofile(f)
+            self._spilled += self.capacity
+            self._size = 0
+        self._t[self._head] = t
+        self._values[self._head] = np.nan if value is None else value
+        self._head = (self._head + 1) % self.capacity
+        self._size = min(self._size + 1, self.capacity)
+
+    def _chronological(self, buffer, filename, shape):
+        if self._size < self.capacity:
+            recent = buffer[: self._size]
+        else:
+            recent = np.concatenate([buffer[self._head :], buffer[: self._head]])
+        if not self._spilled:
+            return recent
+        spilled = np.memmap(filename, dtype=buffer.dtype, mode="r", shape=(self._spilled,) + shape)
+        return np.concatenate([spilled, recent])
+
+    @property
+    def t(self):
+        """Times of the recorded samples, oldest first."""
+        return self._chronological(self._t, f"{self.spill_path}_t.bin", ())
+
+    @property
+    def values(self):
+        """Recorded samples, oldest first, of shape (samples,) + shape."""
+        return self._chronological(self._values, f"{self.spill_path}_values.bin", self.shape)
+
+    def __len__(self):
+        return self._spilled + self._size
+
+
+class History(dict):
+    """Drop-in for the Neurons.history dict. Entries that are HistoryBuffers read as their recorded arrays and
+    history["t"] reads as the times of the "firingrate" buffer, so code doing np.array(self.history[...]) keeps
+    working. The buffers themselves are in self.buffers."""
+
+    def __init__(self, buffers):
+        super().__init__(buffers)
+        self.buffers = buffers
+
+    def __getitem__(self, key):
+        if key == "t" and "t" not in self.buffers:
+            return self.buffers["firingrate"].t
+        value = super().__getitem__(key)
+        return value.values if isinstance(value, HistoryBuffer) else value
+
+    def times(self, key):
+        return self.buffers[key].t
+
+    def record(self, key, t, value):
+        self.buffers[key].append(t, value)
+
+
+class BufferedHistory:
+    """Mixin for Neurons subclasses replacing the list based history with HistoryBuffers.
+
+    Controlled with the params
+        "history_capacity": samples kept in memory per quantity,
+        "history_decimation": dict of quantity -> keep every k-th sample (default 1),
+        "history_dtype": dtype of the recorded values,
+        "history_spill_dir": directory to spill full buffers to (None = overwrite the oldest samples).
+    """
+
+    history_defaults = {
+        "history_capacity": 100_000,
+        "history_decimation": {},
+        "history_dtype": np.float32,
+        "history_spill_dir": None,
+    }
+
+    def init_history(self, quantities):
+        """quantities: dict of name -> (shape, dtype or None for the history_dtype)"""
+        params = {**self.history_defaults, **self.params}
+        buffers = {}
+        for quantity, (shape, dtype) in quantities.items():
+            spill_dir = params["history_spill_dir"]
+            buffers[quantity] = HistoryBuffer(
+                shape=shape,
+                dtype=dtype or params["history_dtype"],
+                capacity=params["history_capacity"],
+                decimation=params["history_decimation"].get(quantity, 1),
+                spill_path=None if spill_dir is None else f"{spill_dir}/{self.name}_{quantity}",
+            )
+        self.history = History(buffers)
+
+    def save_to_history(self):
+        cell_spikes = np.random.uniform(0, 1, size=(self.n,)) < (self.Agent.dt * self.firingrate)
+        self.history.record("firingrate", self.Agent.t, self.firingrate)
+        self.history.record("spikes", self.Agent.t, cell_spikes)
+
+    def reset_history(self):
+        for buffer in self.history.buffers.values():
+            buffer.reset()
+
+
+# %%
+class PyramidalNeurons(BufferedHistory, Neurons):
     """The PyramidalNeuorn class defines a layer of Neurons() whos firing rates are derived from the firing rates in two DendriticCompartments. They are theta modulated, during early theta phase the apical DendriticCompartment (self.apical_compartment) drives the soma, during late theta phases the basal DendriticCompartment (self.basal_compartment) drives the soma.
 
     Must be initialised with an Agent and a 'params' dictionary.
@@ -121,9 +255,12 @@ class PyramidalNeurons(Neurons):
         self.params = default_params
         super().__init__(Agent, self.params)
 
-        self.history["loss"] = []
+        self.init_history(
+            {"firingrate": ((self.n,), None), "spikes": ((self.n,), bool), "loss": ((), None)}
+        )
         self.error = None
 
+        history_params = {key: self.params[key] for key in self.history_defaults if key in self.params}
         self.basal_compartment = DendriticCompartment(
             self.Agent,
             params={
@@ -131,6 +268,7 @@ class PyramidalNeurons(Neurons):
                 "name": f"{self.name}_basal",
                 "n": self.n,
                 "color": self.color,
+                **history_params,
             },
         )
         self.apical_compartment = DendriticCompartment(
@@ -140,8 +278,10 @@ class PyramidalNeurons(Neurons):
                 "name": f"{self.name}_apical",
                 "n": self.n,
                 "color": self.color,
+                **history_params,
             },
         )
+        self.rate_maps = RateMapService(self)
 
     def update(self):
         """Updates the firing rate of the layer. Saves a loss (lpf difference between basal and apical). Also adds noise."""
@@ -162,7 +302,7 @@ class PyramidalNeurons(Neurons):
             self.error = (dt / tau_smooth) * error + (1 - dt / tau_smooth) * (
                 self.error or error
             )
-        self.history["loss"].append(self.error)
+        self.history.record("loss", self.Agent.t, self.error)
         return
 
     def update_dendritic_compartments(self):
@@ -187,6 +327,9 @@ class PyramidalNeurons(Neurons):
             theta = theta_gating(
                 t=self.Agent.t, freq=self.theta_freq, frac=self.theta_frac
             )
+        # rate maps over the whole environment come from the cached compartment maps (see RateMapService)
+        if evaluate_at == "all" and set(kwargs) <= {"theta"}:
+            return self.rate_maps(theta)
         fr_basal, fr_apical = 0, 0
         # these are special cases, no need to even get their fr's if they aren't used
         if theta != 0:
@@ -210,12 +353,10 @@ class PyramidalNeurons(Neurons):
             ylim = 0
         else:
             ylim = ax.get_ylim()[1]
-        t = np.array(self.history["t"]) / 60
+        t = self.history.times("loss") / 60
         loss = self.history["loss"]
         ax.plot(t, loss, color=self.color, label=self.name)
-        ax.set_ylim(
-            bottom=0, top=max(ylim, np.nanmax(np.array(loss, dtype=np.float64)))
-        )
+        ax.set_ylim(bottom=0, top=max(ylim, np.nanmax(loss)))
         ax.set_xlim(left=0)
         ax.legend(frameon=False)
         ax.set_xlabel("Training time / min")
@@ -223,22 +364,24 @@ class PyramidalNeurons(Neurons):
         return fig, ax
 
     def plot_rate_map(self, route="basal", **kwargs):
-        """This is a wrapper function for the general Neuron class function plot_rate_map. It takes the same arguments as Neurons.plot_rate_map() but, in addition, route can be set to basal or apical in which case theta is set correspondingly and teh soma with take its input from downstream or upstream sources entirely.
+        """This is a wrapper function for the general Neuron class function plot_rate_map. It takes the same arguments as Neurons.plot_rate_map() but, in addition, route can be set to basal or apical in which case theta is set correspondingly and teh soma with take its input from downstream or upstream sources entirely. route can also be a number, the theta of a mixture of the two.
 
         The arguments for the standard plottiong function plot_rate_map() can be passed as usual as kwargs.
 
         Args:
-            route (str, optional): _description_. Defaults to 'basal'.
+            route (str or float, optional): 'basal', 'apical' or theta. Defaults to 'basal'.
         """
         if route == "basal":
             theta = 0
         elif route == "apical":
             theta = 1
+        else:
+            theta = route
         fig, ax = super().plot_rate_map(**kwargs, theta=theta)
         return fig, ax
 
 
-class DendriticCompartment(Neurons):
+class DendriticCompartment(BufferedHistory, Neurons):
     """The DendriticCompartment class defines a layer of Neurons() whos firing rates are an activated linear combination of input layers. This class is a subclass of Neurons() and inherits it properties/plotting functions.
 
     Must be initialised with an Agent and a 'params' dictionary.
@@ -271,6 +414,20 @@ class DendriticCompartment(Neurons):
         self.firingrate_temp = None
         self.firingrate_prime_temp = None
         self.inputs = {}
+        self.init_history({"firingrate": ((self.n,), None), "spikes": ((self.n,), bool)})
+        # bumped whenever the weights change, keys the cached rate maps of the soma (see RateMapService)
+        self.weights_version = 0
+
+        # all input layers side by side: contiguous weight, plasticity induction and input buffers of shape
+        # (n, n_in_total) / (n_in_total,) plus per-column learning parameters. self.inputs[name]["w"], ["PI"]
+        # and ["I"] are views into them (see _restack_inputs())
+        self.w = np.zeros((self.n, 0))
+        self.PI = np.zeros((self.n, 0))
+        self.I = np.zeros(0)
+        self.eta = np.zeros(0)
+        self.L1 = np.zeros(0)
+        self.L2 = np.zeros(0)
+        self.inv_tau_PI = np.zeros(0)
 
     def add_input(
         self, input_layer, eta=0.001, w_init=0.1, L1=0.0001, L2=0.001, tau_PI=100e-3
@@ -292,9 +449,9 @@ class DendriticCompartment(Neurons):
         PI = np.zeros(n_in)
         if name in self.inputs.keys():
             print(
-                f"There already exists a layer called {input_layer_name}. Overwriting it now."
+                f"There already exists a layer called {name}. Overwriting it now."
             )
-        self.inputs[name] = {}
+        self.inputs[name] = InputLayer(self)
         self.inputs[name]["layer"] = input_layer
         self.inputs[name]["w"] = w
         self.inputs[name]["w_init"] = w.copy()
@@ -305,6 +462,59 @@ class DendriticCompartment(Neurons):
         self.inputs[name]["L2"] = L2
         self.inputs[name]["L1"] = L1
         self.inputs[name]["tau_PI"] = tau_PI
+        self._restack_inputs()
+
+    def _restack_inputs(self):
+        """(Re)builds the contiguous buffers from the entries of self.inputs and points each entry's "w", "PI"
+        and "I" at its block of columns."""
+        inputs = list(self.inputs.values())
+        sizes = [inputlayer["layer"].n for inputlayer in inputs]
+        self.w = np.ascontiguousarray(np.hstack([inputlayer["w"] for inputlayer in inputs]))
+        self.PI = np.ascontiguousarray(
+            np.hstack([np.broadcast_to(inputlayer["PI"], (self.n, size)) for inputlayer, size in zip(inputs, sizes)])
+        )
+        self.I = np.concatenate([inputlayer["I"] for inputlayer in inputs])
+        self._restack_parameters()
+        self._dw = np.zeros_like(self.w)
+        self._ger = blas.get_blas_funcs("ger", (self.PI,))
+        # whether ger updates PI in place (checked at the first update_weights())
+        self._ger_in_place = None
+        # buffers of get_state(evaluate_at="last"): concatenated input, voltage and activation outputs
+        self._I_last = np.zeros_like(self.I)
+        self._V = np.zeros(self.n)
+        self._fr = np.zeros(self.n)
+        self._fr_prime = np.zeros(self.n)
+        self._active = np.zeros(self.n, dtype=bool)
+        self._ones = np.ones(self.n)
+
+        self._columns = []
+        start = 0
+        for inputlayer, size in zip(inputs, sizes):
+            columns = slice(start, start + size)
+            dict.__setitem__(inputlayer, "w", self.w[:, columns])
+            dict.__setitem__(inputlayer, "PI", self.PI[:, columns])
+            dict.__setitem__(inputlayer, "I", self.I[columns])
+            inputlayer["I_temp"] = self._I_last[columns]
+            self._columns.append(columns)
+            start += size
+        self.weights_version += 1
+
+    def _restack_parameters(self):
+        """(Re)builds the per-column learning parameters from the "eta", "L1", "L2" and "tau_PI" entries of
+        self.inputs. Called by InputLayer when one of them is set again."""
+        inputs = list(self.inputs.values())
+        sizes = [inputlayer["layer"].n for inputlayer in inputs]
+        self.eta = np.repeat([inputlayer["eta"] for inputlayer in inputs], sizes).astype(float)
+        self.L1 = np.repeat([inputlayer["L1"] for inputlayer in inputs], sizes).astype(float)
+        self.L2 = np.repeat([inputlayer["L2"] for inputlayer in inputs], sizes).astype(float)
+        # fixed inputs (eta=0) get no plasticity induction at all, like in the per-layer update
+        self.inv_tau_PI = np.repeat(
+            [1 / inputlayer["tau_PI"] if inputlayer["eta"] != 0 else 0 for inputlayer in inputs], sizes
+        ).astype(float)
+        # per column factors of the weight update, and of the PI low-pass for the last dt seen
+        self._eta_L1 = self.eta * self.L1
+        self._w_decay = 1 - self.eta * self.L2
+        self._lowpass_dt = None
 
     def get_state(self, evaluate_at="last", **kwargs):
         """Returns the "firing rate" of the dendritic compartment. By default this layer uses the last saved firingrate from its input layers. Alternatively evaluate_at and kwargs can be set to be anything else which will just be passed to the input layer for evaluation.
@@ -315,68 +525,119 @@ class DendriticCompartment(Neurons):
         Returns:
             firingrate: array of firing rates
         """
+        inputs = self.inputs.values()
         if evaluate_at == "last":
-            V = np.zeros(self.n)
-        elif evaluate_at == "all":
-            V = np.zeros(
-                (self.n, self.Agent.Environment.flattened_discrete_coords.shape[0])
+            # the input firing rates are gathered into the preallocated concatenated input vector
+            I = self._I_last
+            for inputlayer, columns in zip(inputs, self._columns):
+                I[columns] = inputlayer["layer"].firingrate
+            V = np.matmul(self.w, I, out=self._V)
+        else:  # kick can down the road let input layer decide how to evaluate the firingrate
+            I = np.concatenate(
+                [inputlayer["layer"].get_state(evaluate_at, **kwargs) for inputlayer in inputs]
             )
-        else:
-            V = np.zeros((self.n, kwargs["pos"].shape[0]))
-
-        for inputlayer in self.inputs.values():
-            w = inputlayer["w"]
-            if evaluate_at == "last":
-                I = inputlayer["layer"].firingrate
-            else:  # kick can down the road let input layer decide how to evaluate the firingrate
-                I = inputlayer["layer"].get_state(evaluate_at, **kwargs)
-            inputlayer["I_temp"] = I
-            V += np.matmul(w, I)
-        firingrate = utils.activate(V, other_args=self.activation_params)
-        firingrate_prime = utils.activate(
-            V, other_args=self.activation_params, deriv=True
-        )
+            for inputlayer, columns in zip(inputs, self._columns):
+                inputlayer["I_temp"] = I[columns]
+            V = np.matmul(self.w, I)
+        firingrate, firingrate_prime = self.activate(V, last=(evaluate_at == "last"))
 
         self.firingrate_temp = firingrate
         self.firingrate_prime_temp = firingrate_prime
 
         return firingrate
 
+    def activate(self, V, last=False):
+        """Returns the activated voltage and its derivative in one pass. 'linear' and 'relu' are computed directly
+        (into reused buffers when last=True), other activations go through utils.activate().
+        """
+        activation_params = self.activation_params
+        activation = activation_params.get("activation", "sigmoid")
+        if activation == "linear":
+            firingrate = V
+            firingrate_prime = self._ones if last else np.ones(V.shape)
+        elif activation == "relu":
+            gain = activation_params.get("gain", 1)
+            firingrate = np.subtract(V, activation_params.get("threshold", 0), out=self._fr if last else None)
+            firingrate_prime = np.greater(firingrate, 0, out=self._active if last else None)
+            np.maximum(firingrate, 0, out=firingrate)
+            firingrate *= gain
+            firingrate_prime = np.multiply(firingrate_prime, gain, out=self._fr_prime if last else None)
+        else:
+            firingrate = utils.activate(V, other_args=activation_params)
+            firingrate_prime = utils.activate(V, other_args=activation_params, deriv=True)
+        return firingrate, firingrate_prime
+
     def update(self):
         """Updates firingrate of this compartment and saves it to file"""
         self.get_state()
-        self.firingrate = self.firingrate_temp.reshape(-1)
-        self.firingrate_deriv = self.firingrate_prime_temp.reshape(-1)
-        for inputlayer in self.inputs.values():
-            inputlayer["I"] = inputlayer["I_temp"].reshape(-1)
+        # copies, the temp arrays live in buffers that the next get_state() overwrites
+        self.firingrate = self.firingrate_temp.reshape(-1).copy()
+        self.firingrate_deriv = self.firingrate_prime_temp.reshape(-1).copy()
+        self.I[:] = self._I_last
         self.save_to_history()
         return
 
     def update_weights(self):
-        """Implements the weight update: dendritic prediction of somatic activity."""
+        """Implements the weight update: dendritic prediction of somatic activity.
+
+        All input layers are updated at once, in place, on the stacked buffers (see _restack_inputs()):
+            PI <- (1 - dt/tau_PI) PI + (dt/tau_PI) delta I^T     (one BLAS rank-1 update)
+            w  <- w + eta (PI - L2 w - L1 sign(w))
+        with dt/tau_PI, eta, L1 and L2 applied per input column."""
         target = self.soma.firingrate
         delta = (target - self.firingrate) * (self.firingrate_deriv)
         dt = self.Agent.dt
-        for inputlayer in self.inputs.values():
-            eta = inputlayer["eta"]
-            if eta != 0:
-                tau_PI = inputlayer["tau_PI"]
-                assert (dt / tau_PI) < 0.2
-                I = inputlayer["I"]
-                w = inputlayer["w"]
-                # first updates plasticity induction variable (smoothed delta error outer product with the input current for this input layer)
-                PI_old = inputlayer["PI"]
-                PI_update = np.outer(delta, I)
-                PI_new = (dt / tau_PI) * PI_update + (1 - dt / tau_PI) * PI_old
-                inputlayer["PI"] = PI_new
-                # updates weights
-                dw = eta * (
-                    PI_new - inputlayer["L2"] * w - inputlayer["L1"] * np.sign(w)
-                )
-                inputlayer["w"] = w + dw
+        if not self.eta.any():
+            return
+        if self._lowpass_dt != dt:
+            self._lowpass = dt * self.inv_tau_PI
+            assert self._lowpass.max() < 0.2
+            self._lowpass_keep = 1 - self._lowpass
+            self._lowpass_dt = dt
+        # first updates plasticity induction variable (smoothed delta error outer product with the input currents)
+        self.PI *= self._lowpass_keep
+        # the buffers are C-ordered so the Fortran-ordered BLAS routine updates PI^T += (lowpass * I) delta^T
+        PI_T = self._ger(1.0, self._lowpass * self.I, delta, a=self.PI.T, overwrite_a=True)
+        if self._ger_in_place is None:
+            self._ger_in_place = np.shares_memory(PI_T, self.PI)
+        if not self._ger_in_place:
+            self.PI[...] = PI_T.T
+        # updates weights
+        dw = np.sign(self.w, out=self._dw)
+        dw *= self._eta_L1
+        self.w *= self._w_decay
+        self.w -= dw
+        np.multiply(self.PI, self.eta, out=dw)
+        self.w += dw
+        self.weights_version += 1
         return
 
 
+class InputLayer(dict):
+    """An entry of DendriticCompartment.inputs. "w", "PI" and "I" are views into the compartment's stacked buffers,
+    so assigning to them (e.g. compartment.inputs["PlaceCells"]["w"] = np.identity(n)) copies the values into the
+    buffer instead of rebinding the key. Setting "w" bumps the compartment's weights_version, setting "eta", "L1",
+    "L2" or "tau_PI" again rebuilds the compartment's per-column learning parameters."""
+
+    stacked_keys = ("w", "PI", "I")
+    parameter_keys = ("eta", "L1", "L2", "tau_PI")
+
+    def __init__(self, compartment=None):
+        super().__init__()
+        self.compartment = compartment
+
+    def __setitem__(self, key, value):
+        restack = key in self.parameter_keys and key in self and self.compartment is not None
+        if key in self.stacked_keys and key in self:
+            self[key][...] = value
+        else:
+            super().__setitem__(key, value)
+        if key == "w" and self.compartment is not None:
+            self.compartment.weights_version += 1
+        if restack:
+            self.compartment._restack_parameters()
+
+
 def theta_gating(t, freq=10, frac=0.5):
     T = 1 / freq
     phase = ((t / T) % 1) % 1
@@ -385,6 +646,251 @@ def theta_gating(t, freq=10, frac=0.5):
     elif phase >= frac:
         return 0
 
+
+class NetworkScheduler:
+    """Runs the whole network (agent + cell layers) step by step from a compiled, flat list of operations.
+
+    The update order is derived once from the `inputs` wiring of the layers: a layer is updated after the layers
+    feeding into it, and where the wiring is recurrent (e.g. RingAttractor -> ConjunctiveCells -> RingAttractor)
+    the layer with the fewest not-yet-updated inputs goes first (ties broken by the order of `layers`) and reads
+    the others' firing rates from the previous step. The step is then compiled into a list of callables:
+        • the agent and layers without inputs (PlaceCells, VelocityCells, ...) keep their own update(),
+        • noiseless FeedForwardLayers become one matmul over a preallocated concatenated input and weight matrix
+          plus an in-place activation, writing straight into the layer's firingrate buffer,
+        • PyramidalNeurons become their two compartment updates, the soma update and the weight update.
+    The weights of a compiled FeedForwardLayer are gathered into one matrix at compile time and its inputs[name]["w"]
+    become views into it: in-place edits are seen right away, reassigned weights are copied in at the next step.
+    Biases are read at every step. Call compile() again after adding input layers or changing activation_params.
+
+    Args:
+        Agent: the agent, updated first at every step
+        layers: the cell layers
+        record (bool): whether compiled layers still save their firing rates to history every step
+    """
+
+    def __init__(self, Agent, layers, record=True):
+        self.Agent = Agent
+        self.layers = list(layers)
+        self.record = record
+        self.order = self.derive_order(self.layers)
+        self.compile()
+
+    @staticmethod
+    def input_layers(layer):
+        """The layers feeding into `layer` (through its compartments for PyramidalNeurons)."""
+        if hasattr(layer, "basal_compartment"):
+            inputs = [*layer.basal_compartment.inputs.values(), *layer.apical_compartment.inputs.values()]
+        else:
+            inputs = getattr(layer, "inputs", {}).values()
+        return [inputlayer["layer"] for inputlayer in inputs]
+
+    @classmethod
+    def derive_order(cls, layers):
+        remaining = list(layers)
+        order = []
+        while remaining:
+            # number of inputs of each remaining layer that are still to be updated this step (self-loops don't count)
+            pending = [
+                sum(1 for source in cls.input_layers(layer) if source is not layer and any(source is other for other in remaining))
+                for layer in remaining
+            ]
+            order.append(remaining.pop(int(np.argmin(pending))))
+        return order
+
+    def compile(self):
+        """(Re)builds the flat list of operations making up one step."""
+        self.ops = [self.Agent.update]
+        for layer in self.order:
+            if hasattr(layer, "basal_compartment"):
+                self.ops += [
+                    layer.basal_compartment.update,
+                    layer.apical_compartment.update,
+                    layer.update,
+                    layer.update_weights,
+                ]
+            elif getattr(layer, "inputs", None) and not getattr(layer, "noise_std", 0):
+                self.ops.append(self._compile_feedforward(layer))
+            else:
+                self.ops.append(layer.update)
+        return self.ops
+
+    def _compile_feedforward(self, layer):
+        inputs = list(layer.inputs.values())
+        sources = [inputlayer["layer"] for inputlayer in inputs]
+        w = np.ascontiguousarray(np.hstack([inputlayer["w"] for inputlayer in inputs]), dtype=float)
+        I = np.zeros(w.shape[1])
+        columns = np.cumsum([0] + [source.n for source in sources])
+        columns = [slice(start, stop) for start, stop in zip(columns[:-1], columns[1:])]
+        slices = [I[block] for block in columns]
+        # the layer's weights become views into the concatenated matrix, so in-place edits are seen by the step;
+        # weights assigned anew (inputs[name]["w"] = ...) are copied in at the next step
+        views = [w[:, block] for block in columns]
+        for inputlayer, view in zip(inputs, views):
+            inputlayer["w"] = view
+        activation_params = dict(getattr(layer, "activation_params", {"activation": "linear"}))
+        activation = activation_params.get("activation", "sigmoid")
+        gain = activation_params.get("gain", 1)
+        threshold = activation_params.get("threshold", 0)
+        # the firing rate and the derivative of the activation (firingrate_prime, as set by FeedForwardLayer.get_state(),
+        # also kept as firingrate_deriv like DendriticCompartment.update()) are updated in place
+        firingrate = layer.firingrate
+        if not (isinstance(firingrate, np.ndarray) and firingrate.shape == (layer.n,)
+                and firingrate.dtype == float and firingrate.flags.writeable):
+            firingrate = layer.firingrate = np.array(firingrate, dtype=float).reshape(layer.n)
+        firingrate_prime = layer.firingrate_prime = layer.firingrate_deriv = np.ones(layer.n)
+        active = np.zeros(layer.n, dtype=bool)
+        record = self.record
+
+        def step():
+            for inputlayer, view, block, source, buffer in zip(inputs, views, columns, sources, slices):
+                if inputlayer["w"] is not view:
+                    w[:, block] = inputlayer["w"]
+                    inputlayer["w"] = view
+                np.copyto(buffer, source.firingrate)
+            np.matmul(w, I, out=firingrate)
+            biases = getattr(layer, "biases", None)
+            if biases is not None:
+                np.add(firingrate, biases, out=firingrate)
+            if activation == "relu":
+                np.subtract(firingrate, threshold, out=firingrate)
+                np.greater(firingrate, 0, out=active)
+                np.multiply(active, gain, out=firingrate_prime)
+                np.maximum(firingrate, 0, out=firingrate)
+                np.multiply(firingrate, gain, out=firingrate)
+            elif activation != "linear":
+                firingrate_prime[:] = utils.activate(firingrate, other_args=activation_params, deriv=True)
+                firingrate[:] = utils.activate(firingrate, other_args=activation_params)
+            if record:
+                layer.save_to_history()
+
+        return step
+
+    def run(self, n_steps, callback=None, callback_every=1000):
+        """Runs n_steps steps. callback(k) is called after every callback_every steps (and at the end) with the
+        number of steps k run since the previous call, e.g. callback=tqdm_bar.update."""
+        ops = self.ops
+        done = 0
+        while done < n_steps:
+            chunk = min(callback_every, n_steps - done)
+            for _ in range(chunk):
+                for op in ops:
+                    op()
+            done += chunk
+            if callback is not None:
+                callback(chunk)
+        return self
+
+
+class RateMapService:
+    """Rate maps of a layer of PyramidalNeurons over the whole discretised environment, i.e.
+    soma.get_state(evaluate_at="all", theta=theta), for plot_rate_map().
+
+    The layer graph upstream of the soma is evaluated once for all positions at a time (one matmul per input layer
+    over its whole rate map) and the basal and apical compartment maps are cached. They are only recomputed when the
+    key changes: the weights_version of every DendriticCompartment in the graph, a fingerprint of the weights and
+    biases of other layers with inputs (e.g. FeedForwardLayer) and the activation parameters. Both routes and any theta
+    mixture are then served from the two cached maps. In-place edits of compartment.w other than through
+    update_weights() or inputs[name]["w"] = ... are not seen, call invalidate() after those.
+
+    Recurrent loops are cut at the soma: layers feeding on a soma that is still being evaluated (RingAttractor ->
+    ConjunctiveCells -> RingAttractor.apical_compartment) see its basal route map, the sensory estimate of its rate
+    map.
+    """
+
+    def __init__(self, soma):
+        self.soma = soma
+        self.n_evaluations = 0
+        self.invalidate()
+
+    def invalidate(self):
+        self._key = None
+        self._maps = None
+
+    def __call__(self, theta=0):
+        basal, apical = self.compartment_maps()
+        if theta == 0:
+            return basal.copy()
+        if theta == 1:
+            return apical.copy()
+        return (1 - theta) * basal + theta * apical
+
+    def graph(self):
+        """All layers upstream of the soma (the soma included)."""
+        graph, stack = {}, [self.soma]
+        while stack:
+            layer = stack.pop()
+            if id(layer) not in graph:
+                graph[id(layer)] = layer
+                stack += NetworkScheduler.input_layers(layer)
+        return list(graph.values())
+
+    @staticmethod
+    def layer_key(layer):
+        if hasattr(layer, "basal_compartment"):
+            return tuple(
+                (compartment.weights_version, repr(compartment.activation_params))
+                for compartment in (layer.basal_compartment, layer.apical_compartment)
+            )
+        inputs = getattr(layer, "inputs", None)
+        if not inputs:
+            return None  # place cells, velocity cells... have no weights
+        weights = [inputlayer["w"] for inputlayer in inputs.values()]
+        if getattr(layer, "biases", None) is not None:
+            weights.append(layer.biases)
+        fingerprint = hash(tuple(np.ascontiguousarray(w).tobytes() for w in weights))
+        return fingerprint, repr(getattr(layer, "activation_params", None))
+
+    def compartment_maps(self):
+        """The (basal, apical) compartment rate maps, each of shape (n, n_positions). Don't modify them."""
+        key = tuple((id(layer), self.layer_key(layer)) for layer in self.graph())
+        if key != self._key:
+            maps = {}
+            self._rate_map(self.soma, maps, set())
+            self._maps = maps[id(self.soma.basal_compartment)], maps[id(self.soma.apical_compartment)]
+            self._key = key
+            self.n_evaluations += 1
+        return self._maps
+
+    def _rate_map(self, layer, maps, evaluating):
+        """Rate map of `layer` over the environment, memoised in `maps` by id. The rate map of a soma seen by other
+        layers is its basal route map."""
+        if id(layer) in maps:
+            return maps[id(layer)]
+        if hasattr(layer, "basal_compartment"):
+            if id(layer) in evaluating:
+                return self._compartment_map(layer.basal_compartment, maps, evaluating)
+            evaluating.add(id(layer))
+            basal = self._compartment_map(layer.basal_compartment, maps, evaluating)
+            self._compartment_map(layer.apical_compartment, maps, evaluating)
+            evaluating.discard(id(layer))
+            rate_map = basal
+        elif getattr(layer, "inputs", None):
+            V = self._input_current(layer, maps, evaluating)
+            if getattr(layer, "biases", None) is not None:
+                V = V + np.reshape(layer.biases, (-1, 1))
+            rate_map = utils.activate(V, other_args=layer.activation_params)
+        else:
+            rate_map = layer.get_state(evaluate_at="all")
+        maps[id(layer)] = rate_map
+        return rate_map
+
+    def _compartment_map(self, compartment, maps, evaluating):
+        if id(compartment) in maps:
+            return maps[id(compartment)]
+        if id(compartment) in evaluating:
+            raise ValueError(f"{compartment.name} feeds back into itself without passing through an apical compartment")
+        evaluating.add(id(compartment))
+        rate_map, _ = compartment.activate(self._input_current(compartment, maps, evaluating))
+        evaluating.discard(id(compartment))
+        maps[id(compartment)] = rate_map
+        return rate_map
+
+    def _input_current(self, layer, maps, evaluating):
+        V = 0
+        for inputlayer in layer.inputs.values():
+            V = V + inputlayer["w"] @ self._rate_map(inputlayer["layer"], maps, evaluating)
+        return V
+
 # %% [markdown]
 # ### Building the network
 # This involves initialising the environment, the agent and all of the cells layers shown in the above figure. Then we must set the inputs to each cell layer) and, for those layers where the weights are fixed, set them correctly. 
@@ -470,18 +976,14 @@ ConjunctiveCells_right.activation_params = {
 # Train it for 20 minutes
 
 # %%
-for i in tqdm(range(int(10 * 60 / Ag.dt))):
-    # update agent
-    Ag.update()
-    # update firing rates of all the cell layers
-    PlaceCells_.update()
-    VelocityCells_.update()
-    ConjunctiveCells_left.update()
-    ConjunctiveCells_right.update()
-    RingAttractor.update_dendritic_compartments()
-    RingAttractor.update()
-    # finally, update the weights
-    RingAttractor.update_weights()
+# the scheduler works out the update order from the wiring (agent, place & velocity cells, conjunctive cells, ring
+# attractor compartments, soma, then the weights) and compiles it into one flat list of operations
+scheduler = NetworkScheduler(
+    Ag, [PlaceCells_, VelocityCells_, ConjunctiveCells_left, ConjunctiveCells_right, RingAttractor]
+)
+n_steps = int(10 * 60 / Ag.dt)
+with tqdm(total=n_steps) as progress:
+    scheduler.run(n_steps, callback=progress.update)
 
 # %% [markdown]
 # ### Analysis 
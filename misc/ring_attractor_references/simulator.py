@@ -0,0 +1,587 @@
+# Common simulation core for the reference models: a Model protocol (state layout, step or derivative
+# function, input adapter), interchangeable NumPy / PyTorch (CPU) / Numba backends, and integrators,
+# recorders and batching written once for all models. The ports of the reference models onto this
+# core are in simulator_models.py.
+#
+# usage:
+#     from simulator import Simulator
+#     from simulator_models import DrugowitschRing
+#     sim = Simulator(DrugowitschRing(N=256), backend="numpy", batch=64, seed=0)
+#     recording = sim.run(10_000, record=["r"], record_every=10)
+#     recording["r"]  # np.array of shape (1000, 64, 256)
+#
+# The ports are checked against their reference files on the numpy backend. The torch and numba
+# backends are optional dependencies and untested until `python simulator_models.py` (which
+# compares them with the numpy backend for every port, where they are installed) passes.
+#
+# How a model is written
+# ----------------------
+# The state of a batch of networks is ONE 2-D array of shape (batch, state_size): the variables of
+# model.state_layout ({"name": size}) side by side, in that order. A model either defines the
+# right-hand side of an ODE (make_derivative, integrated with euler/rk4) or a discrete update
+# (make_step, e.g. for spiking resets). Both are factories taking the backend ops and returning a
+# function of plain arrays,
+#     derivative(t, x, u, p) -> dx/dt        step(t, x, u, p) -> x at t+1
+# where t is the step index, x the (batch, state_size) state, u the (batch, n_inputs) input of the
+# step and p the tuple of model.parameters() converted to backend arrays. The functions may only
+# use the ops (ops.matmul, ops.relu, ...) and array arithmetic/slicing, so the same code runs on
+# numpy arrays, torch tensors and inside numba-compiled loops. Inputs come from the model's input
+# adapter, model.inputs(t0, t1, batch, rng) -> (t1-t0, batch, n_inputs) numpy array, which is
+# evaluated chunk by chunk so long runs never hold the input of all steps.
+import types
+from typing import Mapping, Protocol, Tuple, runtime_checkable
+import numpy as np
+
+
+@runtime_checkable
+class Model(Protocol):
+    """What the Simulator needs from a model (see the module header).
+
+    Attributes
+    ----------
+    state_layout : mapping {variable name: size}
+        Variables packed side by side into the (batch, state_size) state.
+    n_inputs : int
+        Number of input channels per step and batch element.
+    dt : float
+        Time step (integration step of derivative models).
+    """
+    state_layout: Mapping[str, int]
+    n_inputs: int
+    dt: float
+
+    def parameters(self) -> Tuple:
+        """Arrays and scalars handed to the step/derivative function, converted to the backend."""
+
+    def initial_state(self, batch: int, rng: np.random.Generator) -> np.ndarray:
+        """Initial state of shape (batch, state_size)."""
+
+    def inputs(self, t0: int, t1: int, batch: int, rng: np.random.Generator) -> np.ndarray:
+        """Input adapter: the inputs of steps t0..t1-1, of shape (t1-t0, batch, n_inputs)."""
+
+
+class BaseModel:
+    """Defaults and helpers for models: no inputs, zero initial state, state (un)packing."""
+    state_layout = {}
+    n_inputs = 0
+    dt = 1.0
+
+    @property
+    def state_size(self):
+        return sum(self.state_layout.values())
+
+    def state_slices(self):
+        """{variable name: slice of the state columns}"""
+        slices, start = {}, 0
+        for name, size in self.state_layout.items():
+            slices[name] = slice(start, start + size)
+            start += size
+        return slices
+
+    def pack(self, **variables):
+        """Packs (batch, size) arrays of every variable into a state."""
+        return np.concatenate([np.atleast_2d(variables[name]) for name in self.state_layout], axis=1)
+
+    def unpack(self, x):
+        """{variable name: x[..., slice]} for a state or recorded states."""
+        return {name: x[..., columns] for name, columns in self.state_slices().items()}
+
+    def parameters(self):
+        return ()
+
+    def initial_state(self, batch, rng):
+        return np.zeros((batch, self.state_size))
+
+    def inputs(self, t0, t1, batch, rng):
+        return np.zeros((t1 - t0, batch, self.n_inputs))
+
+
+def constant_inputs(u):
+    """Input adapter feeding the same input u (of shape (n_inputs,) or (batch, n_inputs)) every step."""
+    u = np.asarray(u, dtype=np.float64)
+
+    def adapter(t0, t1, batch, rng):
+        return np.broadcast_to(u, (t1 - t0, batch, u.shape[-1]))
+    return adapter
+
+
+def array_inputs(u):
+    """Input adapter reading the steps from an array of shape (T, n_inputs) or (T, batch, n_inputs)."""
+    u = np.asarray(u, dtype=np.float64)
+
+    def adapter(t0, t1, batch, rng):
+        if t1 > len(u):
+            raise IndexError(f"The input array has {len(u)} steps, steps {t0}..{t1-1} were requested")
+        chunk = u[t0:t1]
+        return np.broadcast_to(chunk[:, np.newaxis] if chunk.ndim == 2 else chunk, (t1 - t0, batch, u.shape[-1]))
+    return adapter
+
+
+#
+# backends
+#
+def _numpy_ops():
+    def sum_last(x):
+        return np.sum(x, axis=-1, keepdims=True)
+
+    def max_last(x):
+        return np.max(x, axis=-1, keepdims=True)
+
+    def roll_last(x, shift):
+        return np.roll(x, shift, axis=-1)
+
+    def gt(x, value):
+        return (x > value).astype(x.dtype)
+
+    def randn(shape):
+        # the global legacy generator, like the np.random.randn calls of the reference scripts
+        return np.random.standard_normal(shape)
+
+    def concat(arrays):
+        return np.concatenate(arrays, axis=-1)
+
+    return types.SimpleNamespace(
+        relu=lambda x: np.maximum(x, 0.0),
+        clip=np.clip,
+        exp=np.exp,
+        tanh=np.tanh,
+        sigmoid=lambda x: 1 / (1 + np.exp(-x)),
+        abs=np.abs,
+        square=np.square,
+        matmul=np.matmul,
+        where=np.where,
+        sum_last=sum_last,
+        max_last=max_last,
+        roll_last=roll_last,
+        gt=gt,
+        randn=randn,
+        concat=concat,
+    )
+
+
+def _torch_ops(torch, dtype):
+    def where(condition, a, b):
+        return torch.where(condition, torch.as_tensor(a, dtype=dtype), torch.as_tensor(b, dtype=dtype))
+
+    return types.SimpleNamespace(
+        relu=torch.relu,
+        clip=lambda x, low, high: torch.clamp(x, low, high),
+        exp=torch.exp,
+        tanh=torch.tanh,
+        sigmoid=torch.sigmoid,
+        abs=torch.abs,
+        square=torch.square,
+        matmul=torch.matmul,
+        where=where,
+        sum_last=lambda x: x.sum(-1, keepdim=True),
+        max_last=lambda x: x.amax(-1, keepdim=True),
+        roll_last=lambda x, shift: torch.roll(x, shift, -1),
+        gt=lambda x, value: (x > value).to(x.dtype),
+        randn=lambda shape: torch.randn(shape, dtype=dtype),
+        concat=lambda arrays: torch.cat(arrays, -1),
+    )
+
+
+def _numba_ops(numba):
+    # nopython versions of the ops on 2-D (batch, n) arrays, callable from the compiled loops
+    @numba.njit
+    def relu(x):
+        return np.maximum(x, 0.0)
+
+    @numba.njit
+    def clip(x, low, high):
+        return np.minimum(np.maximum(x, low), high)
+
+    @numba.njit
+    def exp(x):
+        return np.exp(x)
+
+    @numba.njit
+    def tanh(x):
+        return np.tanh(x)
+
+    @numba.njit
+    def sigmoid(x):
+        return 1 / (1 + np.exp(-x))
+
+    @numba.njit
+    def abs_(x):
+        return np.abs(x)
+
+    @numba.njit
+    def square(x):
+        return x * x
+
+    @numba.njit
+    def matmul(a, b):
+        return np.ascontiguousarray(a) @ np.ascontiguousarray(b)
+
+    @numba.njit
+    def where(condition, a, b):
+        return np.where(condition, a, b)
+
+    @numba.njit
+    def sum_last(x):
+        return np.sum(x, axis=1).reshape((x.shape[0], 1))
+
+    @numba.njit
+    def max_last(x):
+        out = np.empty((x.shape[0], 1))
+        for i in range(x.shape[0]):
+            out[i, 0] = np.max(x[i])
+        return out
+
+    @numba.njit
+    def roll_last(x, shift):
+        shift = shift % x.shape[1]
+        if shift == 0:
+            return x.copy()
+        return np.concatenate((x[:, x.shape[1] - shift:], x[:, :x.shape[1] - shift]), axis=1)
+
+    @numba.njit
+    def gt(x, value):
+        return (x > value) * 1.0
+
+    @numba.njit
+    def randn(shape):
+        return np.random.standard_normal(shape)
+
+    @numba.njit
+    def concat(arrays):
+        return np.concatenate(arrays, axis=1)
+
+    return types.SimpleNamespace(
+        relu=relu, clip=clip, exp=exp, tanh=tanh, sigmoid=sigmoid, abs=abs_, square=square, matmul=matmul,
+        where=where, sum_last=sum_last, max_last=max_last, roll_last=roll_last, gt=gt, randn=randn, concat=concat,
+    )
+
+
+class NumpyBackend:
+    """Plain numpy, the loops run in Python."""
+    name = "numpy"
+
+    def __init__(self, dtype=np.float64):
+        self.dtype = dtype
+        self.ops = _numpy_ops()
+
+    def asarray(self, x):
+        if np.isscalar(x):
+            return x
+        x = np.asarray(x)
+        return x.astype(self.dtype) if x.dtype.kind == "f" else x
+
+    def to_numpy(self, x):
+        return np.asarray(x)
+
+    def zeros(self, shape):
+        return np.zeros(shape, dtype=self.dtype)
+
+    def seed(self, seed):
+        np.random.seed(seed)
+
+    def compile(self, function):
+        return function
+
+    def no_grad(self):
+        return _NullContext()
+
+
+class TorchBackend:
+    """PyTorch tensors on the CPU (float64 by default, so results match the numpy backend)."""
+    name = "torch"
+
+    def __init__(self, dtype=None, n_threads=None):
+        import torch
+        self.torch = torch
+        self.dtype = torch.float64 if dtype is None else dtype
+        if n_threads is not None:
+            torch.set_num_threads(n_threads)
+        self.ops = _torch_ops(torch, self.dtype)
+
+    def asarray(self, x):
+        if np.isscalar(x):
+            return x
+        x = np.asarray(x)
+        return self.torch.as_tensor(x, dtype=self.dtype if x.dtype.kind == "f" else None)
+
+    def to_numpy(self, x):
+        return x.detach().cpu().numpy() if isinstance(x, self.torch.Tensor) else np.asarray(x)
+
+    def zeros(self, shape):
+        return self.torch.zeros(shape, dtype=self.dtype)
+
+    def seed(self, seed):
+        self.torch.manual_seed(seed)
+
+    def compile(self, function):
+        return function
+
+    def no_grad(self):
+        return self.torch.no_grad()
+
+
+class NumbaBackend:
+    """numpy arrays, with the step/derivative functions, the integrator and the whole simulation
+    loop compiled by numba (nopython). The first run of a model includes the compilation."""
+    name = "numba"
+
+    def __init__(self, dtype=np.float64):
+        import numba
+        self.numba = numba
+        self.dtype = dtype
+        self.ops = _numba_ops(numba)
+        self._seed = numba.njit(lambda seed: np.random.seed(seed))
+
+    def asarray(self, x):
+        if np.isscalar(x):
+            return x
+        x = np.asarray(x)
+        return np.ascontiguousarray(x, dtype=self.dtype if x.dtype.kind == "f" else None)
+
+    def to_numpy(self, x):
+        return np.asarray(x)
+
+    def zeros(self, shape):
+        return np.zeros(shape, dtype=self.dtype)
+
+    def seed(self, seed):
+        # numba has its own generator state, seeded from inside compiled code
+        np.random.seed(seed)
+        self._seed(seed)
+
+    def compile(self, function):
+        return self.numba.njit(function)
+
+    def no_grad(self):
+        return _NullContext()
+
+
+class _NullContext:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+
+_NULL_CONTEXT = _NullContext()
+
+
+def _no_phase(name):
+    return _NULL_CONTEXT
+
+
+BACKENDS = {"numpy": NumpyBackend, "torch": TorchBackend, "numba": NumbaBackend}
+
+
+def get_backend(backend):
+    """Backend instance from a name ("numpy", "torch", "numba") or an instance."""
+    if isinstance(backend, str):
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown backend {backend!r}, choose from {list(BACKENDS)}")
+        return BACKENDS[backend]()
+    return backend
+
+
+#
+# integrators: factories turning derivative(t, x, u, p) into step(t, x, u, p)
+#
+def euler(derivative, dt):
+    def step(t, x, u, p):
+        return x + dt * derivative(t, x, u, p)
+    return step
+
+
+def rk4(derivative, dt):
+    def step(t, x, u, p):
+        # t is a step index, the stages are evaluated at fractional steps
+        k1 = derivative(t, x, u, p)
+        k2 = derivative(t + 0.5, x + (0.5 * dt) * k1, u, p)
+        k3 = derivative(t + 0.5, x + (0.5 * dt) * k2, u, p)
+        k4 = derivative(t + 1.0, x + dt * k3, u, p)
+        return x + (dt / 6) * (k1 + 2 * k2 + 2 * k3 + k4)
+    return step
+
+
+INTEGRATORS = {"euler": euler, "rk4": rk4}
+
+
+def make_loop(step):
+    """The simulation loop over one chunk of inputs, recording the columns record_index of the state
+    every record_every steps into out[k], out[k+1], ... Returns the final state and the next k."""
+    def loop(x, inputs, t0, p, record_index, record_every, out, k):
+        for i in range(inputs.shape[0]):
+            x = step(t0 + i, x, inputs[i], p)
+            if k < out.shape[0] and (t0 + i + 1) % record_every == 0:
+                out[k] = x[:, record_index]
+                k += 1
+        return x, k
+    return loop
+
+
+#
+# recording
+#
+class Recording(dict):
+    """Recorded variables, {name: np.array of shape (n_records, batch, size)}, plus the step
+    indices (self.steps) and times (self.t) of the records."""
+
+    def __init__(self, variables, steps, dt):
+        super().__init__(variables)
+        self.steps = steps
+        self.t = steps * dt
+
+
+class Simulator:
+    """Runs a Model on a backend, for a batch of independent networks.
+
+    Parameters
+    ----------
+    model : Model
+    backend : str or backend instance, default="numpy"
+        "numpy", "torch" (CPU) or "numba".
+    integrator : str, default="euler"
+        "euler" or "rk4", for models defining make_derivative().
+    batch : int, default=1
+        Number of networks simulated together (leading axis of the state).
+    seed : int, default=None
+        Seeds the input adapters (np.random.Generator) and the backend's generator (noise drawn in
+        step functions).
+    chunk_size : int, default=1024
+        Steps whose inputs are generated and converted at once.
+    state : np.array of shape (batch, state_size), default=None
+        Initial state, model.initial_state() by default.
+    profiler : profiling.Profiler, default=None
+        Profiles the phases of the step/derivative function, the integrator and the input
+        generation (numpy and torch backends). Nothing is instrumented without a profiler.
+    """
+
+    def __init__(self, model, backend="numpy", integrator="euler", batch=1, seed=None, chunk_size=1024, state=None,
+                 profiler=None):
+        if not isinstance(model, Model):
+            raise TypeError(f"{type(model).__name__} does not implement the Model protocol")
+        self.model = model
+        self.backend = get_backend(backend)
+        self.batch = batch
+        self.chunk_size = chunk_size
+        self.rng = np.random.default_rng(seed)
+        if seed is not None:
+            self.backend.seed(seed)
+        self.t = 0
+        if profiler is not None and self.backend.name == "numba":
+            raise ValueError("The numba backend compiles the step functions, profile with the numpy or torch backend")
+        self.profiler = profiler
+        name = type(model).__name__
+
+        ops = self.backend.ops
+        if hasattr(model, "make_step"):
+            step = model.make_step(ops)
+            if profiler is not None:
+                step = profiler.instrument_function(step, f"{name}.step")
+        elif hasattr(model, "make_derivative"):
+            if integrator not in INTEGRATORS:
+                raise ValueError(f"Unknown integrator {integrator!r}, choose from {list(INTEGRATORS)}")
+            derivative = self.backend.compile(model.make_derivative(ops))
+            if profiler is not None:
+                derivative = profiler.instrument_function(derivative, f"{name}.derivative")
+            step = INTEGRATORS[integrator](derivative, model.dt)
+            if profiler is not None:
+                step = profiler.wrap(step, integrator)
+        else:
+            raise TypeError(f"{type(model).__name__} defines neither make_step() nor make_derivative()")
+        self.step_function = self.backend.compile(step)
+        self.loop = self.backend.compile(make_loop(self.step_function))
+        self.p = tuple(self.backend.asarray(value) for value in model.parameters())
+        self.reset(state)
+
+    def reset(self, state=None):
+        """Sets the state (model.initial_state() by default) and the step counter to 0."""
+        if state is None:
+            state = self.model.initial_state(self.batch, self.rng)
+        state = np.asarray(state, dtype=np.float64)
+        if state.shape != (self.batch, self.model.state_size):
+            raise ValueError(f"Expected a state of shape {(self.batch, self.model.state_size)}, got {state.shape}")
+        self.x = self.backend.asarray(state.copy())
+        self.t = 0
+        return self
+
+    @property
+    def state(self):
+        """Current state as a numpy array of shape (batch, state_size)."""
+        return self.backend.to_numpy(self.x)
+
+    def variables(self):
+        """Current state as {variable name: np.array of shape (batch, size)}."""
+        return self.model.unpack(self.state)
+
+    def run(self, T, record=None, record_every=1, inputs=None, observers=None, observe_every=1):
+        """Runs T steps.
+        Parameters
+        ----------
+        T : int
+        record : list of str or True, default=None
+            State variables to record (True: all).
+        record_every : int, default=1
+            Records the state after every record_every-th step (counted from the first step of the
+            simulation, so chunked runs line up).
+        inputs : input adapter or array, default=None
+            Overrides model.inputs: a function (t0, t1, batch, rng) -> (t1-t0, batch, n_inputs), or
+            an array of shape (T, n_inputs) / (T, batch, n_inputs) for the steps of this run.
+        observers : list of functions (step, state) -> None, default=None
+            Called with the state (numpy array of shape (batch, state_size), only valid during the
+            call) after every observe_every-th step, e.g. PathIntegrationTracker.observer() of
+            bump_decoding.py. The compiled loop is run between the observed steps.
+        observe_every : int, default=1
+            Counted like record_every.
+        Returns
+        -------
+        recording : Recording
+        """
+        backend, model = self.backend, self.model
+        if inputs is None:
+            adapter = model.inputs
+        elif callable(inputs):
+            adapter = inputs
+        else:
+            t_start, array_adapter = self.t, array_inputs(inputs)
+            adapter = lambda t0, t1, batch, rng: array_adapter(t0 - t_start, t1 - t_start, batch, rng)
+
+        slices = model.state_slices()
+        names = list(model.state_layout) if record is True else list(record or [])
+        record_index = np.concatenate([np.arange(model.state_size)[slices[name]] for name in names]).astype(np.int64) \
+            if names else np.zeros(0, dtype=np.int64)
+        first = (self.t // record_every + 1) * record_every  # first recorded step (1-based count)
+        n_records = max((self.t + T - first) // record_every + 1, 0) if names else 0
+        out = backend.zeros((n_records, self.batch, len(record_index)))
+        record_index_b = backend.asarray(record_index)
+
+        k = 0
+        phase = self.profiler.phase if self.profiler is not None else _no_phase
+        with backend.no_grad():
+            for t0 in range(self.t, self.t + T, self.chunk_size):
+                t1 = min(t0 + self.chunk_size, self.t + T)
+                with phase("inputs"):
+                    u = backend.asarray(np.ascontiguousarray(adapter(t0, t1, self.batch, self.rng), dtype=np.float64))
+                if not observers:
+                    self.x, k = self.loop(self.x, u, t0, self.p, record_index_b, record_every, out, k)
+                    continue
+                # split the chunk after the observed steps
+                start = t0
+                for stop in range((t0 // observe_every + 1) * observe_every, t1 + observe_every, observe_every):
+                    self.x, k = self.loop(self.x, u[start - t0:min(stop, t1) - t0], start, self.p, record_index_b, record_every, out, k)
+                    if stop > t1:
+                        break
+                    state = backend.to_numpy(self.x)
+                    with phase("observers"):
+                        for observer in observers:
+                            observer(stop, state)
+                    start = stop
+        self.t += T
+
+        out = backend.to_numpy(out)
+        variables, start = {}, 0
+        for name in names:
+            size = model.state_layout[name]
+            variables[name] = out[:, :, start:start + size]
+            start += size
+        return Recording(variables, first + record_every * np.arange(n_records), model.dt)
@@ -0,0 +1,792 @@
+# Ports of the reference models onto the common simulation core of simulator.py. Each port keeps the
+# equations, parameters and defaults of its reference file but is written as a simulator Model: one
+# packed (batch, state_size) state, a step or derivative function built from backend ops, and an
+# input adapter. So every model runs on the numpy, torch and numba backends (compared by
+# check_backends()), batched, with the simulator's integrators and recorders.
+#
+#     reference file                                  port
+#     ring_attractor_0050_sebastian.py                SebastianRing
+#     ring_attractor_0100_neurorishika_2_4.py         LIFRing.neurorishika_2_4()
+#     ring_attractor_0150_neurorishika_classical.py   LIFRing.neurorishika_classical()
+#     continous_attractor_0100_waves.py               WavesLayer
+#     continuous_attractor_0250_neuro_gpr.py          NeuroGPRCANN
+#     continuous_attractor_0300_hippocampi.py         HippocampiCAN
+#     ring_attractor_0300_seismic.py                  SeismicRing
+#     ring_attractor_0300_seismic_no_split_only_...   SeismicRing(use_velocity=False)
+#     ring_attractor_0450_xuelong.py                  XuelongRing
+#     ring_attractor_0800_drugowitsch_lab.py          DrugowitschRing
+#     ring_attractor_rat_in_a_box.py                  RatInABoxRing
+#
+# PORTS maps short names to constructors taking the number of neurons, e.g. PORTS["waves"](1024).
+import numpy as np
+from simulator import BaseModel, constant_inputs
+
+
+class SebastianRing(BaseModel):
+    """ring_attractor_0050_sebastian.py: rate ring with cosine weights J0 cos(u_i - u_j) and a clipped
+    input, da/dt = -a/tau_m + clip(sum_j J(u_i - u_j) a_j du, -1, 1). The reference loops over all
+    pairs in Python, here the interaction is one (batch, n) @ (n, n) product."""
+
+    def __init__(self, n_cells=100, J0=0.4, tau_m=1.3, dt=0.01):
+        self.n_cells = n_cells
+        self.J0 = J0
+        self.tau_m = tau_m
+        self.dt = dt
+        self.state_layout = {"activation": n_cells}
+        delta_u = 2 * np.pi / n_cells
+        i = np.arange(n_cells)
+        # W[j, i] = J((i - j) du) du, so that (a @ W)[i] is the interaction sum of cell i
+        self.W = J0 * np.cos((i[np.newaxis, :] - i[:, np.newaxis]) * delta_u) * delta_u
+
+    def parameters(self):
+        return (self.W, self.tau_m)
+
+    def initial_state(self, batch, rng):
+        return rng.uniform(-1, 1, (batch, self.n_cells))
+
+    def make_derivative(self, ops):
+        matmul, clip = ops.matmul, ops.clip
+
+        def derivative(t, x, u, p):
+            W, tau_m = p
+            return -x / tau_m + clip(matmul(x, W), -1.0, 1.0)
+        return derivative
+
+
+class LIFRing(BaseModel):
+    """Conductance-based LIF ring of the neurorishika notebooks (lif_update()): membrane voltage x,
+    inhibitory and excitatory gates driven by the spikes through C_inh and C_exc, noise and an
+    external current given by the input adapter (one current per neuron and step). Spiking neurons
+    are reset, so this is a discrete step model.
+
+    Parameters
+    ----------
+    C_exc, C_inh : np.array of shape (N, N)
+        Connectivity, gate_i is driven by sum_j C[i, j] spike_j
+    input_adapter : function (t0, t1, batch, rng) -> (t1-t0, batch, N), default=None
+        External current (I_ext + I_hd of the notebooks). No current by default.
+    """
+
+    def __init__(
+        self, C_exc, C_inh, input_adapter=None, tau=2, tau_inh=5, tau_exc=5, dt=0.1, theta=-30, reset=-70,
+        leak_voltage=-55, inh_voltage=-70, exc_voltage=0, inh_conductance=15.0, exc_conductance=5.0, noise_scale=10,
+    ):
+        self.C_exc = np.asarray(C_exc, dtype=np.float64)
+        self.C_inh = np.asarray(C_inh, dtype=np.float64)
+        self.N = N = len(self.C_exc)
+        self.state_layout = {"x": N, "inh_gate": N, "exc_gate": N}
+        self.n_inputs = N
+        self.input_adapter = input_adapter or constant_inputs(np.zeros(N))
+        self.tau, self.tau_inh, self.tau_exc, self.dt = tau, tau_inh, tau_exc, dt
+        self.theta, self.reset = theta, reset
+        self.leak_voltage, self.inh_voltage, self.exc_voltage = leak_voltage, inh_voltage, exc_voltage
+        self.inh_conductance, self.exc_conductance = inh_conductance, exc_conductance
+        self.noise_scale = noise_scale
+
+    @classmethod
+    def neurorishika_2_4(cls, N=8, Exc=2, Inh=4, I_ext=15, schedule=None, **kwargs):
+        """ring_attractor_0100_neurorishika_2_4.py: excitation within Exc, inhibition within Inh
+        neighbours, driven by I_ext + I_max sin(2 pi linspace(0, 1, N) + 2 pi phase), with phase and
+        I_max from schedule(t, rng) (default: the schedule of the notebook, neurorishika_2_4_schedule())."""
+        C_exc = _ring_connections(N, 0, Exc)
+        C_inh = _ring_connections(N, Exc, Inh)
+        schedule = schedule or neurorishika_2_4_schedule()
+        preferred = 2 * np.pi * np.linspace(0, 1, N)
+
+        def adapter(t0, t1, batch, rng):
+            phase, I_max = schedule(np.arange(t0, t1) + 1, rng)
+            current = I_ext + I_max[:, np.newaxis] * np.sin(preferred + 2*np.pi*phase[:, np.newaxis])
+            return np.broadcast_to(current[:, np.newaxis], (t1 - t0, batch, N))
+        return cls(C_exc, C_inh, adapter, inh_conductance=15.0, **kwargs)
+
+    @classmethod
+    def neurorishika_classical(cls, N_bump=8, N_L=8, N_R=8, Exc=1, schedule=None, **kwargs):
+        """ring_attractor_0150_neurorishika_classical.py: bump ring, left and right shifter populations
+        and a global inhibitory neuron, driven by I_ext (50 on the bump ring) + I_L Lstim + I_R Rstim
+        with I_L, I_R from schedule(t, rng) (default: the schedule of the notebook)."""
+        N = N_bump + N_L + N_R + 1
+        C_inh = np.zeros((N, N))
+        C_exc = np.zeros((N, N))
+        C_exc[:N_bump, :N_bump] = _ring_connections(N_bump, 0, Exc)
+        i = np.arange(N_bump)
+        C_exc[N_bump + i, i] = 2            # left local connections
+        C_exc[N_bump + N_L + i, i] = 2      # right local connections
+        C_exc[-1, :N_bump] = 2              # bump to inhibitory
+        C_inh[:N_bump, -1] = 1              # global inhibition
+        i = np.arange(N_L)
+        C_exc[i, N_bump + (i - 1) % N_L] = 2  # left shifted connections
+        C_exc[i, N_bump + (i - 2) % N_L] = 1
+        i = np.arange(N_R)
+        C_exc[i, N_bump + N_L + (i + 1) % N_R] = 2  # right shifted connections
+        C_exc[i, N_bump + N_L + (i + 2) % N_R] = 1
+
+        I_ext = 50 * np.concatenate((np.ones(N_bump), np.zeros(N_L + N_R + 1)))
+        Lstim = np.concatenate((np.zeros(N_bump), np.ones(N_L), np.zeros(N_R + 1)))
+        Rstim = np.concatenate((np.zeros(N_bump + N_L), np.ones(N_R), np.zeros(1)))
+        schedule = schedule or neurorishika_classical_schedule
+
+        def adapter(t0, t1, batch, rng):
+            I_L, I_R = schedule(np.arange(t0, t1) + 1, rng)
+            current = I_ext + I_L[:, np.newaxis] * Lstim + I_R[:, np.newaxis] * Rstim
+            return np.broadcast_to(current[:, np.newaxis], (t1 - t0, batch, N))
+        return cls(C_exc, C_inh, adapter, inh_conductance=10.0, **kwargs)
+
+    def parameters(self):
+        return (
+            self.C_exc.T.copy(), self.C_inh.T.copy(), self.dt / self.tau, self.tau, self.dt / self.tau_inh,
+            self.dt / self.tau_exc, self.theta, self.reset, self.leak_voltage, self.inh_voltage, self.exc_voltage,
+            self.inh_conductance, self.exc_conductance, self.noise_scale,
+        )
+
+    def initial_state(self, batch, rng):
+        return self.pack(
+            x=np.full((batch, self.N), float(self.leak_voltage)),
+            inh_gate=np.zeros((batch, self.N)),
+            exc_gate=np.zeros((batch, self.N)),
+        )
+
+    def inputs(self, t0, t1, batch, rng):
+        return self.input_adapter(t0, t1, batch, rng)
+
+    def make_step(self, ops):
+        matmul, gt, where, randn, concat = ops.matmul, ops.gt, ops.where, ops.randn, ops.concat
+        N = self.N
+
+        def step(t, state, u, p):
+            (C_exc_T, C_inh_T, dt_tau, tau, dt_tau_inh, dt_tau_exc, theta, reset, leak_voltage, inh_voltage,
+             exc_voltage, inh_conductance, exc_conductance, noise_scale) = p
+            x, inh_gate, exc_gate = state[:, :N], state[:, N:2*N], state[:, 2*N:]
+            I_leak = -(x - leak_voltage) / tau
+            I_inh = -inh_conductance * inh_gate * (x - inh_voltage)
+            I_exc = -exc_conductance * exc_gate * (x - exc_voltage)
+            x = x + dt_tau * (I_leak + I_inh + I_exc + randn((x.shape[0], N)) * noise_scale + u)
+            spikes = gt(x, theta)
+            inh_gate = inh_gate + dt_tau_inh * (-inh_gate + matmul(spikes, C_inh_T))
+            exc_gate = exc_gate + dt_tau_exc * (-exc_gate + matmul(spikes, C_exc_T))
+            x = where(x > theta, reset, x)
+            return concat((x, inh_gate, exc_gate))
+        return step
+
+
+def _ring_connections(N, near, far):
+    """Connectivity of the neurorishika notebooks: 1 between neurons i != j at a distance in (near, far]
+    on the ring unrolled by far neurons on both sides."""
+    i = np.arange(-far, N + far)
+    distance = np.abs(i[:, np.newaxis] - i[np.newaxis, :])
+    pre, post = np.nonzero((distance > near) & (distance <= far))
+    C = np.zeros((N, N))
+    C[i[pre] % N, i[post] % N] = 1
+    return C
+
+
+def neurorishika_2_4_schedule():
+    """Schedule (t, rng) -> (phase, I_max) of the neurorishika_2_4 notebook at its loop steps t (1, 2, ...):
+    the head direction turns one way, then back, is switched off, and from step 4000 turns slowly
+    with a randomly walking amplitude. The walk continues across calls (restarts at t = 1)."""
+    walk = {"I_max": 0.0}
+
+    def schedule(t, rng):
+        t = np.asarray(t)
+        phase = np.select(
+            [t < 1000, t < 2000, t <= 4000],
+            [0.001 * t, 0.999 - 0.001 * (t - 999), 0.0],
+            0.0005 * (t - 4000),
+        )
+        I_max = np.where(t < 2000, 20.0, 0.0)
+        if t[0] == 1:
+            walk["I_max"] = 0.0
+        late = t > 4000
+        if late.any():
+            I_max[late] = walk["I_max"] + np.cumsum(0.5 * rng.standard_normal(late.sum()))
+            walk["I_max"] = I_max[-1]
+        return phase, I_max
+    return schedule
+
+
+def neurorishika_classical_schedule(t, rng):
+    """I_L and I_R of the classical notebook at its loop steps t: rest, turn left, turn right, rest."""
+    t = np.asarray(t)
+    I_L = np.where((t >= 1000) & (t < 5000), 10.0, 0.0)
+    I_R = np.where((t >= 5000) & (t < 8000), 10.0, 0.0)
+    return I_L, I_R
+
+
+class WavesLayer(BaseModel):
+    """continous_attractor_0100_waves.py (ContinuousAttractorLayer): 2-D sheet of place cells with
+    gaussian synapses J exp(-|c_ij - c_kl + delta|^2 / sigma^2) - T, each step
+    A <- normalize(relu((1 - tau) B + tau / sum(A) B) * unblocked) with B = A . synapses.
+    The sheet is flattened to (batch, n0*n1), the synapses of the (constant) shift delta are built
+    once. Steps of a sheet without activity leave it unchanged, as in the reference."""
+
+    def __init__(self, shape=(32, 32), J=12.0, T=0.05, sigma=0.0305, tau=0.8, delta=(0, 0), blocked=None, start=None):
+        self.shape = tuple(shape)
+        self.J, self.T, self.sigma, self.tau = J, T, sigma, tau
+        self.dt = 1.0
+        n = self.shape[0] * self.shape[1]
+        self.state_layout = {"A": n}
+        ci = np.asarray(
+            np.meshgrid(
+                (np.arange(self.shape[0]) - 0.5) / self.shape[0],
+                (np.arange(self.shape[1]) - 0.5) / self.shape[1],
+            )
+        ).T.reshape(n, 2)
+        diff = ci[:, np.newaxis, :] - ci[np.newaxis, :, :] + np.asarray(delta, dtype=np.float64)
+        self.synapses = J * np.exp(-np.sum(np.square(diff), axis=-1) / sigma**2) - T
+        # unblocked cells, see ContinuousAttractorLayer.block_region()
+        self.unblocked = np.ones(n) if blocked is None else 1.0 - np.asarray(blocked, dtype=np.float64).reshape(n)
+        self.start = (self.shape[0] // 2, self.shape[1] // 2) if start is None else tuple(start)
+
+    def parameters(self):
+        return (self.synapses, self.unblocked.reshape(1, -1), self.tau)
+
+    def initial_state(self, batch, rng):
+        A = np.zeros((batch,) + self.shape)
+        A[(slice(None),) + self.start] = 1.0
+        return A.reshape(batch, -1)
+
+    def peak(self, x):
+        """Peak (row, column) of states of shape (..., n), like ContinuousAttractorLayer.peak."""
+        return np.stack(np.unravel_index(np.argmax(x, axis=-1), self.shape), axis=-1)
+
+    def make_step(self, ops):
+        matmul, relu, sum_last, max_last, where = ops.matmul, ops.relu, ops.sum_last, ops.max_last, ops.where
+
+        def step(t, A, u, p):
+            synapses, unblocked, tau = p
+            total = sum_last(A)
+            active = total > 0
+            B = matmul(A, synapses)
+            A_next = relu((1 - tau) * B + tau / where(active, total, 1.0) * B) * unblocked
+            return where(active, A_next / max_last(A_next), A)
+        return step
+
+
+class NeuroGPRCANN(BaseModel):
+    """continuous_attractor_0250_neuro_gpr.py (CANN with seq_dim 1): du/dt = (-u + r W + I_ext + I_inh)
+    dt/tau with r = u^2 / (1 + k sum(u^2)) and a gaussian stimulus around the current position. The
+    reference integrates every sample of the position sequence with odeint over I_dur; here it is
+    integrated in steps of dt (use the rk4 integrator), so one sample lasts steps_per_sample steps.
+
+    Parameters
+    ----------
+    z_min, z_max : float
+        Range of the positions (the reference takes it from the data).
+    positions : array-like of shape (n_samples,) or (n_samples, batch), default=None
+        Position sequence fed by the input adapter (sample i-1 drives sample i, as in update()).
+    """
+
+    def __init__(self, num=128, tau=0.02, Inh_inp=-0.1, I_dur=0.5, dt=0.05, k=1, a=0.5, J0=8, z_min=0.0, z_max=1.0,
+                 positions=None):
+        self.num, self.tau, self.Inh_inp, self.I_dur, self.dt, self.k, self.a, self.J0 = num, tau, Inh_inp, I_dur, dt, k, a, J0
+        self.state_layout = {"u": num}
+        self.n_inputs = 1
+        self.z_min, self.z_max = z_min, z_max + 1e-4
+        self.z_range = self.z_max - self.z_min
+        self.centers = np.linspace(self.z_min, self.z_max, num)
+        # the reference leaves the last row and column at 0
+        i = np.arange(num - 1)
+        d = np.square((i[:, np.newaxis] - i[np.newaxis, :]) / a)
+        self.w = np.zeros((num, num))
+        self.w[:num - 1, :num - 1] = J0 * np.exp(-0.5 * d) / (np.sqrt(2 * np.pi) * a)
+        # odeint is evaluated on arange(0, I_dur, dt), i.e. integrates over I_dur - dt per sample
+        self.steps_per_sample = len(np.arange(0, I_dur, dt)) - 1
+        self.positions = None if positions is None else np.asarray(positions, dtype=np.float64)
+
+    def parameters(self):
+        return (self.w, self.centers.reshape(1, -1), 1 / (self.z_range + 1e-4), self.dt / self.tau, self.Inh_inp, self.k)
+
+    def inputs(self, t0, t1, batch, rng):
+        if self.positions is None:
+            raise ValueError("Set NeuroGPRCANN.positions (or pass inputs to Simulator.run())")
+        sample = np.arange(t0, t1) // self.steps_per_sample
+        position = self.positions[np.maximum(sample - 1, 0)]
+        if position.ndim == 1:
+            position = position[:, np.newaxis]
+        return np.broadcast_to(position[:, :, np.newaxis], (t1 - t0, batch, 1))
+
+    def rate(self, u):
+        """Output firing rate r1 / (1 + 0.5 k sum(r1)) of update()."""
+        r1 = np.square(u)
+        return r1 / (1.0 + 0.5 * self.k * np.sum(r1, axis=-1, keepdims=True))
+
+    def make_derivative(self, ops):
+        matmul, exp, square, sum_last = ops.matmul, ops.exp, ops.square, ops.sum_last
+
+        def derivative(t, u, position, p):
+            w, centers, inv_range, dt_tau, Inh_inp, k = p
+            stimulus = exp(-square((position - centers) * inv_range / 0.5))
+            r1 = square(u)
+            r = r1 / (1.0 + k * sum_last(r1))
+            return (-u + matmul(r, w) + stimulus + Inh_inp) * dt_tau
+        return derivative
+
+
+class HippocampiCAN(BaseModel):
+    """continuous_attractor_0300_hippocampi.py (CAN): 2-D sheet of length x length neurons with
+    direction-shifted center-surround weights, ds/dt = (relu(W s + b) - s) / tau with the velocity
+    input b = 1 + alpha (direction . velocity), multiplied by the envelope while warming up (or
+    always, if not periodic). Inputs are 2-D velocities, dt is the step_size of forward()."""
+
+    def __init__(self, length=64, periodic=True, delta_r=None, warmup_steps=1000, n_axes=2, a=1, lambda_net=13, l=2,
+                 alpha=0.10315, envelope_scale=4, tau=0.01, dt=0.5, velocity=(0.0, 0.0)):
+        assert length % n_axes == 0, "Length must be divisible by n_axes"
+        self.length, self.periodic, self.warmup_steps, self.n_axes = length, periodic, warmup_steps, n_axes
+        self.a, self.lambda_net, self.l, self.alpha, self.envelope_scale = a, lambda_net, l, alpha, envelope_scale
+        self.beta = 3 / (lambda_net**2)
+        self.gamma = 1.2 * self.beta
+        self.tau, self.dt = tau, dt
+        self.delta_r = length if delta_r is None else delta_r
+        n = length * length
+        self.state_layout = {"s": n}
+        self.n_inputs = 2
+        self.velocity = np.asarray(velocity, dtype=np.float64)
+
+        n_directions = n_axes**2
+        angles = 2 * np.arange(n_directions) * np.pi / n_directions
+        directions = np.round(np.stack([np.cos(angles), np.sin(angles)], axis=1) * 1e4) / 1e4
+        self.directions = np.tile(directions, (n // n_directions, 1))
+        half_length = length // 2
+        grid = np.stack(np.meshgrid(np.arange(-half_length, half_length), np.arange(-half_length, half_length), indexing="ij"), axis=-1)
+        self.neuron_grid = grid.reshape(-1, 2).astype(np.float64)
+        shifted_grid = self.neuron_grid + l * self.directions
+        distances_sq = np.sum(np.square(self.neuron_grid[:, np.newaxis, :] - shifted_grid[np.newaxis, :, :]), axis=-1)
+        self.weights = a * np.exp(-self.gamma * distances_sq) - np.exp(-self.beta * distances_sq)
+
+        grid_mag = np.linalg.norm(self.neuron_grid, axis=-1)
+        length_ratio = np.maximum(grid_mag - length + self.delta_r, 0) / self.delta_r
+        self.envelope = np.exp(-envelope_scale * length_ratio**2)
+
+    def parameters(self):
+        # the envelope applies to all steps if not periodic, else during the warmup steps
+        warmup = np.inf if not self.periodic else float(self.warmup_steps)
+        return (self.weights.T.copy(), self.directions.T.copy(), self.envelope.reshape(1, -1), self.alpha, self.tau, warmup)
+
+    def initial_state(self, batch, rng):
+        return rng.standard_normal((batch, self.length**2)) / self.length**2
+
+    def inputs(self, t0, t1, batch, rng):
+        return constant_inputs(self.velocity)(t0, t1, batch, rng)
+
+    def make_derivative(self, ops):
+        matmul, relu = ops.matmul, ops.relu
+
+        def derivative(t, s, velocity, p):
+            weights_T, directions_T, envelope, alpha, tau, warmup = p
+            b = 1 + alpha * matmul(velocity, directions_T)
+            if t < warmup:
+                b = b * envelope
+            return (relu(matmul(s, weights_T) + b) - s) / tau
+        return derivative
+
+
+class SeismicRing(BaseModel):
+    """ring_attractor_0300_seismic.py (RingAttractorNetwork) and its no-split/landmarks-only variant:
+    ds/dt = (-s + relu(g s + b) W + velocity input + landmark input) / time_constant, with the
+    per-block scaled weights summed into one matrix W. Inputs per step are [velocity, landmarks
+    (one per epg neuron)]; the velocity drives the first half of the pen population if positive,
+    else the second half, with |velocity| exp(velocity_scaling).
+
+    Parameters
+    ----------
+    initial_weights : np.array of shape (N, N)
+    population_slices : dict {population name: slice}, needs "epg" and "pen"
+    gain, bias, time_constant : float or dict {population name: value}
+    weight_scale : float
+        Common scale of all weight blocks (the initial scaling factors of the reference).
+    """
+
+    def __init__(self, initial_weights, population_slices, gain=1.0, bias=0.0, time_constant=0.02, weight_scale=1.0,
+                 landmark_scaling=0.0, velocity_scaling=0.0, use_landmarks=True, use_velocity=True, dt=0.001, inputs=None):
+        self.W = weight_scale * np.asarray(initial_weights, dtype=np.float64)
+        self.population_slices = dict(population_slices)
+        N = len(self.W)
+        self.state_layout = {"s": N}
+        self.gain = self._per_neuron(gain, N)
+        self.bias = self._per_neuron(bias, N)
+        self.time_constant = self._per_neuron(time_constant, N)
+        self.landmark_scaling = landmark_scaling if use_landmarks else 0.0
+        self.velocity_scaling = velocity_scaling
+        self.use_velocity = use_velocity
+        self.dt = dt
+        epg, pen = np.arange(N)[self.population_slices["epg"]], np.arange(N)[self.population_slices["pen"]]
+        self.n_inputs = 1 + len(epg)
+        self.epg = epg
+        # landmark input as a projection of the inputs onto the epg neurons
+        self.landmark_projection = np.zeros((len(epg), N))
+        self.landmark_projection[np.arange(len(epg)), epg] = 1.0
+        hemisphere_length = len(pen) // 2
+        self.pen_first, self.pen_second = np.zeros(N), np.zeros(N)
+        self.pen_first[pen[:hemisphere_length]] = 1.0
+        self.pen_second[pen[hemisphere_length:]] = 1.0
+        self.input_adapter = inputs or constant_inputs(np.zeros(self.n_inputs))
+
+    def _per_neuron(self, value, N):
+        if np.isscalar(value):
+            return np.full(N, float(value))
+        values = np.zeros(N)
+        for name, columns in self.population_slices.items():
+            values[columns] = value[name]
+        return values
+
+    @classmethod
+    def from_torch(cls, network, dt=0.001, inputs=None):
+        """Port of a (trained) seismic RingAttractorNetwork: its current gain/bias/time constant masks,
+        scaled weight blocks and input scalings."""
+        W = sum(mask.detach().cpu().numpy() for mask in network.scaling_factor_masks.values())
+        model = cls(
+            W, network.population_slices,
+            landmark_scaling=float(network.landmark_scaling.detach()),
+            velocity_scaling=float(network.velocity_scaling.detach()),
+            use_landmarks=network.use_landmarks_input, use_velocity=network.use_velocity_input, dt=dt, inputs=inputs,
+        )
+        model.gain = network.gain_mask.detach().cpu().numpy().astype(np.float64)
+        model.bias = network.bias_mask.detach().cpu().numpy().astype(np.float64)
+        model.time_constant = network.time_constant_mask.detach().cpu().numpy().astype(np.float64)
+        return model
+
+    def parameters(self):
+        velocity_gain = np.exp(self.velocity_scaling) if self.use_velocity else 0.0
+        return (
+            self.W, self.gain.reshape(1, -1), self.bias.reshape(1, -1), self.time_constant.reshape(1, -1),
+            self.landmark_projection * self.landmark_scaling, (self.pen_first * velocity_gain).reshape(1, -1),
+            (self.pen_second * velocity_gain).reshape(1, -1),
+        )
+
+    def inputs(self, t0, t1, batch, rng):
+        return self.input_adapter(t0, t1, batch, rng)
+
+    def output(self, s):
+        """epg activity relu(g s + b)[epg] of forward()."""
+        return np.maximum(self.gain * s + self.bias, 0)[..., self.epg]
+
+    def make_derivative(self, ops):
+        matmul, relu = ops.matmul, ops.relu
+
+        def derivative(t, s, u, p):
+            W, gain, bias, time_constant, landmark_projection, pen_first, pen_second = p
+            velocity = u[:, :1]
+            activity = relu(gain * s + bias)
+            velocity_input = relu(velocity) * pen_first + relu(-velocity) * pen_second
+            landmark_input = matmul(u[:, 1:], landmark_projection)
+            return (-s + matmul(activity, W) + velocity_input + landmark_input) / time_constant
+        return derivative
+
+
+class XuelongRing(BaseModel):
+    """ring_attractor_0450_xuelong.py (RingAttractorModel.cue_integration_output): two hemispheres of
+    8 excitatory integration neurons and one inhibitory neuron, dx/dt = (relu(x W^T + gamma + cue) - x)
+    / tau, where the cue is injected after the first ni steps. Inputs are cue1 + cue2 (16 per
+    step); the integrated output is integration_output(x) after nt - 1 steps. Unlike the reference
+    the iteration does not stop early once the state is stable."""
+
+    def __init__(self, cues=None):
+        self.time, self.dt, self.ti = 0.1, 1e-4, 0.001
+        self.nt = int(np.floor(self.time / self.dt))
+        self.ni = int(np.floor(self.ti / self.dt))
+        self.num_neuron = n = 8
+        neuron_pref = np.linspace(0, 360 - 360 / n, n)
+        diff = np.abs(neuron_pref[:, np.newaxis] - neuron_pref[np.newaxis, :])
+        diff = np.minimum(diff, 360 - diff)
+        W_E_E = np.exp(-diff**2 / (2 * 130**2)) * 45 / n
+        block = np.zeros((n + 1, n + 1))
+        block[:n, :n] = W_E_E
+        block[:n, n] = -6.0  # W_E_I
+        block[n, :n] = 60 / n  # W_I_E
+        block[n, n] = -1.0  # W_I_I
+        W = np.zeros((2 * (n + 1), 2 * (n + 1)))
+        W[:n + 1, :n + 1] = block
+        W[n + 1:, n + 1:] = block
+        self.W = W
+        self.gamma = np.tile(np.hstack([np.full(n, -1.5), -7.5]), 2)
+        self.tau_vector = np.tile(np.hstack([np.full(n, 0.005), 0.00025]), 2)
+        self.state_layout = {"left": n + 1, "right": n + 1}
+        self.n_inputs = 2 * n
+        # cue (16) -> excitatory neurons of both hemispheres
+        self.cue_projection = np.zeros((2 * n, 2 * (n + 1)))
+        self.cue_projection[np.arange(n), np.arange(n)] = 1.0
+        self.cue_projection[n + np.arange(n), n + 1 + np.arange(n)] = 1.0
+        self.cues = np.zeros(2 * n) if cues is None else np.asarray(cues, dtype=np.float64)
+
+    def parameters(self):
+        return (self.W.T.copy(), self.gamma.reshape(1, -1), self.cue_projection, self.tau_vector.reshape(1, -1), float(self.ni))
+
+    def initial_state(self, batch, rng):
+        x = np.zeros((batch, self.state_size))
+        x[:, :self.num_neuron] = 0.1
+        x[:, self.num_neuron + 1:2 * self.num_neuron + 1] = 0.1
+        return x
+
+    def inputs(self, t0, t1, batch, rng):
+        return constant_inputs(self.cues)(t0, t1, batch, rng)
+
+    def integration_output(self, x):
+        """integration_neuron of cue_integration_output(): sigmoid of the 16 excitatory neurons."""
+        n = self.num_neuron
+        excitatory = np.concatenate([x[..., :n], x[..., n + 1:2 * n + 1]], axis=-1)
+        return np.clip(1 / (1 + np.exp(-(excitatory * 5.0 - 2.5))), 0, 1)
+
+    def make_derivative(self, ops):
+        matmul, relu = ops.matmul, ops.relu
+
+        def derivative(t, x, cue, p):
+            W_T, gamma, cue_projection, tau, ni = p
+            drive = matmul(x, W_T) + gamma
+            if t >= ni:
+                drive = drive + matmul(cue, cue_projection)
+            return (relu(drive) - x) / tau
+        return derivative
+
+
+class DrugowitschRing(BaseModel):
+    """ring_attractor_0800_drugowitsch_lab.py (RingAttractorNetwork.propagate_onestep):
+    dr/dt = (-r + f(alpha r + J r - beta sum(r) + I)) / tau with nearest-neighbour J = J_even - v/v_rel
+    J_odd, computed as a stencil. Inputs per step are [v, I (one per neuron)].
+
+    Parameters
+    ----------
+    activation : str, default="relu"
+        f_act, one of "relu", "tanh", "sigmoid".
+    init : str or np.array of shape (N,), default="bumpatzero"
+        "bumpatzero", "random", "zeros" or an initial state, as in RingAttractorNetwork.
+    """
+
+    def __init__(self, N=64, tau=0.1, alpha=3.0, D=0.5, beta=None, v_rel=1.0, dt=0.001, activation="relu",
+                 init="bumpatzero", inputs=None):
+        self.N, self.tau, self.alpha, self.D, self.v_rel, self.dt = N, tau, alpha, D, v_rel, dt
+        self.beta = 20 / N if beta is None else beta
+        self.activation = activation
+        self.init = init
+        self.state_layout = {"r": N}
+        self.n_inputs = N + 1
+        self.input_adapter = inputs or constant_inputs(np.zeros(N + 1))
+
+    @classmethod
+    def from_network_params(cls, network_params, activation="relu", **kwargs):
+        """Port of the parameters of a RingAttractorNetwork (f_act is not portable, give its name)."""
+        keys = ("N", "tau", "alpha", "D", "beta", "v_rel", "dt")
+        return cls(**{key: network_params[key] for key in keys}, activation=activation, **kwargs)
+
+    def parameters(self):
+        return (self.tau, self.alpha, self.D, self.beta, self.v_rel)
+
+    def initial_state(self, batch, rng):
+        if isinstance(self.init, np.ndarray):
+            r = self.init
+        elif self.init == "random":
+            return rng.uniform(0, 1, (batch, self.N))
+        elif self.init == "zeros":
+            r = np.zeros(self.N)
+        else:  # bumpatzero
+            phi = np.linspace(-np.pi, np.pi - (2 * np.pi) / self.N, self.N)
+            r = np.maximum(0.01 * np.cos(phi), 0) * (1 + np.cos(phi))
+        return np.tile(r, (batch, 1))
+
+    def inputs(self, t0, t1, batch, rng):
+        return self.input_adapter(t0, t1, batch, rng)
+
+    def make_derivative(self, ops):
+        roll_last, sum_last = ops.roll_last, ops.sum_last
+        f_act = getattr(ops, self.activation)
+
+        def derivative(t, r, u, p):
+            tau, alpha, D, beta, v_rel = p
+            v, I = u[:, :1], u[:, 1:]
+            r_prev, r_next = roll_last(r, 1), roll_last(r, -1)
+            x = D * (r_prev + r_next) - (0.5 / v_rel) * v * (r_next - r_prev) + alpha * r - beta * sum_last(r) + I
+            return (f_act(x) - r) / tau
+        return derivative
+
+
+class RatInABoxRing(BaseModel):
+    """ring_attractor_rat_in_a_box.py (PyramidalNeurons with its conjunctive velocity cells), the
+    forward dynamics with fixed weights: conjunctive cells relu(W_v v + W_r r - threshold), basal
+    compartment W_b place_cells, apical compartment W_rec r + W_cl c_left + W_cr c_right (both linear)
+    and the soma r = (1 - theta) basal + theta apical. Inputs per step are [place cell rates (n),
+    velocity cell rates (2), theta]. Learning is not ported; trained weights are taken over with
+    from_ratinabox().
+    """
+
+    def __init__(self, n=50, w_rec=None, w_cl=None, w_cr=None, w_basal=None, threshold=1.0, dt=0.01, inputs=None, seed=None):
+        rng = np.random.default_rng(seed)
+        self.n, self.dt, self.threshold = n, dt, threshold
+        # untrained apical weights are drawn like add_input(w_init=0.1), the fixed weights as in the notebook
+        init = lambda: rng.normal(0, 0.1 / np.sqrt(n), (n, n))
+        self.w_rec = init() if w_rec is None else np.asarray(w_rec, dtype=np.float64)
+        self.w_cl = init() if w_cl is None else np.asarray(w_cl, dtype=np.float64)
+        self.w_cr = init() if w_cr is None else np.asarray(w_cr, dtype=np.float64)
+        self.w_basal = np.identity(n) if w_basal is None else np.asarray(w_basal, dtype=np.float64)
+        self.w_vl = np.ones((n, 2)) * np.array([1, -1])
+        self.w_vr = np.ones((n, 2)) * np.array([-1, 1])
+        self.state_layout = {"r": n}
+        self.n_inputs = n + 3
+        self.input_adapter = inputs
+
+    @classmethod
+    def from_ratinabox(cls, ring_attractor, threshold=1.0, inputs=None):
+        """Port of a (trained) PyramidalNeurons ring of the notebook."""
+        apical = ring_attractor.apical_compartment.inputs
+        name = ring_attractor.name
+        return cls(
+            n=ring_attractor.n,
+            w_rec=apical[name]["w"],
+            w_cl=apical["ConjunctiveCells_left"]["w"],
+            w_cr=apical["ConjunctiveCells_right"]["w"],
+            w_basal=ring_attractor.basal_compartment.inputs["PlaceCells"]["w"],
+            threshold=threshold,
+            dt=ring_attractor.Agent.dt,
+            inputs=inputs,
+        )
+
+    def parameters(self):
+        return (self.w_rec.T.copy(), self.w_cl.T.copy(), self.w_cr.T.copy(), self.w_basal.T.copy(),
+                self.w_vl.T.copy(), self.w_vr.T.copy(), self.threshold)
+
+    def inputs(self, t0, t1, batch, rng):
+        if self.input_adapter is None:
+            raise ValueError("RatInABoxRing needs an input adapter, e.g. rat_in_a_box_inputs()")
+        return self.input_adapter(t0, t1, batch, rng)
+
+    def make_step(self, ops):
+        matmul, relu = ops.matmul, ops.relu
+        n = self.n
+
+        def step(t, r, u, p):
+            w_rec_T, w_cl_T, w_cr_T, w_basal_T, w_vl_T, w_vr_T, threshold = p
+            place_cells, velocity_cells, theta = u[:, :n], u[:, n:n + 2], u[:, n + 2:]
+            # the ring attractor weights onto the conjunctive cells are the identity
+            conjunctive_left = relu(matmul(velocity_cells, w_vl_T) + r - threshold)
+            conjunctive_right = relu(matmul(velocity_cells, w_vr_T) + r - threshold)
+            basal = matmul(place_cells, w_basal_T)
+            apical = matmul(r, w_rec_T) + matmul(conjunctive_left, w_cl_T) + matmul(conjunctive_right, w_cr_T)
+            return (1 - theta) * basal + theta * apical
+        return step
+
+
+def rat_in_a_box_inputs(n=50, dt=0.01, speed_std=0.3, speed_coherence_time=0.7, widths=0.1, theta_freq=5, theta_frac=0.5):
+    """Input adapter for RatInABoxRing without ratinabox: an agent on the periodic 1-D track [0, 1)
+    with Ornstein-Uhlenbeck velocity (mean 0, std speed_std), n gaussian place cells evenly spaced on
+    the track, the two velocity cells max(+-v, 0) / speed_std and theta_gating(). The agent state is
+    kept between calls and reset on calls starting at t0 = 0."""
+    centres = (np.arange(n) + 0.5) / n
+    agent = {}
+
+    def adapter(t0, t1, batch, rng):
+        if t0 == 0 or agent.get("batch") != batch:
+            agent.update(batch=batch, position=rng.uniform(0, 1, batch), velocity=rng.normal(0, speed_std, batch))
+        decay = np.exp(-dt / speed_coherence_time)
+        kicks = rng.standard_normal((t1 - t0, batch)) * speed_std * np.sqrt(1 - decay**2)
+        velocity = np.empty((t1 - t0, batch))
+        v = agent["velocity"]
+        for k in range(t1 - t0):
+            v = decay * v + kicks[k]
+            velocity[k] = v
+        position = (agent["position"] + np.cumsum(velocity, axis=0) * dt) % 1
+        agent.update(position=position[-1], velocity=v)
+        distance = np.abs(position[:, :, np.newaxis] - centres)
+        distance = np.minimum(distance, 1 - distance)
+        place_cells = np.exp(-np.square(distance) / (2 * widths**2))
+        velocity_cells = np.stack([np.maximum(velocity, 0), np.maximum(-velocity, 0)], axis=-1) / speed_std
+        theta = (((np.arange(t0, t1) * dt * theta_freq) % 1) < theta_frac).astype(np.float64)
+        theta = np.broadcast_to(theta[:, np.newaxis, np.newaxis], (t1 - t0, batch, 1))
+        return np.concatenate([place_cells, velocity_cells, theta], axis=-1)
+    return adapter
+
+
+#
+# sizes: how the models are scaled to about n neurons, in PORTS and in the setups of benchmark.py
+#
+def classical_population_size(n):
+    """Neurons of each of the bump, left and right populations of the classical LIF ring (plus one
+    inhibitory neuron)."""
+    return max((n - 1) // 3, 2)
+
+
+def sheet_length(n):
+    """Side of the square sheet of the waves layer."""
+    return max(int(round(np.sqrt(n))), 2)
+
+
+def hippocampi_length(n):
+    """Side of the square sheet of the hippocampi CAN, divisible by its n_axes=2."""
+    return max(2 * int(round(np.sqrt(n) / 2)), 2)
+
+
+def seismic_layout(n, rng):
+    """Population slices and random (n, n) weights of the seismic ring: an epg ring with pen and
+    peg populations, two hemispheres each."""
+    n_pen = max(2 * (n // 8), 2)
+    n_epg = max(2 * (n // 4), 2)
+    n_peg = max(n - n_epg - n_pen, 2)
+    n = n_epg + n_pen + n_peg
+    population_slices = {
+        "epg": slice(0, n_epg),
+        "pen": slice(n_epg, n_epg + n_pen),
+        "peg": slice(n_epg + n_pen, n),
+    }
+    return population_slices, rng.normal(0, 0.1, (n, n))
+
+
+def _seismic_port(n, seed=0, **kwargs):
+    """SeismicRing with the epg/pen/peg layout and random weights of the seismic benchmark setup."""
+    population_slices, weights = seismic_layout(n, np.random.default_rng(seed))
+    return SeismicRing(weights, population_slices, **kwargs)
+
+
+PORTS = {
+    "sebastian": lambda n: SebastianRing(n_cells=n),
+    "neurorishika_2_4": lambda n: LIFRing.neurorishika_2_4(N=n),
+    "neurorishika_classical": lambda n: LIFRing.neurorishika_classical(*(classical_population_size(n),) * 3),
+    "waves": lambda n: WavesLayer(shape=(sheet_length(n),) * 2),
+    "neuro_gpr": lambda n: NeuroGPRCANN(num=n, positions=np.linspace(0, 1, 100)),
+    # forward()'s default step size of 0.5 is unstable with tau = 0.01, use the benchmark setup
+    "hippocampi": lambda n: HippocampiCAN(length=hippocampi_length(n), warmup_steps=0, periodic=False, dt=0.002),
+    "seismic": _seismic_port,
+    "seismic_no_split": lambda n: _seismic_port(n, use_velocity=False),
+    "xuelong": lambda n: XuelongRing(),
+    "drugowitsch": lambda n: DrugowitschRing(N=n),
+    "rat_in_a_box": lambda n: RatInABoxRing(n=n, inputs=rat_in_a_box_inputs(n)),
+}
+
+
+def check_backends(names=None, backends=("torch", "numba"), n=64, T=50, batch=2, seed=0, rtol=1e-6, atol=1e-9):
+    """Runs every port (PORTS, or the given names) on the numpy backend and on each of backends from
+    the same initial state and inputs, and raises an AssertionError if a recorded state differs.
+    The noise drawn in step functions comes from a different generator on every backend, so noisy
+    ports are compared without it (noise_scale=0).
+    Returns
+    -------
+    results : dict {(port, backend): max abs difference, or None if the backend is not installed}
+    """
+    from simulator import Simulator, get_backend
+
+    results = {}
+    installed = {}
+    for backend in backends:
+        try:
+            installed[backend] = get_backend(backend)
+        except ImportError:
+            installed[backend] = None
+    for name in names or PORTS:
+        model = PORTS[name](n)
+        if hasattr(model, "noise_scale"):
+            model.noise_scale = 0
+        expected = Simulator(model, "numpy", batch=batch, seed=seed).run(T, record=True)
+        for backend in backends:
+            if installed[backend] is None:
+                results[(name, backend)] = None
+                continue
+            recording = Simulator(model, installed[backend], batch=batch, seed=seed).run(T, record=True)
+            difference = 0.0
+            for variable, values in expected.items():
+                assert np.allclose(recording[variable], values, rtol=rtol, atol=atol), \
+                    f"{name}: {variable} differs between the numpy and {backend} backends"
+                difference = max(difference, float(np.max(np.abs(recording[variable] - values), initial=0.0)))
+            results[(name, backend)] = difference
+    return results
+
+
+if __name__ == "__main__":
+    # the torch and numba backends against the numpy backend, for the installed backends
+    for (name, backend), difference in check_backends().items():
+        status = "not installed, untested" if difference is None else f"ok (max abs difference {difference:.2e})"
+        print(f"{name:<24} {backend:<6} {status}")